@@ -0,0 +1,196 @@
+"""
+Admission control and fair scheduling for agent execution.
+
+At most max_concurrency agent runs execute at once, and each user at most
+max_per_user of them. Further requests wait in a bounded queue; when the queue
+is full, or a request waits longer than queue_timeout, it is rejected right
+away with AdmissionRejected so the caller can answer with a fast 503 (or 429
+when the user's own queue is full) and a Retry-After header instead of timing
+out.
+
+Waiting requests are served weighted-fair across users (start-time fair
+queueing): each admission advances the user's virtual time by 1/weight, and a
+free slot goes to the waiting request with the smallest virtual start time. A
+user firing many requests therefore only gets their share of the slots, and
+users in a tier with weight 2 get twice the share of weight-1 users. Only
+requests that are admitted or queued are charged; a rejected request, or one
+that times out in the queue, leaves the user's virtual time where it was.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+from backend import metrics
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted. retry_after is in seconds."""
+
+    def __init__(self, message, retry_after, status=503):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.status = status
+
+
+class _Ticket:
+    def __init__(self, user, start_tag, cost, seq):
+        self.user = user
+        self.start_tag = start_tag
+        self.cost = cost
+        self.seq = seq
+        self.event = threading.Event()
+        self.granted = False
+
+
+class AdmissionGate:
+    """Bounded concurrency gate with per-user caps and a weighted-fair wait queue."""
+
+    def __init__(self, max_concurrency, max_queue, queue_timeout, retry_after,
+                 max_per_user=0, max_queue_per_user=0, tier_weights=None):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.max_per_user = max_per_user  # 0 means no per-user cap
+        self.max_queue_per_user = max_queue_per_user  # 0 means no per-user queue cap
+        self.tier_weights = tier_weights or {}
+        self._lock = threading.Lock()
+        self._queue = []
+        self._seq = 0
+        self._virtual_time = 0.0
+        self._last_finish = {}  # user -> virtual finish time of their latest admission
+        self._user_active = {}
+        self.active = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _weight(self, tier):
+        return max(float(self.tier_weights.get(tier, 1)), 0.01)
+
+    def _start_tag(self, user):
+        return max(self._virtual_time, self._last_finish.get(user, 0.0))
+
+    def _charge(self, user, tier, start_tag):
+        """Advances the user's virtual finish time past start_tag, returns the charge."""
+        cost = 1.0 / self._weight(tier)
+        self._last_finish[user] = start_tag + cost
+        return cost
+
+    def _under_user_cap(self, user):
+        return not self.max_per_user or self._user_active.get(user, 0) < self.max_per_user
+
+    def _admit(self, user, start_tag):
+        self.active += 1
+        self._user_active[user] = self._user_active.get(user, 0) + 1
+        self._virtual_time = max(self._virtual_time, start_tag)
+
+    def acquire(self, user=None, tier=None):
+        start = time.monotonic()
+        with self._lock:
+            start_tag = self._start_tag(user)
+            if self.active < self.max_concurrency and self._under_user_cap(user):
+                self._charge(user, tier, start_tag)
+                self._admit(user, start_tag)
+                self.admitted += 1
+                metrics.AGENT_QUEUE_WAIT_SECONDS.labels('admitted').observe(0)
+                return
+
+            if len(self._queue) >= self.max_queue:
+                self.rejected += 1
+                metrics.AGENT_QUEUE_WAIT_SECONDS.labels('rejected').observe(0)
+                raise AdmissionRejected("Agent queue is full", self.retry_after)
+            if self.max_queue_per_user:
+                user_queued = sum(1 for ticket in self._queue if ticket.user == user)
+                if user_queued >= self.max_queue_per_user:
+                    self.rejected += 1
+                    metrics.AGENT_QUEUE_WAIT_SECONDS.labels('rejected').observe(0)
+                    raise AdmissionRejected("Too many pending requests for this user", self.retry_after, status=429)
+
+            self._seq += 1
+            ticket = _Ticket(user, start_tag, self._charge(user, tier, start_tag), self._seq)
+            self._queue.append(ticket)
+
+        metrics.AGENT_QUEUE_WAITING.inc()
+        try:
+            ticket.event.wait(self.queue_timeout)
+        finally:
+            metrics.AGENT_QUEUE_WAITING.dec()
+
+        with self._lock:
+            waited = time.monotonic() - start
+            # The slot may have been handed over just after the wait timed out
+            if not ticket.granted:
+                self._queue.remove(ticket)
+                # Refund the charge, the request never ran
+                if user in self._last_finish:
+                    self._last_finish[user] -= ticket.cost
+                self.rejected += 1
+                metrics.AGENT_QUEUE_WAIT_SECONDS.labels('timeout').observe(waited)
+                raise AdmissionRejected("Timed out waiting for an agent slot", self.retry_after)
+            metrics.AGENT_QUEUE_WAIT_SECONDS.labels('admitted').observe(waited)
+            self.admitted += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+
+    def release(self, user=None):
+        with self._lock:
+            self.active -= 1
+            remaining = self._user_active.get(user, 1) - 1
+            if remaining > 0:
+                self._user_active[user] = remaining
+            else:
+                self._user_active.pop(user, None)
+            self._grant_waiting()
+            if not self._queue and len(self._last_finish) > 1000:
+                # Users whose virtual time has been passed no longer need a tag
+                self._last_finish = {
+                    user: finish for user, finish in self._last_finish.items()
+                    if finish > self._virtual_time
+                }
+
+    def _grant_waiting(self):
+        while self.active < self.max_concurrency:
+            eligible = [ticket for ticket in self._queue if self._under_user_cap(ticket.user)]
+            if not eligible:
+                return
+            ticket = min(eligible, key=lambda t: (t.start_tag, t.seq))
+            self._queue.remove(ticket)
+            self._admit(ticket.user, ticket.start_tag)
+            ticket.granted = True
+            ticket.event.set()
+
+    @contextmanager
+    def slot(self, user=None, tier=None):
+        self.acquire(user, tier)
+        try:
+            yield
+        finally:
+            self.release(user)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'active': self.active,
+                'queued': len(self._queue),
+                'active_users': len(self._user_active),
+                'queued_users': len({ticket.user for ticket in self._queue}),
+                'max_concurrency': self.max_concurrency,
+                'max_queue': self.max_queue,
+                'max_per_user': self.max_per_user,
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'avg_wait_ms': round(1000 * self.total_wait / self.admitted, 1) if self.admitted else 0.0,
+                'max_wait_ms': round(1000 * self.max_wait, 1)
+            }
+
+
+def parse_tier_weights(value):
+    """Parses "free=1,pro=3" into {'free': 1.0, 'pro': 3.0}."""
+    weights = {}
+    for part in (value or '').split(','):
+        if '=' in part:
+            tier, weight = part.split('=', 1)
+            weights[tier.strip()] = float(weight)
+    return weights
@@ -3,30 +3,44 @@ from agents import function_tool  # Import the function_tool decorator
 from dotenv import load_dotenv
 import os
 import json
-from tavily import TavilyClient
+import asyncio
+from backend.agent_config import AGENT_INSTRUCTIONS
 
 load_dotenv()
 
-gemini_api_key = os.getenv("GEMINI_API_KEY")
-tavily_api_key = os.getenv("TAVILY_API_KEY")
+# Imported after load_dotenv so they pick up their settings from .env
+from backend.search_cache import search_cache
+from backend.http_clients import get_async_http_client, get_requests_session
+from backend.providers import model_settings, create_search_client, search_provider
+from backend import metrics
 
+# Gemini by default, or the local mock server when LLM_PROVIDER=mock
+base_url, api_key, model_name = model_settings()
+
+# Both clients share this process's pooled keep-alive HTTP connections
 external_client = AsyncOpenAI(
-    api_key=gemini_api_key,
-    base_url = "https://generativelanguage.googleapis.com/v1beta/openai/"
+    api_key=api_key,
+    base_url = base_url,
+    http_client = get_async_http_client()
 )
 set_default_openai_client(external_client)
 set_default_openai_api("chat_completions")
 set_tracing_disabled(True)
 model = OpenAIChatCompletionsModel(
-    model = "gemini-2.0-flash",
+    model = model_name,
     openai_client = external_client
 )
 
-# Initialize Tavily client for web search
-tavily_client = TavilyClient(api_key=tavily_api_key) if tavily_api_key else None
+# Initialize Tavily client (or the fake one when SEARCH_PROVIDER=mock) for web search
+tavily_client = create_search_client(session=get_requests_session())
+
+def fetch_search_results(query):
+    """Calls the search API, timed for /metrics."""
+    with metrics.timed(metrics.SEARCH_SECONDS, provider=search_provider()):
+        return tavily_client.search(query, max_results=5)
 
 @function_tool()
-def search_web(query: str) -> str:
+async def search_web(query: str) -> str:
     """
     Function to search the web using Tavily API
     """
@@ -34,7 +48,13 @@ def search_web(query: str) -> str:
         return "Web search is not available. Tavily API key is not configured."
     
     try:
-        response = tavily_client.search(query, max_results=5)
+        # The Tavily client and the cache are blocking, so keep them off the event loop
+        response = await asyncio.to_thread(
+            search_cache.get_or_fetch,
+            query,
+            5,
+            lambda: fetch_search_results(query)
+        )
         results = []
         for result in response['results']:
             results.append(f"Title: {result['title']}\nURL: {result['url']}\nContent: {result['content'][:500]}...\n")
@@ -43,17 +63,33 @@ def search_web(query: str) -> str:
     except Exception as e:
         return f"Web search failed: {str(e)}"
 
-def my_first_agent(user_input=None):
-    if user_input is None:
-        user_input = "In short, what is open ai sdk?"
-    
+def build_agent():
+    """
+    Builds the chat agent on top of the module-level model and Tavily client.
+    """
     # Create agent with tool calling capability
-    agent = Agent(
+    return Agent(
         name = "Assistant",
-        instructions = "A helpful assistant. You can use the search_web tool to search the web for current information when needed.",
+        instructions = AGENT_INSTRUCTIONS,
         model = model,
         tools=[search_web]  # Add the web search tool
     )
+
+def tools_used(result):
+    """
+    Returns the names of the tools the agent called during a run.
+    """
+    return [
+        item.raw_item.name
+        for item in result.new_items
+        if item.type == 'tool_call_item' and hasattr(item.raw_item, 'name')
+    ]
+
+def my_first_agent(user_input=None):
+    if user_input is None:
+        user_input = "In short, what is open ai sdk?"
+    
+    agent = build_agent()
     result = Runner.run_sync(
         starting_agent=agent,
         input=user_input
@@ -0,0 +1,14 @@
+"""
+Settings that describe the chat agent.
+
+Kept free of heavy imports so the web process can use them (for example in
+cache keys) without loading the agents SDK.
+"""
+
+MODEL_NAME = "gemini-2.0-flash"
+
+GEMINI_BASE_URL = "https://generativelanguage.googleapis.com/v1beta/openai/"
+
+TAVILY_BASE_URL = "https://api.tavily.com"
+
+AGENT_INSTRUCTIONS = "A helpful assistant. You can use the search_web tool to search the web for current information when needed."
@@ -0,0 +1,237 @@
+"""
+Pool of warm agent worker processes.
+
+Each worker (backend/agent_worker.py) imports the agents SDK, builds the agent
+and its HTTP clients once, and then serves chat jobs over its stdin/stdout
+pipes. The pool hands jobs to idle workers, replaces workers that time out or
+die, and recycles each worker after a configurable number of jobs. A worker
+that cannot be started leaves an empty slot in the idle queue, and the next
+job that takes the slot tries again, so a transient failure (e.g. out of
+processes) does not shrink the pool for good.
+
+Configuration (environment variables):
+    AGENT_POOL_SIZE       number of worker processes (default 2)
+    AGENT_POOL_MAX_JOBS   jobs served by a worker before it is recycled (default 200)
+    AGENT_JOB_TIMEOUT     seconds a single job may take (default 60)
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+
+from backend import metrics
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+logger = logging.getLogger(__name__)
+
+
+class AgentPoolError(Exception):
+    """Raised when a job could not be completed by a pool worker."""
+
+
+class AgentPoolTimeout(AgentPoolError):
+    """Raised when a job did not finish within the job timeout."""
+
+
+class AgentWorker:
+    """A single agent worker process and the thread reading its replies."""
+
+    def __init__(self):
+        self.jobs_done = 0
+        self.ready = False
+        self._replies = queue.Queue()
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'backend.agent_worker'],
+            cwd=PROJECT_ROOT,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            bufsize=1
+        )
+        self._reader = threading.Thread(target=self._read_replies, daemon=True)
+        self._reader.start()
+
+    def _read_replies(self):
+        for line in self.process.stdout:
+            try:
+                self._replies.put(json.loads(line))
+            except ValueError:
+                continue
+        # The worker closed its stdout, it has exited
+        self._replies.put(None)
+
+    def _next_reply(self, deadline):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise AgentPoolTimeout("Agent job timed out")
+        try:
+            reply = self._replies.get(timeout=remaining)
+        except queue.Empty:
+            raise AgentPoolTimeout("Agent job timed out")
+        if reply is None:
+            raise AgentPoolError("Agent worker exited unexpectedly")
+        return reply
+
+    def call(self, user_input, timeout):
+        """
+        Sends one job to the worker and waits for it to finish.
+        Returns a dict with the agent's 'output' and the names of the 'tools' it used.
+        """
+        deadline = time.monotonic() + timeout
+
+        # The first job also waits for the worker to finish building the agent
+        if not self.ready:
+            reply = self._next_reply(deadline)
+            if reply['status'] != 'ready':
+                raise AgentPoolError(reply.get('error', 'Agent worker failed to start'))
+            self.ready = True
+
+        try:
+            self.process.stdin.write(json.dumps({'input': user_input}) + "\n")
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            raise AgentPoolError(f"Agent worker is not accepting jobs: {e}")
+
+        reply = self._next_reply(deadline)
+        self.jobs_done += 1
+        if reply['status'] != 'ok':
+            raise AgentPoolError(reply.get('error', 'Agent job failed'))
+        return {'output': reply['output'], 'tools': reply.get('tools', [])}
+
+    def is_alive(self):
+        return self.process.poll() is None
+
+    def stop(self):
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.process.wait(timeout=2)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        # Its live gauges leave the aggregate, its counters and histograms stay
+        metrics.mark_process_dead(self.process.pid)
+
+
+class AgentPool:
+    """Hands chat jobs to a fixed number of warm agent workers."""
+
+    def __init__(self, size, max_jobs, job_timeout):
+        self.size = size
+        self.max_jobs = max_jobs
+        self.job_timeout = job_timeout
+        self._idle = queue.Queue()
+        self._workers = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        for _ in range(self.size):
+            self._idle.put(self._try_spawn())
+
+    def _spawn(self):
+        worker = AgentWorker()
+        with self._lock:
+            self._workers.append(worker)
+        return worker
+
+    def _try_spawn(self):
+        """Returns a new worker, or None, an empty slot, if it could not be started."""
+        try:
+            return self._spawn()
+        except Exception as e:
+            logger.error("Could not start an agent worker, retrying on the next job: %s", e)
+            return None
+
+    def _retire(self, worker):
+        with self._lock:
+            if worker in self._workers:
+                self._workers.remove(worker)
+        worker.stop()
+
+    def run(self, user_input):
+        """
+        Runs the agent on the given input in the next idle worker and returns
+        the result dict from AgentWorker.call.
+        Raises AgentPoolTimeout or AgentPoolError if the job cannot be completed.
+        """
+        try:
+            worker = self._idle.get(timeout=self.job_timeout)
+        except queue.Empty:
+            raise AgentPoolTimeout("No agent worker became available")
+
+        if worker is None:
+            try:
+                worker = self._spawn()
+            except Exception as e:
+                self._idle.put(None)
+                raise AgentPoolError(f"Could not start an agent worker: {e}")
+
+        healthy = True
+        try:
+            return worker.call(user_input, self.job_timeout)
+        except AgentPoolTimeout:
+            # The worker may still be busy with the job, it cannot be reused
+            healthy = False
+            raise
+        except AgentPoolError:
+            healthy = worker.is_alive()
+            raise
+        finally:
+            if not healthy or worker.jobs_done >= self.max_jobs:
+                self._retire(worker)
+                worker = self._try_spawn()
+            self._idle.put(worker)
+
+    def stats(self):
+        with self._lock:
+            alive = sum(1 for worker in self._workers if worker.is_alive())
+        return {
+            'size': self.size,
+            'alive': alive,
+            'idle': self._idle.qsize()
+        }
+
+    def shutdown(self):
+        with self._lock:
+            workers = list(self._workers)
+            self._workers = []
+        for worker in workers:
+            worker.stop()
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_agent_pool():
+    """
+    Returns this process's agent pool, starting it on first use.
+    Each gunicorn worker gets its own pool because the pool is created after fork.
+    """
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = AgentPool(
+                size=int(os.getenv('AGENT_POOL_SIZE', '2')),
+                max_jobs=int(os.getenv('AGENT_POOL_MAX_JOBS', '200')),
+                job_timeout=float(os.getenv('AGENT_JOB_TIMEOUT', '60'))
+            )
+            _pool.start()
+            _pool_pid = os.getpid()
+            atexit.register(_pool.shutdown)
+        return _pool
+
+
+def current_agent_pool():
+    """Returns this process's agent pool if it has been started, without starting it."""
+    with _pool_lock:
+        return _pool if _pool_pid == os.getpid() else None
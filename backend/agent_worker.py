@@ -0,0 +1,71 @@
+"""
+Long-lived agent worker process.
+
+Started by backend/agent_pool.py as `python -m backend.agent_worker`. The agent,
+the Gemini client and the Tavily client are built once at startup, then jobs are
+read from stdin and answered on stdout, one JSON object per line.
+"""
+import asyncio
+import json
+import os
+import sys
+
+
+def main():
+    # Keep the real stdout for the job protocol and send anything else that
+    # gets printed (SDK warnings, debug output) to stderr
+    protocol_out = sys.stdout
+    sys.stdout = sys.stderr
+
+    # Log lines go to stderr with the rest, see backend/log.py
+    from backend.log import setup_logging
+    setup_logging(stream=sys.stderr)
+
+    def reply(payload):
+        protocol_out.write(json.dumps(payload) + "\n")
+        protocol_out.flush()
+
+    try:
+        from agents import Runner
+        from backend.agent import build_agent, tools_used, api_key
+
+        if not api_key:
+            reply({'status': 'init_error', 'error': 'GEMINI_API_KEY not found'})
+            return
+
+        agent = build_agent()
+
+        # Open the API connections on the loop run_sync will use for every job
+        from backend.http_clients import warm_up_connections
+        loop = asyncio.get_event_loop_policy().get_event_loop()
+        loop.run_until_complete(warm_up_connections())
+    except Exception as e:
+        reply({'status': 'init_error', 'error': str(e)})
+        return
+
+    reply({'status': 'ready', 'pid': os.getpid()})
+
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+
+        try:
+            job = json.loads(line)
+            # run_sync reuses this thread's default event loop, so the HTTP
+            # clients built above stay warm between jobs
+            result = Runner.run_sync(
+                starting_agent=agent,
+                input=job['input']
+            )
+            reply({
+                'status': 'ok',
+                'output': result.final_output,
+                'tools': tools_used(result)
+            })
+        except Exception as e:
+            reply({'status': 'error', 'error': str(e)})
+
+
+if __name__ == "__main__":
+    main()
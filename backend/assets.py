@@ -0,0 +1,199 @@
+"""
+Static asset pipeline: build-time fingerprinting and precompression, and the
+runtime lookup used by the static routes.
+
+    python -m backend.assets build
+
+minifies css/*.css and js/*.js, copies them and images/* to dist/ under
+content-hashed names (css/style.css -> css/style.3f2a9c1b7e.css), writes .gz
+and, when the brotli package is installed, .br versions of the text files,
+rewrites the references in index.html, and records the mapping in
+dist/manifest.json. The Docker image runs this step at build time.
+
+When a manifest is present the app serves dist/index.html and the hashed files,
+picking the precompressed variant that matches Accept-Encoding, with immutable
+cache headers. Without a build, the source files are served as before.
+
+Minification uses rcssmin and rjsmin when installed. Without them CSS gets a
+conservative built-in minifier and JS is only compressed.
+
+Configuration (environment variables):
+    ASSETS_DIST_DIR  build output directory (default dist/ in the project root)
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DIST_DIR = os.getenv('ASSETS_DIST_DIR', os.path.join(PROJECT_ROOT, 'dist'))
+MANIFEST_NAME = 'manifest.json'
+
+# Source directories copied into the build, relative to the project root
+ASSET_DIRS = ['css', 'js', 'images', 'assets']
+COMPRESSIBLE = {'.css', '.js', '.html', '.svg', '.json', '.txt', '.ico', '.map'}
+
+# Browsers may keep hashed files for a year, their name changes with their content
+IMMUTABLE_MAX_AGE = 31536000
+
+
+def _minify_css(text):
+    try:
+        import rcssmin
+        return rcssmin.cssmin(text)
+    except ImportError:
+        pass
+    text = re.sub(r'/\*.*?\*/', '', text, flags=re.S)
+    text = re.sub(r'\s+', ' ', text)
+    # Spaces before ':' are kept, they matter in selectors like "div :hover"
+    text = re.sub(r'\s*([{};,>])\s*', r'\1', text)
+    text = re.sub(r':\s+', ':', text)
+    return text.replace(';}', '}').strip()
+
+
+def _minify_js(text):
+    try:
+        import rjsmin
+        return rjsmin.jsmin(text)
+    except ImportError:
+        # Without a real tokenizer any rewrite risks breaking strings and regexes
+        return text
+
+
+def _content_hash(data):
+    return hashlib.sha256(data).hexdigest()[:10]
+
+
+def _write_compressed(path, data):
+    """Writes path.gz and path.br next to path, when they are actually smaller."""
+    gz = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(gz) < len(data):
+        with open(path + '.gz', 'wb') as f:
+            f.write(gz)
+    try:
+        import brotli
+    except ImportError:
+        return
+    br = brotli.compress(data, quality=11)
+    if len(br) < len(data):
+        with open(path + '.br', 'wb') as f:
+            f.write(br)
+
+
+def _rewrite_references(html, manifest):
+    """Points src/href attributes at the hashed files."""
+    def replace(match):
+        attr, quote, url = match.group(1), match.group(2), match.group(3)
+        path = url.lstrip('/')
+        if path in manifest:
+            return f"{attr}={quote}/{manifest[path]}{quote}"
+        return match.group(0)
+
+    return re.sub(r'\b(src|href)=(["\'])([^"\'?#]+)\2', replace, html)
+
+
+def build(dist_dir=DIST_DIR):
+    """Builds the fingerprinted, precompressed assets into dist_dir. Returns the manifest."""
+    if os.path.isdir(dist_dir):
+        shutil.rmtree(dist_dir)
+    os.makedirs(dist_dir)
+
+    manifest = {}
+    original_bytes = 0
+    built_bytes = 0
+    for directory in ASSET_DIRS:
+        source_dir = os.path.join(PROJECT_ROOT, directory)
+        if not os.path.isdir(source_dir):
+            continue
+        for root, _, files in os.walk(source_dir):
+            for name in sorted(files):
+                source = os.path.join(root, name)
+                logical = os.path.relpath(source, PROJECT_ROOT).replace(os.sep, '/')
+                with open(source, 'rb') as f:
+                    data = f.read()
+                original_bytes += len(data)
+
+                base, ext = os.path.splitext(logical)
+                if ext == '.css':
+                    data = _minify_css(data.decode('utf-8')).encode('utf-8')
+                elif ext == '.js':
+                    data = _minify_js(data.decode('utf-8')).encode('utf-8')
+                built_bytes += len(data)
+
+                hashed = f"{base}.{_content_hash(data)}{ext}"
+                target = os.path.join(dist_dir, hashed)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with open(target, 'wb') as f:
+                    f.write(data)
+                if ext in COMPRESSIBLE:
+                    _write_compressed(target, data)
+                manifest[logical] = hashed
+
+    with open(os.path.join(PROJECT_ROOT, 'index.html'), encoding='utf-8') as f:
+        html = _rewrite_references(f.read(), manifest)
+    index_path = os.path.join(dist_dir, 'index.html')
+    with open(index_path, 'w', encoding='utf-8') as f:
+        f.write(html)
+    _write_compressed(index_path, html.encode('utf-8'))
+
+    with open(os.path.join(dist_dir, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    print(f"Built {len(manifest)} assets into {dist_dir} "
+          f"({original_bytes} bytes of sources, {built_bytes} bytes after minification)")
+    return manifest
+
+
+_manifest = None
+_manifest_hashed = set()
+
+
+def load_manifest():
+    """Returns the build manifest (logical path -> hashed path), empty when there is no build."""
+    global _manifest
+    if _manifest is None:
+        try:
+            with open(os.path.join(DIST_DIR, MANIFEST_NAME)) as f:
+                _manifest = json.load(f)
+        except (OSError, ValueError):
+            _manifest = {}
+        _manifest_hashed.update(_manifest.values())
+    return _manifest
+
+
+def hashed_path(logical):
+    """Returns the hashed path of a built asset, e.g. 'css/style.css', or None."""
+    return load_manifest().get(logical)
+
+
+def is_hashed(path):
+    """Whether path (relative to dist/) is one of the fingerprinted files."""
+    load_manifest()
+    return path in _manifest_hashed
+
+
+def pick_encoding(path, accept_encodings):
+    """
+    Returns (file to send, content encoding or None) for a built file, preferring
+    brotli, then gzip, then the plain file, as far as the client accepts them.
+    accept_encodings is werkzeug's request.accept_encodings.
+    """
+    full_path = os.path.join(DIST_DIR, path)
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if accept_encodings[encoding] and os.path.isfile(full_path + suffix):
+            return full_path + suffix, encoding
+    return full_path, None
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] != 'build':
+        print("Usage: python -m backend.assets build")
+        sys.exit(2)
+    build()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+In-process async execution of the chat agent.
+
+A single asyncio event loop runs in a background thread for the whole process.
+Chat requests submit `Runner.run` coroutines to it, so every concurrent LLM and
+search wait is multiplexed on that one loop and reuses the module-level
+`external_client` from backend/agent.py instead of occupying a worker process.
+
+Used when CHAT_EXECUTION_MODE=async. Run the app with threaded workers, e.g.
+`gunicorn --worker-class gthread --threads 64 server:app`, so request threads
+only block on a future while the loop does the I/O.
+"""
+import asyncio
+import concurrent.futures
+import os
+import queue
+import threading
+import time
+
+
+class AgentRunError(Exception):
+    """Raised when the agent run failed."""
+
+
+class AgentRunTimeout(AgentRunError):
+    """Raised when the agent run did not finish within the timeout."""
+
+
+_loop = None
+_loop_pid = None
+_loop_lock = threading.Lock()
+_agent = None
+
+
+def get_event_loop():
+    """
+    Returns the shared event loop, starting its thread on first use.
+    The loop is recreated in a forked child since threads do not survive fork.
+    """
+    global _loop, _loop_pid, _agent
+    with _loop_lock:
+        if _loop is None or _loop_pid != os.getpid():
+            _loop = asyncio.new_event_loop()
+            _loop_pid = os.getpid()
+            _agent = None
+            thread = threading.Thread(
+                target=_loop.run_forever,
+                name='agent-event-loop',
+                daemon=True
+            )
+            thread.start()
+        return _loop
+
+
+def get_agent():
+    """Builds the agent once per process. Must be called from the shared loop."""
+    global _agent
+    if _agent is None:
+        from backend.agent import build_agent
+        _agent = build_agent()
+    return _agent
+
+
+async def _warm_up():
+    from backend.http_clients import warm_up_connections
+
+    get_agent()
+    await warm_up_connections()
+
+
+def warm_up():
+    """
+    Starts the shared loop, builds the agent and opens the API connections in
+    the background, so the first chat request does not pay for them.
+    """
+    asyncio.run_coroutine_threadsafe(_warm_up(), get_event_loop())
+
+
+async def run_agent_async(user_input):
+    """
+    Runs the agent on the shared loop.
+    Returns a dict with the agent's 'output' and the names of the 'tools' it used.
+    """
+    from agents import Runner
+    from backend.agent import tools_used
+
+    result = await Runner.run(
+        starting_agent=get_agent(),
+        input=user_input
+    )
+    return {'output': result.final_output, 'tools': tools_used(result)}
+
+
+def stream_agent(user_input, timeout=None):
+    """
+    Runs the agent with the streamed runner on the shared loop and yields events
+    as plain dicts for the calling request thread:
+        {'type': 'delta', 'text': ...}        a chunk of the answer text
+        {'type': 'tool_start', 'tool': ...}   the model called a tool
+        {'type': 'tool_end', 'tool': ...}     the tool returned its output
+        {'type': 'final', 'output': ..., 'tools': [...]}  the complete answer
+    Raises AgentRunError / AgentRunTimeout like run_agent.
+    """
+    if timeout is None:
+        timeout = float(os.getenv('AGENT_JOB_TIMEOUT', '60'))
+
+    events = queue.Queue()
+
+    async def produce():
+        from agents import Runner
+        from backend.agent import tools_used
+
+        try:
+            result = Runner.run_streamed(
+                starting_agent=get_agent(),
+                input=user_input
+            )
+            tool_names = {}
+            async for event in result.stream_events():
+                if event.type == 'raw_response_event':
+                    if getattr(event.data, 'type', None) == 'response.output_text.delta':
+                        events.put({'type': 'delta', 'text': event.data.delta})
+                elif event.type == 'run_item_stream_event':
+                    if event.name == 'tool_called':
+                        raw_item = event.item.raw_item
+                        name = getattr(raw_item, 'name', None) or 'tool'
+                        tool_names[getattr(raw_item, 'call_id', None)] = name
+                        events.put({'type': 'tool_start', 'tool': name})
+                    elif event.name == 'tool_output':
+                        raw_item = event.item.raw_item
+                        call_id = raw_item.get('call_id') if isinstance(raw_item, dict) else None
+                        events.put({'type': 'tool_end', 'tool': tool_names.get(call_id, 'tool')})
+            events.put({'type': 'final', 'output': result.final_output, 'tools': tools_used(result)})
+        except Exception as e:
+            events.put({'type': 'error', 'error': str(e)})
+        finally:
+            events.put(None)
+
+    future = asyncio.run_coroutine_threadsafe(produce(), get_event_loop())
+    deadline = time.monotonic() + timeout
+    try:
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    raise queue.Empty
+                event = events.get(timeout=remaining)
+            except queue.Empty:
+                raise AgentRunTimeout("Agent run timed out")
+            if event is None:
+                return
+            if event['type'] == 'error':
+                raise AgentRunError(event['error'])
+            yield event
+    finally:
+        # Stop the run if the client went away or the run timed out
+        if not future.done():
+            future.cancel()
+
+
+def run_agent(user_input, timeout=None):
+    """
+    Submits an agent run to the shared loop and waits for the result dict
+    from run_agent_async. Safe to call from any request thread.
+    """
+    if timeout is None:
+        timeout = float(os.getenv('AGENT_JOB_TIMEOUT', '60'))
+
+    future = asyncio.run_coroutine_threadsafe(run_agent_async(user_input), get_event_loop())
+    try:
+        return future.result(timeout=timeout)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        raise AgentRunTimeout("Agent run timed out")
+    except Exception as e:
+        raise AgentRunError(str(e))
@@ -0,0 +1,135 @@
+"""
+Builds the multi-turn agent input for a chat.
+
+Only the most recent messages of a chat are loaded (see backend/chat_store.py),
+and they are added newest first until the token budget is spent. Every older
+message, whether it did not fit or already left the loaded window, is folded
+into a short rolling summary stored on the chat document, so the prompt stays
+bounded however long the conversation grows. The chat's summarized_seq records
+how far the summary reaches: all messages with a lower seq are in it.
+
+Configuration (environment variables):
+    CONTEXT_TOKEN_BUDGET    tokens of prior messages sent with each prompt (default 3000)
+    CONTEXT_MAX_MESSAGES    most recent messages loaded from the chat (default 50)
+    CONTEXT_SUMMARY_TOKENS  size cap of the rolling summary (default 400)
+"""
+import os
+import re
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv('CONTEXT_TOKEN_BUDGET', '3000'))
+CONTEXT_MAX_MESSAGES = int(os.getenv('CONTEXT_MAX_MESSAGES', '50'))
+CONTEXT_SUMMARY_TOKENS = int(os.getenv('CONTEXT_SUMMARY_TOKENS', '400'))
+
+# Longest excerpt of a single message kept in the summary
+SUMMARY_EXCERPT_CHARS = 200
+
+
+def estimate_tokens(text):
+    """Rough token count, about four characters per token for English text."""
+    return len(text or '') // 4 + 1
+
+
+def summarize_message(message):
+    """Compresses a message to its first sentence, capped in length."""
+    text = re.sub(r'\s+', ' ', message.get('text') or '').strip()
+    first_sentence = re.split(r'(?<=[.!?])\s', text, maxsplit=1)[0]
+    if len(first_sentence) > SUMMARY_EXCERPT_CHARS:
+        first_sentence = first_sentence[:SUMMARY_EXCERPT_CHARS].rstrip() + '...'
+    speaker = 'User' if message.get('sender') == 'user' else 'Assistant'
+    return f"{speaker}: {first_sentence}"
+
+
+def trim_summary_lines(lines, max_tokens, keep_one=True):
+    """Drops the oldest summary lines until the rest fits in max_tokens."""
+    lines = list(lines)
+    while len(lines) > (1 if keep_one else 0) and estimate_tokens('\n'.join(lines)) > max_tokens:
+        lines.pop(0)
+    return lines
+
+
+def roll_summary(summary, messages):
+    """Appends the compressed messages to the summary, dropping its oldest lines past the cap."""
+    lines = summary.split('\n') if summary else []
+    lines.extend(summarize_message(message) for message in messages)
+    return '\n'.join(trim_summary_lines(lines, CONTEXT_SUMMARY_TOKENS))
+
+
+def unsummarized_messages(chat_store, chat_id, window, summarized_seq, first_kept_seq):
+    """
+    Messages with summarized_seq <= seq < first_kept_seq, oldest first: the
+    dropped part of the loaded window plus anything older that left the window
+    before it was summarized.
+    """
+    overflow = [m for m in window if summarized_seq <= m['seq'] < first_kept_seq]
+    window_start = window[0]['seq'] if window else first_kept_seq
+    if summarized_seq < window_start:
+        # Every summary line costs at least one token, so older messages
+        # would be trimmed off the summary right away
+        older = chat_store.message_page(chat_id, window_start, CONTEXT_SUMMARY_TOKENS, since_seq=summarized_seq)
+        overflow = older + overflow
+    return overflow
+
+
+def build_chat_context(chat_store, chat_id, user_email):
+    """
+    Returns the prior turns of the chat as agent input items (oldest first),
+    or an empty list for a new chat. Updates the chat's rolling summary when
+    older messages fall out of the token budget.
+    """
+    if not chat_id or not user_email:
+        return []
+
+    chat = chat_store.get_chat(chat_id, user_email, {'summary': 1, 'summarized_seq': 1})
+    if not chat:
+        return []
+
+    messages = chat_store.recent_messages(chat['_id'], CONTEXT_MAX_MESSAGES)
+    # Every message with a seq below summarized_seq is in the summary. A
+    # summary from before seq tracking is rebuilt rather than trusted.
+    summarized_seq = chat.get('summarized_seq')
+    summary = chat.get('summary', '') if summarized_seq is not None else ''
+
+    # Keep the newest messages that fit in the budget. The summary may claim
+    # at most half of it, so a long summary never pushes out the latest turn.
+    summary_reserve = min(estimate_tokens(summary), CONTEXT_TOKEN_BUDGET // 2)
+    budget = CONTEXT_TOKEN_BUDGET - summary_reserve
+    kept = []
+    for message in reversed(messages):
+        cost = estimate_tokens(message.get('text'))
+        if cost > budget:
+            break
+        kept.append(message)
+        budget -= cost
+    kept.reverse()
+
+    # Fold everything older than the first kept message into the summary, once
+    first_kept_seq = kept[0]['seq'] if kept else chat['message_count']
+    overflow = unsummarized_messages(chat_store, chat['_id'], messages, summarized_seq or 0, first_kept_seq)
+    if overflow or summarized_seq is None:
+        summary = roll_summary(summary, overflow)
+        # Conditional on the previous position, a concurrent request that
+        # already folded these messages wins
+        chat_store.chats.update_one(
+            {'_id': chat['_id'], 'summarized_seq': summarized_seq},
+            {
+                '$set': {'summary': summary, 'summarized_seq': first_kept_seq},
+                '$unset': {'summarized_until': ''}
+            }
+        )
+
+    context = []
+    # The summary gets what the kept messages left of the budget
+    summary_lines = trim_summary_lines(
+        summary.split('\n') if summary else [], budget + summary_reserve, keep_one=False
+    )
+    if summary_lines:
+        context.append({
+            'role': 'system',
+            'content': "Summary of the earlier conversation:\n" + '\n'.join(summary_lines)
+        })
+    for message in kept:
+        context.append({
+            'role': 'user' if message.get('sender') == 'user' else 'assistant',
+            'content': message.get('text') or ''
+        })
+    return context
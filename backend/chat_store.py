@@ -0,0 +1,237 @@
+"""
+Storage of chat messages in their own collection.
+
+Each message is one document in Chat_Messages keyed by (chat_id, seq) with a unique index, instead
+of an element of an ever-growing `messages` array on the chat document, which
+had every turn rewrite a larger document and long chats head for the 16 MB
+limit. The chat document in Chat_History keeps only metadata: title,
+timestamps, the rolling context summary, and message_count, whose atomic
+increment also hands out the seq numbers of new messages.
+
+Chats written before this change still carry the array. They are moved over
+lazily the first time they are read or written, and in bulk by
+
+    python -m backend.chat_store migrate [--batch-size 200] [--pause 0.2]
+
+which works through the chats in batches and can run while the app serves.
+"""
+import argparse
+import logging
+import sys
+import time
+from datetime import datetime
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ASCENDING, DESCENDING, ReturnDocument, UpdateOne
+
+logger = logging.getLogger(__name__)
+
+
+def to_object_id(chat_id):
+    """Returns chat_id as an ObjectId, or None if it is not a valid id."""
+    try:
+        return ObjectId(chat_id)
+    except (InvalidId, TypeError):
+        return None
+
+
+class ChatStore:
+    """Chat documents plus their messages, stored one document per message."""
+
+    def __init__(self, chats, messages):
+        self.chats = chats
+        self.messages = messages
+
+    def _message_documents(self, chat_id, first_seq, messages):
+        return [
+            dict(message, chat_id=chat_id, seq=first_seq + i)
+            for i, message in enumerate(messages)
+        ]
+
+    def create_chat(self, user_email, title, messages):
+        """Creates a chat with its first messages and returns its id as a string."""
+        now = datetime.now()
+        result = self.chats.insert_one({
+            'user_email': user_email,
+            'title': title,
+            'created_at': now,
+            'updated_at': now,
+            'message_count': len(messages)
+        })
+        if messages:
+            self.messages.insert_many(self._message_documents(result.inserted_id, 0, messages))
+        return str(result.inserted_id)
+
+    def append_messages(self, chat_id, user_email, messages):
+        """
+        Appends messages to a chat owned by the user.
+        Returns False if there is no such chat.
+        """
+        chat_object_id = to_object_id(chat_id)
+        if chat_object_id is None:
+            return False
+
+        chat = self.chats.find_one_and_update(
+            {'_id': chat_object_id, 'user_email': user_email, 'message_count': {'$exists': True}},
+            {
+                '$inc': {'message_count': len(messages)},
+                '$set': {'updated_at': datetime.now()}
+            },
+            projection={'message_count': 1},
+            return_document=ReturnDocument.AFTER
+        )
+        if chat is None:
+            # Not found, or still in the old format
+            if self.get_chat(chat_object_id, user_email, {'_id': 1}) is None:
+                return False
+            return self.append_messages(chat_id, user_email, messages)
+
+        first_seq = chat['message_count'] - len(messages)
+        self.messages.insert_many(self._message_documents(chat_object_id, first_seq, messages))
+        return True
+
+    def get_chat(self, chat_id, user_email, projection=None):
+        """
+        Returns the chat document if the user owns it, moving its messages over
+        first if it is still in the old format. Returns None if not found.
+        """
+        chat_object_id = to_object_id(chat_id)
+        if chat_object_id is None:
+            return None
+        query = {'_id': chat_object_id, 'user_email': user_email}
+        # Inclusion projections only, message_count tells the two formats apart
+        fields = dict(projection, message_count=1) if projection else None
+
+        chat = self.chats.find_one(query, fields)
+        if chat is None or 'message_count' in chat:
+            return chat
+
+        self.migrate_chat(self.chats.find_one(query))
+        return self.chats.find_one(query, fields)
+
+    def recent_messages(self, chat_id, limit):
+        """Returns the newest messages of a chat, oldest first."""
+        return self.message_page(chat_id, None, limit)
+
+    def message_page(self, chat_id, before_seq, limit, since_seq=None):
+        """
+        Returns up to limit messages with seq below before_seq (or the newest),
+        and at least since_seq if given, oldest first.
+        """
+        query = {'chat_id': chat_id}
+        seq_range = {}
+        if before_seq is not None:
+            seq_range['$lt'] = before_seq
+        if since_seq is not None:
+            seq_range['$gte'] = since_seq
+        if seq_range:
+            query['seq'] = seq_range
+        page = list(self.messages.find(query, {'_id': 0, 'chat_id': 0}).sort('seq', DESCENDING).limit(limit))
+        page.reverse()
+        return page
+
+    def messages_of_chats(self, chat_ids):
+        """Returns {chat_id: [messages oldest first]} for the given chats, in one query."""
+        grouped = {chat_id: [] for chat_id in chat_ids}
+        cursor = self.messages.find(
+            {'chat_id': {'$in': list(chat_ids)}},
+            {'_id': 0}
+        ).sort([('chat_id', ASCENDING), ('seq', ASCENDING)])
+        for message in cursor:
+            grouped[message.pop('chat_id')].append(message)
+        return grouped
+
+    def delete_chat(self, chat_id, user_email):
+        """Deletes a chat owned by the user and its messages. Returns False if not found."""
+        chat_object_id = to_object_id(chat_id)
+        if chat_object_id is None:
+            return False
+        result = self.chats.delete_one({'_id': chat_object_id, 'user_email': user_email})
+        if result.deleted_count == 0:
+            return False
+        self.messages.delete_many({'chat_id': chat_object_id})
+        return True
+
+    def migrate_chat(self, chat):
+        """
+        Moves the embedded messages of an old-format chat into the messages
+        collection. Idempotent, and safe against a concurrent $push from an
+        older app version: the chat is only switched over if its array is
+        still the one that was copied, otherwise it is copied again.
+        """
+        while chat is not None and 'message_count' not in chat:
+            messages = chat.get('messages') or []
+            operations = [
+                UpdateOne(
+                    {'chat_id': chat['_id'], 'seq': i},
+                    {'$setOnInsert': dict(message, chat_id=chat['_id'], seq=i)},
+                    upsert=True
+                )
+                for i, message in enumerate(messages)
+            ]
+            if operations:
+                self.messages.bulk_write(operations, ordered=False)
+
+            unchanged = (
+                {'messages': {'$size': len(messages)}} if 'messages' in chat
+                else {'messages': {'$exists': False}}
+            )
+            result = self.chats.update_one(
+                dict({'_id': chat['_id'], 'message_count': {'$exists': False}}, **unchanged),
+                {
+                    '$set': {'message_count': len(messages)},
+                    '$unset': {'messages': ''}
+                }
+            )
+            if result.modified_count:
+                return True
+            chat = self.chats.find_one({'_id': chat['_id']})
+        return False
+
+    def migrate_all(self, batch_size=200, pause=0.0):
+        """Migrates every old-format chat, batch_size chats at a time. Returns how many were moved."""
+        migrated = 0
+        last_id = None
+        while True:
+            query = {'message_count': {'$exists': False}}
+            if last_id is not None:
+                query['_id'] = {'$gt': last_id}
+            batch = list(self.chats.find(query).sort('_id', ASCENDING).limit(batch_size))
+            if not batch:
+                break
+            for chat in batch:
+                if self.migrate_chat(chat):
+                    migrated += 1
+            last_id = batch[-1]['_id']
+            logger.info("Migrated %d chats so far (last id %s)", migrated, last_id)
+            if pause:
+                time.sleep(pause)
+        return migrated
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Chat message storage maintenance')
+    parser.add_argument('command', choices=['migrate'])
+    parser.add_argument('--batch-size', type=int, default=200, help='chats per batch')
+    parser.add_argument('--pause', type=float, default=0.2, help='seconds to wait between batches')
+    args = parser.parse_args()
+
+    from backend import mongo
+    from backend.indexes import ensure_indexes
+    from backend.log import setup_logging
+
+    # stdout carries the report
+    setup_logging(stream=sys.stderr)
+
+    # The upserts rely on the unique (chat_id, seq) index
+    ensure_indexes({'chat_messages': mongo.chat_messages})
+    chat_store = ChatStore(mongo.chats, mongo.chat_messages)
+
+    started = time.time()
+    migrated = chat_store.migrate_all(batch_size=args.batch_size, pause=args.pause)
+    print(f"Migration finished: {migrated} chats moved in {time.time() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Response compression for dynamic Flask responses.
+
+An after_request hook compresses response bodies with brotli (when the brotli
+package is installed and the client accepts it) or gzip. Only text-like
+content types from an allowlist are compressed, and only above a size
+threshold. Streamed responses (SSE) and files sent with send_file are left
+alone, as are responses that already carry a Content-Encoding, such as the
+precompressed assets from backend/assets.py.
+
+Routes can choose their own compression effort:
+
+    @app.route('/chat-history')
+    @compressor.level(gzip_level=6, brotli_quality=5)
+    def get_chat_history(): ...
+
+and level(0) turns compression off for a route.
+
+Configuration (environment variables):
+    COMPRESSION_ENABLED         compress dynamic responses (default true)
+    COMPRESSION_MIN_SIZE        smallest body in bytes that is compressed (default 1024)
+    COMPRESSION_GZIP_LEVEL      default gzip level, 1-9 (default 6)
+    COMPRESSION_BROTLI_QUALITY  default brotli quality, 0-11 (default 4)
+"""
+import gzip
+import os
+
+from flask import request
+
+DEFAULT_MIMETYPES = {
+    'application/json',
+    'application/javascript',
+    'text/html',
+    'text/css',
+    'text/plain',
+    'text/javascript',
+    'text/xml',
+    'application/xml',
+    'image/svg+xml'
+}
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class Compressor:
+    """Compresses eligible responses of a Flask app, see the module docstring."""
+
+    def __init__(self, app=None, enabled=True, min_size=1024, gzip_level=6,
+                 brotli_quality=4, mimetypes=None):
+        self.enabled = enabled
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.mimetypes = set(mimetypes or DEFAULT_MIMETYPES)
+        self._app = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self._app = app
+        app.after_request(self.after_request)
+
+    def level(self, gzip_level=None, brotli_quality=None):
+        """
+        Decorator setting the compression effort of a view. Values left out use
+        the defaults; level(0) disables compression for the view.
+        """
+        def decorator(view):
+            view.compression = (
+                gzip_level,
+                brotli_quality if brotli_quality is not None else (0 if gzip_level == 0 else None)
+            )
+            return view
+        return decorator
+
+    def _levels(self):
+        view = self._app.view_functions.get(request.endpoint) if request.endpoint else None
+        gzip_level, brotli_quality = getattr(view, 'compression', (None, None))
+        return (
+            self.gzip_level if gzip_level is None else gzip_level,
+            self.brotli_quality if brotli_quality is None else brotli_quality
+        )
+
+    def _should_compress(self, response):
+        if not self.enabled or request.method == 'HEAD':
+            return False
+        if response.status_code < 200 or response.status_code in (204, 206, 304):
+            return False
+        if response.direct_passthrough or response.is_streamed:
+            return False
+        if 'Content-Encoding' in response.headers:
+            return False
+        if response.mimetype not in self.mimetypes:
+            return False
+        if response.cache_control.no_transform:
+            return False
+        return True
+
+    def after_request(self, response):
+        if not self._should_compress(response):
+            return response
+
+        data = response.get_data()
+        if len(data) < self.min_size:
+            return response
+        gzip_level, brotli_quality = self._levels()
+
+        if brotli is not None and brotli_quality and request.accept_encodings['br']:
+            body, encoding = brotli.compress(data, quality=brotli_quality), 'br'
+        elif gzip_level and request.accept_encodings['gzip']:
+            body, encoding = gzip.compress(data, compresslevel=gzip_level), 'gzip'
+        else:
+            response.vary.add('Accept-Encoding')
+            return response
+
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        # The compressed body is a different representation, a strong ETag must differ
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(f"{etag}-{encoding}")
+        return response
+
+
+def create_compressor(app):
+    """Returns a Compressor for app configured from the environment."""
+    return Compressor(
+        app,
+        enabled=os.getenv('COMPRESSION_ENABLED', 'true').lower() == 'true',
+        min_size=int(os.getenv('COMPRESSION_MIN_SIZE', '1024')),
+        gzip_level=int(os.getenv('COMPRESSION_GZIP_LEVEL', '6')),
+        brotli_quality=int(os.getenv('COMPRESSION_BROTLI_QUALITY', '4'))
+    )
@@ -0,0 +1,241 @@
+"""
+Durable outbox for outgoing email.
+
+Endpoints used to open an SMTP connection, run STARTTLS, log in and send while
+the HTTP request waited. Now they only insert a job into a MongoDB collection
+and return. Background worker threads claim jobs one at a time, call the
+sender registered for the job's kind, and retry failures with exponential
+backoff. Jobs survive restarts, and a job whose worker died mid-send is picked
+up again once its lease runs out. A worker keeps claiming due jobs for up to
+EMAIL_BATCH_SIZE in a row inside one batch context, so a burst of emails goes
+out over a single SMTP session (see backend/smtp_pool.py). The SMTP pool
+connects when the batch is entered, so if the server is unreachable or
+rejects the login, the job already claimed is released with that error as a
+failed attempt, without being handed to its sender.
+
+Sent and failed jobs are kept for EMAIL_JOB_RETENTION and then removed by a
+TTL index on finished_at (backend/indexes.py). A sent job's payload is
+removed right away, and a failed job loses its token, so no live
+verification or reset link stays readable in the collection.
+
+Job documents:
+    kind             name of the registered sender, e.g. 'verification'
+    payload          keyword arguments for the sender
+    status           pending, sending, sent or failed
+    attempts         delivery attempts so far
+    next_attempt_at  earliest time the job may be (re)tried
+    locked_until     lease of the worker currently sending it
+    last_error       error of the last failed attempt
+    finished_at      when the job was sent or given up on
+
+Configuration (environment variables):
+    EMAIL_OUTBOX_WORKERS       worker threads per process (default 2)
+    EMAIL_MAX_ATTEMPTS         attempts before a job is marked failed (default 6)
+    EMAIL_RETRY_BASE_DELAY     seconds before the first retry, doubled each time (default 10)
+    EMAIL_RETRY_MAX_DELAY      upper bound of the retry delay in seconds (default 900)
+    EMAIL_SEND_LEASE           seconds a claimed job stays locked to its worker (default 120)
+    EMAIL_BATCH_SIZE           jobs a worker sends in a row within one batch (default 20)
+    EMAIL_JOB_RETENTION        seconds sent and failed jobs are kept (default 604800, 7 days)
+"""
+import logging
+import os
+import random
+import threading
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ASCENDING, ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+# Read by the TTL index declaration in backend/indexes.py
+JOB_RETENTION_SECONDS = int(os.getenv('EMAIL_JOB_RETENTION', str(7 * 24 * 3600)))
+
+
+class EmailOutbox:
+    """MongoDB-backed email queue drained by background worker threads."""
+
+    def __init__(self, collection, workers=2, max_attempts=6, base_delay=10.0,
+                 max_delay=900.0, lease=120.0, poll_interval=5.0, batch_size=20,
+                 batch_context=None):
+        self.collection = collection
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        # Called with no arguments for every batch, returns the context manager it runs in
+        self.batch_context = batch_context or nullcontext
+        self._senders = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._threads = []
+        self._pid = None
+
+    def register(self, kind, sender):
+        """
+        Registers the function that delivers jobs of this kind. It is called with
+        the job's payload as keyword arguments and must return True on success;
+        returning False or raising counts as a failed attempt.
+        """
+        self._senders[kind] = sender
+
+    def enqueue(self, kind, payload):
+        """Stores a new email job and returns its id as a string."""
+        if kind not in self._senders:
+            raise ValueError(f"No email sender registered for '{kind}'")
+        now = datetime.now()
+        result = self.collection.insert_one({
+            'kind': kind,
+            'payload': payload,
+            'status': 'pending',
+            'attempts': 0,
+            'next_attempt_at': now,
+            'locked_until': None,
+            'last_error': None,
+            'createdAt': now,
+            'updatedAt': now
+        })
+        self.start()
+        self._wakeup.set()
+        return str(result.inserted_id)
+
+    def status(self, job_id):
+        """
+        Returns the delivery status of a job, or None if it does not exist.
+        Anyone holding the job id may ask, so errors and payload stay out.
+        """
+        try:
+            job = self.collection.find_one({'_id': ObjectId(job_id)}, {'status': 1})
+        except InvalidId:
+            return None
+        if not job:
+            return None
+        return {'id': str(job['_id']), 'status': job['status']}
+
+    def start(self):
+        """
+        Starts the worker threads of this process, once. Safe to call from
+        every request; after a fork the child starts its own threads.
+        """
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._threads = []
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"email-outbox-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _claim(self):
+        """Atomically takes the next due job, or a job whose sender's lease expired."""
+        now = datetime.now()
+        return self.collection.find_one_and_update(
+            {'$or': [
+                {'status': 'pending', 'next_attempt_at': {'$lte': now}},
+                {'status': 'sending', 'locked_until': {'$lte': now}}
+            ]},
+            {
+                '$set': {
+                    'status': 'sending',
+                    'locked_until': now + timedelta(seconds=self.lease),
+                    'updatedAt': now
+                },
+                '$inc': {'attempts': 1}
+            },
+            sort=[('next_attempt_at', ASCENDING)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    def retry_delay(self, attempts):
+        """Exponential backoff with jitter, in seconds, after the given number of attempts."""
+        delay = min(self.max_delay, self.base_delay * (2 ** (attempts - 1)))
+        return delay * random.uniform(0.8, 1.2)
+
+    def _deliver(self, job):
+        sender = self._senders.get(job['kind'])
+        error = None
+        try:
+            if sender is None:
+                error = f"No email sender registered for '{job['kind']}'"
+            elif not sender(**job['payload']):
+                error = 'Sender reported failure'
+        except Exception as e:
+            error = str(e)
+        self._record_attempt(job, error)
+
+    def _record_attempt(self, job, error):
+        """Marks a claimed job sent (error None), or schedules its retry or gives up on it."""
+        now = datetime.now()
+        unset = None
+        if error is None:
+            update = {'status': 'sent', 'sentAt': now, 'finished_at': now, 'locked_until': None, 'last_error': None}
+            unset = {'payload': ''}
+        elif job['attempts'] >= self.max_attempts:
+            update = {'status': 'failed', 'finished_at': now, 'locked_until': None, 'last_error': error}
+            unset = {'payload.token': ''}
+            logger.error("Email job %s (%s) failed after %d attempts: %s", job['_id'], job['kind'], job['attempts'], error)
+        else:
+            retry_at = now + timedelta(seconds=self.retry_delay(job['attempts']))
+            update = {'status': 'pending', 'next_attempt_at': retry_at, 'locked_until': None, 'last_error': error}
+            logger.warning("Email job %s (%s) attempt %d failed, retrying at %s",
+                           job['_id'], job['kind'], job['attempts'], retry_at)
+        update['updatedAt'] = now
+        changes = {'$set': update}
+        if unset:
+            changes['$unset'] = unset
+        # Skip the update if the lease ran out and another worker took the job over
+        self.collection.update_one(
+            {'_id': job['_id'], 'status': 'sending', 'attempts': job['attempts']},
+            changes
+        )
+
+    def _run(self):
+        while True:
+            try:
+                job = self._claim()
+            except Exception as e:
+                logger.warning("Email outbox could not claim a job: %s", e)
+                job = None
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            try:
+                with self.batch_context():
+                    sent = 0
+                    while job is not None:
+                        current, job = job, None
+                        self._deliver(current)
+                        sent += 1
+                        if sent < self.batch_size:
+                            job = self._claim()
+            except Exception as e:
+                logger.exception("Email outbox batch failed")
+                if job is not None:
+                    # Claimed but never handed to its sender: entering the
+                    # batch, i.e. connecting to the SMTP server, failed
+                    try:
+                        self._record_attempt(job, f"Batch failed: {e}")
+                    except Exception as release_error:
+                        logger.warning("Email job %s stays leased until its lease runs out: %s",
+                                       job['_id'], release_error)
+
+
+def create_email_outbox(collection, batch_context=None):
+    """Returns an EmailOutbox configured from the environment."""
+    return EmailOutbox(
+        collection,
+        batch_context=batch_context,
+        batch_size=int(os.getenv('EMAIL_BATCH_SIZE', '20')),
+        workers=int(os.getenv('EMAIL_OUTBOX_WORKERS', '2')),
+        max_attempts=int(os.getenv('EMAIL_MAX_ATTEMPTS', '6')),
+        base_delay=float(os.getenv('EMAIL_RETRY_BASE_DELAY', '10')),
+        max_delay=float(os.getenv('EMAIL_RETRY_MAX_DELAY', '900')),
+        lease=float(os.getenv('EMAIL_SEND_LEASE', '120'))
+    )
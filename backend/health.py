@@ -0,0 +1,95 @@
+"""
+Readiness checks behind /readyz.
+
+Each check is a function returning (ok, detail). ReadinessChecks runs all of
+them and keeps the result for READY_CACHE_TTL seconds, so load balancer
+probes arriving several times a second cost one round of checks per
+interval. Only one request runs the checks at a time, the others wait for
+its result.
+
+Configuration (environment variables):
+    READY_CACHE_TTL             seconds a readiness result is reused (default 2)
+    READY_MONGO_TIMEOUT         seconds the MongoDB ping may take (default 2)
+    READY_MAX_QUEUE_FRACTION    agent queue depth, as a fraction of AGENT_MAX_QUEUE,
+                                from which the replica reports itself saturated (default 0.8)
+"""
+import os
+import threading
+import time
+
+import pymongo
+
+CACHE_TTL = float(os.getenv('READY_CACHE_TTL', '2'))
+MONGO_TIMEOUT = float(os.getenv('READY_MONGO_TIMEOUT', '2'))
+MAX_QUEUE_FRACTION = float(os.getenv('READY_MAX_QUEUE_FRACTION', '0.8'))
+
+
+def mongo_ping(database, timeout=MONGO_TIMEOUT):
+    """Pings MongoDB, failing after timeout seconds instead of the client's server selection timeout."""
+    started = time.perf_counter()
+    try:
+        with pymongo.timeout(timeout):
+            database.command('ping')
+    except Exception as e:
+        return False, f"ping failed: {e}"
+    return True, f"ping {1000 * (time.perf_counter() - started):.0f} ms"
+
+
+def agent_pool_check(pool):
+    """The agent worker pool has live workers. A pool that has not started yet starts on first use."""
+    if pool is None:
+        return True, 'not started'
+    stats = pool.stats()
+    if stats['alive'] == 0:
+        return False, f"no live agent workers (of {stats['size']})"
+    return True, f"{stats['alive']}/{stats['size']} workers alive, {stats['idle']} idle"
+
+
+def queue_check(gate, max_fraction=MAX_QUEUE_FRACTION):
+    """The admission queue is below max_fraction of its capacity."""
+    stats = gate.stats()
+    limit = max(1, int(stats['max_queue'] * max_fraction))
+    detail = f"{stats['queued']} queued, {stats['active']}/{stats['max_concurrency']} running"
+    if stats['queued'] >= limit:
+        return False, f"saturated: {detail} (limit {limit})"
+    return True, detail
+
+
+class ReadinessChecks:
+    """Named readiness checks with a shared, briefly cached result."""
+
+    def __init__(self, ttl=CACHE_TTL):
+        self.ttl = ttl
+        self._checks = []
+        self._lock = threading.Lock()
+        self._result = None
+        self._checked_at = 0.0
+
+    def add(self, name, check):
+        """Adds check(), a function returning (ok, detail)."""
+        self._checks.append((name, check))
+
+    def _run_checks(self):
+        checks = {}
+        for name, check in self._checks:
+            started = time.perf_counter()
+            try:
+                ok, detail = check()
+            except Exception as e:
+                ok, detail = False, f"check failed: {e}"
+            checks[name] = {
+                'ok': ok,
+                'detail': detail,
+                'ms': round(1000 * (time.perf_counter() - started), 1)
+            }
+        return {'ready': all(check['ok'] for check in checks.values()), 'checks': checks}
+
+    def result(self):
+        """Returns {'ready', 'checks', 'age'}, running the checks if the cached result is stale."""
+        with self._lock:
+            now = time.monotonic()
+            if self._result is None or now - self._checked_at >= self.ttl:
+                self._result = self._run_checks()
+                self._checked_at = time.monotonic()
+                now = self._checked_at
+            return dict(self._result, age=round(now - self._checked_at, 2))
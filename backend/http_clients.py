@@ -0,0 +1,124 @@
+"""
+Process-wide pooled HTTP clients for the model and web search APIs.
+
+Every agent run used to build new clients, paying DNS, TCP and TLS setup on
+each message. The clients here are created once per process, keep their
+connections alive between runs, and can be warmed up when a worker starts so
+the first user request already finds an open connection.
+
+Configuration (environment variables):
+    HTTP_MAX_CONNECTIONS    connection pool size per client (default 100)
+    HTTP_MAX_KEEPALIVE      idle connections kept open (default 20)
+    HTTP_KEEPALIVE_EXPIRY   seconds an idle connection is kept (default 60)
+    HTTP_TIMEOUT            request timeout in seconds (default 60)
+    HTTP2_ENABLED           use HTTP/2 for the model API, needs the h2 package (default false)
+"""
+import logging
+import os
+import threading
+import time
+
+from backend import metrics
+from backend.agent_config import TAVILY_BASE_URL
+from backend.providers import model_settings, search_provider
+
+logger = logging.getLogger(__name__)
+
+HTTP_MAX_CONNECTIONS = int(os.getenv('HTTP_MAX_CONNECTIONS', '100'))
+HTTP_MAX_KEEPALIVE = int(os.getenv('HTTP_MAX_KEEPALIVE', '20'))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv('HTTP_KEEPALIVE_EXPIRY', '60'))
+HTTP_TIMEOUT = float(os.getenv('HTTP_TIMEOUT', '60'))
+HTTP2_ENABLED = os.getenv('HTTP2_ENABLED', 'false').lower() == 'true'
+
+_lock = threading.Lock()
+_async_client = None
+_session = None
+
+
+def _http2_available():
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        logger.warning("HTTP2_ENABLED is set but the h2 package is not installed, using HTTP/1.1")
+        return False
+
+
+async def _start_llm_timer(request):
+    # Model API calls are POSTs, the warm-up GET is not counted
+    if request.method == 'POST':
+        request.extensions['chatup_started'] = time.perf_counter()
+
+
+async def _observe_llm_request(response):
+    started = response.request.extensions.get('chatup_started')
+    if started is not None:
+        metrics.LLM_REQUEST_SECONDS.labels(str(response.status_code)).observe(time.perf_counter() - started)
+
+
+def get_async_http_client():
+    """
+    Returns the shared httpx.AsyncClient used by the OpenAI-compatible model client.
+    Its connections belong to the event loop that first uses them, which is the
+    single loop each agent process runs on.
+    """
+    global _async_client
+    with _lock:
+        if _async_client is None:
+            import httpx
+
+            _async_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                    keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+                ),
+                timeout=HTTP_TIMEOUT,
+                http2=HTTP2_ENABLED and _http2_available(),
+                follow_redirects=True,
+                event_hooks={'request': [_start_llm_timer], 'response': [_observe_llm_request]}
+            )
+        return _async_client
+
+
+def get_requests_session():
+    """Returns the shared requests.Session used by the Tavily client."""
+    global _session
+    with _lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            _session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=4,
+                pool_maxsize=HTTP_MAX_KEEPALIVE
+            )
+            _session.mount('https://', adapter)
+            _session.mount('http://', adapter)
+        return _session
+
+
+async def warm_up_connections():
+    """
+    Opens connections to the model and search APIs ahead of the first request.
+    Must run on the event loop the agent uses. Failures are only reported, the
+    connections will simply be opened by the first real request instead.
+    """
+    import asyncio
+
+    async def warm_model():
+        try:
+            await get_async_http_client().get(model_settings()[0], timeout=5)
+        except Exception as e:
+            logger.warning("Model API warm-up failed: %s", e)
+
+    def warm_search():
+        if search_provider() == 'mock':
+            return
+        try:
+            get_requests_session().head(TAVILY_BASE_URL, timeout=5)
+        except Exception as e:
+            logger.warning("Search API warm-up failed: %s", e)
+
+    await asyncio.gather(warm_model(), asyncio.to_thread(warm_search))
@@ -0,0 +1,176 @@
+"""
+MongoDB index declarations, creation and verification.
+
+Every hot query of the app is listed in HOT_QUERIES next to the index that
+serves it in INDEXES. ensure_indexes() creates the indexes; it is idempotent
+(create_index is a no-op for an existing identical index) and runs in each
+process once its MongoDB client is created, see backend/mongo.py.
+verify_indexes() runs explain() on each hot query and reports any that would
+fall back to a collection scan or could not be explained.
+
+    python -m backend.indexes create
+    python -m backend.indexes verify     # exits with status 1 on a COLLSCAN or a failed explain
+
+Collections are referred to by role: users, chats, chat_messages, email_outbox.
+"""
+import logging
+import sys
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import ConnectionFailure, PyMongoError
+
+from backend.email_outbox import JOB_RETENTION_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# role -> list of (keys, options)
+INDEXES = {
+    'users': [
+        ([('email', ASCENDING)], {'name': 'email_unique', 'unique': True, 'sparse': True}),
+        ([('verification_token', ASCENDING)], {'name': 'verification_token', 'sparse': True}),
+        ([('reset_password_token', ASCENDING)], {'name': 'reset_password_token', 'sparse': True}),
+    ],
+    'chats': [
+        # Chat list: user's chats newest first, keyset paginated on (created_at, _id)
+        ([('user_email', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)],
+         {'name': 'user_chats_newest_first'}),
+    ],
+    'chat_messages': [
+        ([('chat_id', ASCENDING), ('seq', ASCENDING)], {'name': 'chat_seq_unique', 'unique': True}),
+    ],
+    'email_outbox': [
+        ([('status', ASCENDING), ('next_attempt_at', ASCENDING)], {'name': 'status_next_attempt'}),
+        # Removes sent and failed jobs after EMAIL_JOB_RETENTION
+        ([('finished_at', ASCENDING)], {'name': 'finished_ttl', 'expireAfterSeconds': JOB_RETENTION_SECONDS}),
+    ],
+}
+
+# (role, description, function building the cursor of a representative query)
+HOT_QUERIES = [
+    ('users', 'user by email (login, register, profile)',
+     lambda c: c.find({'email': 'someone@example.com'})),
+    ('users', 'user by verification token',
+     lambda c: c.find({'verification_token': 'token'})),
+    ('users', 'user by password reset token',
+     lambda c: c.find({'reset_password_token': 'token'})),
+    ('chats', 'chat list of a user',
+     lambda c: c.find({'user_email': 'someone@example.com'})
+     .sort([('created_at', DESCENDING), ('_id', DESCENDING)]).limit(30)),
+    ('chats', 'chat list page after a cursor',
+     lambda c: c.find({'user_email': 'someone@example.com', '$or': [
+         {'created_at': {'$lt': datetime.now()}},
+         {'created_at': datetime.now(), '_id': {'$lt': ObjectId()}}
+     ]}).sort([('created_at', DESCENDING), ('_id', DESCENDING)]).limit(30)),
+    ('chat_messages', 'newest messages of a chat',
+     lambda c: c.find({'chat_id': ObjectId()}).sort('seq', DESCENDING).limit(50)),
+    ('chat_messages', 'older messages of a chat',
+     lambda c: c.find({'chat_id': ObjectId(), 'seq': {'$lt': 100}}).sort('seq', DESCENDING).limit(50)),
+    ('email_outbox', 'next due email job',
+     lambda c: c.find({'status': 'pending', 'next_attempt_at': {'$lte': datetime.now()}})
+     .sort('next_attempt_at', ASCENDING).limit(1)),
+]
+
+
+def ensure_indexes(collections):
+    """
+    Creates the declared indexes on the given {role: collection} mapping.
+    Errors (e.g. duplicate emails blocking the unique index) are reported,
+    not raised, so they never keep the app from starting.
+    Returns the list of errors.
+    """
+    errors = []
+    for role, indexes in INDEXES.items():
+        collection = collections.get(role)
+        if collection is None:
+            continue
+        for keys, options in indexes:
+            try:
+                collection.create_index(keys, **options)
+            except ConnectionFailure as e:
+                # Every other index would wait out the same server selection timeout
+                errors.append(f"{collection.name}.{options['name']}: {e}")
+                logger.error("Could not reach MongoDB to create indexes: %s", e)
+                return errors
+            except PyMongoError as e:
+                errors.append(f"{collection.name}.{options['name']}: {e}")
+                logger.error("Could not create index %s on %s: %s", options['name'], collection.name, e)
+    return errors
+
+
+def _plan_stages(plan):
+    """All stage names in an explain() plan tree."""
+    stages = []
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            stages.append(plan['stage'])
+        for value in plan.values():
+            stages.extend(_plan_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(_plan_stages(item))
+    return stages
+
+
+def verify_indexes(collections):
+    """
+    Explains every hot query and returns a list of
+    {'collection', 'query', 'stages', 'collscan', 'failed'} results.
+    """
+    results = []
+    for role, description, build_query in HOT_QUERIES:
+        collection = collections.get(role)
+        if collection is None:
+            continue
+        failed = False
+        try:
+            plan = build_query(collection).explain()['queryPlanner']['winningPlan']
+            stages = _plan_stages(plan)
+        except Exception as e:
+            # Reported as a result, one failing explain should not hide the others
+            stages = [f"explain failed: {e}"]
+            failed = True
+        results.append({
+            'collection': collection.name,
+            'query': description,
+            'stages': stages,
+            'collscan': 'COLLSCAN' in stages,
+            'failed': failed
+        })
+    return results
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in ('create', 'verify'):
+        print("Usage: python -m backend.indexes create|verify")
+        sys.exit(2)
+
+    from backend.log import setup_logging
+    from backend.mongo import COLLECTIONS
+
+    # stdout carries the report
+    setup_logging(stream=sys.stderr)
+
+    if sys.argv[1] == 'create':
+        errors = ensure_indexes(COLLECTIONS)
+        print("Indexes are up to date" if not errors else f"{len(errors)} index(es) could not be created")
+        sys.exit(1 if errors else 0)
+
+    results = verify_indexes(COLLECTIONS)
+    for result in results:
+        status = 'ERROR' if result['failed'] else 'COLLSCAN' if result['collscan'] else 'ok'
+        print(f"[{status:>8}] {result['collection']}: {result['query']} ({' > '.join(result['stages'])})")
+    failures = [result for result in results if result['failed']]
+    collscans = [result for result in results if result['collscan']]
+    if failures:
+        print(f"{len(failures)} hot queries could not be explained")
+    if collscans:
+        print(f"{len(collscans)} hot queries fall back to a collection scan, run: python -m backend.indexes create")
+    if failures or collscans:
+        sys.exit(1)
+    print("All hot queries use an index")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""
+Structured, non-blocking logging.
+
+setup_logging() routes every logger through a QueueHandler: the calling
+thread only formats the record and puts it on an in-memory queue, and a
+QueueListener thread writes it to stdout. A request thread therefore never
+blocks on a slow stdout or log collector. When the queue is full, records
+are dropped and counted rather than making the caller wait: in
+chatup_log_records_dropped_total (backend/metrics.py) and, for the serving
+process, in /health. Command line tools pass stream=sys.stderr, so log
+lines stay out of the report they print.
+
+Each line is one JSON object:
+
+    {"ts": "...", "level": "INFO", "logger": "server", "msg": "...",
+     "request_id": "...", "pid": 12, "thread": "...", ...extra fields}
+
+Fields passed with extra={...} are added to the object. init_app() gives
+every request an id, taken from the X-Request-ID header when the proxy sets
+one, which is attached to all log lines written while serving it and
+returned in the X-Request-ID response header. It also writes one
+"chatup.access" line per request.
+
+Configuration (environment variables):
+    LOG_LEVEL        root level (default INFO)
+    LOG_LEVELS       per-logger levels, e.g. "pymongo=WARNING,backend.mongo=DEBUG"
+    LOG_SAMPLING     share of INFO and lower lines kept per logger, e.g. "chatup.access=0.1";
+                     warnings and errors are always kept
+    LOG_FORMAT       json or text (default json)
+    LOG_QUEUE_SIZE   records buffered for the writer thread (default 10000)
+"""
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+from backend import metrics
+
+request_id_var = contextvars.ContextVar('request_id', default=None)
+
+# Attributes every LogRecord has, anything else came in through extra={...}
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+
+def parse_mapping(value):
+    """Parses "a=1,b=2" into {'a': '1', 'b': '2'}."""
+    mapping = {}
+    for part in (value or '').split(','):
+        if '=' in part:
+            key, item = part.split('=', 1)
+            mapping[key.strip()] = item.strip()
+    return mapping
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as one line of JSON."""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'pid': record.process,
+            'thread': record.threadName
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class ContextFilter(logging.Filter):
+    """Adds the current request id to each record."""
+
+    def filter(self, record):
+        if not hasattr(record, 'request_id'):
+            record.request_id = request_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps only a share of the INFO and lower records of the configured loggers."""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+
+    def _rate(self, name):
+        while name:
+            if name in self.rates:
+                return self.rates[name]
+            name = name.rpartition('.')[0]
+        return 1.0
+
+    def filter(self, record):
+        if record.levelno > logging.INFO or not self.rates:
+            return True
+        return random.random() < self._rate(record.name)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records when the queue is full instead of raising."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Resolve the message and traceback now, while the arguments are
+        # still current, but keep the traceback out of the message
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            metrics.LOG_RECORDS_DROPPED.inc()
+
+
+_setup_lock = threading.Lock()
+_handler = None
+_listener = None
+
+
+def _start_listener(queue_size, formatter, stream):
+    global _listener
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(formatter)
+    _handler.queue = queue.Queue(queue_size)
+    _listener = logging.handlers.QueueListener(_handler.queue, output, respect_handler_level=False)
+    _listener.start()
+
+
+def _stop_listener():
+    if _listener is not None:
+        # Writes out what is still queued
+        _listener.stop()
+
+
+def setup_logging(stream=None):
+    """
+    Configures the root logger once per process, see the module docstring.
+    Lines are written to stream, stdout by default.
+    """
+    global _handler
+    with _setup_lock:
+        if _handler is not None:
+            return
+        queue_size = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+        if os.getenv('LOG_FORMAT', 'json').lower() == 'text':
+            formatter = logging.Formatter('%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s')
+        else:
+            formatter = JsonFormatter()
+
+        _handler = DroppingQueueHandler(None)
+        _handler.addFilter(ContextFilter())
+        _handler.addFilter(SamplingFilter({
+            name: float(rate) for name, rate in parse_mapping(os.getenv('LOG_SAMPLING')).items()
+        }))
+        _start_listener(queue_size, formatter, stream)
+
+        root = logging.getLogger()
+        root.handlers = [_handler]
+        root.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+        for name, level in parse_mapping(os.getenv('LOG_LEVELS')).items():
+            logging.getLogger(name).setLevel(level.upper())
+
+        atexit.register(_stop_listener)
+        # The writer thread does not survive fork(), a forked worker starts its own
+        os.register_at_fork(after_in_child=lambda: _start_listener(queue_size, formatter, stream))
+
+
+def dropped_records():
+    """Records dropped in this process because the queue was full."""
+    return _handler.dropped if _handler is not None else 0
+
+
+def init_app(app):
+    """Request id correlation and a per-request access log line for app."""
+    from flask import g, request
+
+    access_log = logging.getLogger('chatup.access')
+
+    @app.before_request
+    def assign_request_id():
+        # Client supplied ids are capped, they end up in every log line
+        request_id = request.headers.get('X-Request-ID', '')[:64] or uuid.uuid4().hex
+        g.request_id = request_id
+        g.request_id_token = request_id_var.set(request_id)
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def log_request(response):
+        request_id = g.get('request_id')
+        if request_id:
+            response.headers['X-Request-ID'] = request_id
+            access_log.info('request', extra={
+                'method': request.method,
+                'route': request.url_rule.rule if request.url_rule else None,
+                'status': response.status_code,
+                'duration_ms': round(1000 * (time.perf_counter() - g.request_started), 1)
+            })
+        return response
+
+    @app.teardown_request
+    def clear_request_id(error):
+        token = g.pop('request_id_token', None)
+        if token is not None:
+            request_id_var.reset(token)
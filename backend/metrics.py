@@ -0,0 +1,181 @@
+"""
+Prometheus metrics, served at /metrics.
+
+Latency histograms cover each stage of a chat request, so a slow /chat can be
+traced to where it spent its time:
+
+    chatup_http_request_duration_seconds{method, route, status}
+    chatup_agent_queue_wait_seconds{outcome}       wait for an agent slot
+    chatup_agent_run_duration_seconds{mode, outcome}
+    chatup_llm_request_duration_seconds{status}    model API, until the response headers
+    chatup_search_duration_seconds{provider, outcome}   Tavily calls, cache misses only
+    chatup_mongo_operation_duration_seconds{collection, operation}
+    chatup_smtp_send_duration_seconds{outcome}
+
+plus in-flight gauges (chatup_http_requests_in_progress,
+chatup_agent_runs_in_progress, chatup_agent_queue_waiting),
+chatup_cache_requests_total{cache, result} for the response and search
+caches, and chatup_singleflight_calls_total{flight, result} with
+chatup_singleflight_in_flight{flight} for coalesced agent runs
+(backend/singleflight.py), and chatup_log_records_dropped_total for log
+lines lost to a full log queue (backend/log.py). Hit ratio per cache:
+
+    sum by (cache) (rate(chatup_cache_requests_total{result="hit"}[5m]))
+      / sum by (cache) (rate(chatup_cache_requests_total[5m]))
+
+Multiprocess mode: when PROMETHEUS_MULTIPROC_DIR is set (gunicorn.conf.py
+sets it) every process, including the agent pool workers, writes its samples
+to files in that directory and /metrics aggregates all of them, whichever
+gunicorn worker answers the scrape. Without it, as under the Flask dev
+server, only the serving process's own metrics are reported. Exited
+processes are passed to mark_process_dead() (gunicorn.conf.py for gunicorn
+workers, backend/agent_pool.py for agent workers) so their in-flight gauges
+stop counting.
+"""
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+    generate_latest, multiprocess
+)
+
+# Model and agent latencies run into tens of seconds
+SLOW_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 3, 5, 7.5, 10, 15, 20, 30, 45, 60, 90, 120)
+MONGO_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SMTP_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    'chatup_http_request_duration_seconds', 'HTTP request latency by route and status',
+    ['method', 'route', 'status'], buckets=SLOW_BUCKETS
+)
+HTTP_IN_PROGRESS = Gauge(
+    'chatup_http_requests_in_progress', 'HTTP requests being served',
+    ['method', 'route'], multiprocess_mode='livesum'
+)
+AGENT_QUEUE_WAIT_SECONDS = Histogram(
+    'chatup_agent_queue_wait_seconds', 'Time spent waiting for an agent slot',
+    ['outcome'], buckets=SLOW_BUCKETS
+)
+AGENT_QUEUE_WAITING = Gauge(
+    'chatup_agent_queue_waiting', 'Requests waiting for an agent slot',
+    multiprocess_mode='livesum'
+)
+AGENT_RUN_SECONDS = Histogram(
+    'chatup_agent_run_duration_seconds', 'Agent execution time',
+    ['mode', 'outcome'], buckets=SLOW_BUCKETS
+)
+AGENT_IN_PROGRESS = Gauge(
+    'chatup_agent_runs_in_progress', 'Agent runs executing',
+    ['mode'], multiprocess_mode='livesum'
+)
+LLM_REQUEST_SECONDS = Histogram(
+    'chatup_llm_request_duration_seconds', 'Model API request time until the response headers',
+    ['status'], buckets=SLOW_BUCKETS
+)
+SEARCH_SECONDS = Histogram(
+    'chatup_search_duration_seconds', 'Web search API time',
+    ['provider', 'outcome'], buckets=SLOW_BUCKETS
+)
+MONGO_OPERATION_SECONDS = Histogram(
+    'chatup_mongo_operation_duration_seconds', 'MongoDB command time as reported by the driver',
+    ['collection', 'operation'], buckets=MONGO_BUCKETS
+)
+SMTP_SEND_SECONDS = Histogram(
+    'chatup_smtp_send_duration_seconds', 'Time to send one email, including reconnects',
+    ['outcome'], buckets=SMTP_BUCKETS
+)
+CACHE_REQUESTS = Counter(
+    'chatup_cache_requests_total', 'Cache lookups by result',
+    ['cache', 'result']
+)
+LOG_RECORDS_DROPPED = Counter(
+    'chatup_log_records_dropped_total', 'Log records dropped because the log queue was full'
+)
+SINGLEFLIGHT_CALLS = Counter(
+    'chatup_singleflight_calls_total', 'Single-flight calls executed, coalesced onto a running call, or timed out waiting',
+    ['flight', 'result']
+)
+SINGLEFLIGHT_IN_FLIGHT = Gauge(
+    'chatup_singleflight_in_flight', 'Shared calls running',
+    ['flight'], multiprocess_mode='livesum'
+)
+
+
+def outcome_of(error):
+    """'timeout' or 'error' label for an exception."""
+    return 'timeout' if 'Timeout' in type(error).__name__ else 'error'
+
+
+@contextmanager
+def timed(histogram, in_progress=None, **labels):
+    """
+    Observes the duration of the block in histogram, with an outcome label of
+    'ok', 'timeout' or 'error'. in_progress, a gauge, counts the running blocks.
+    """
+    if in_progress is not None:
+        in_progress.inc()
+    started = time.perf_counter()
+    outcome = 'ok'
+    try:
+        yield
+    except Exception as e:
+        outcome = outcome_of(e)
+        raise
+    finally:
+        histogram.labels(outcome=outcome, **labels).observe(time.perf_counter() - started)
+        if in_progress is not None:
+            in_progress.dec()
+
+
+def mark_process_dead(pid):
+    """Drops the live gauge samples of an exited process, in multiprocess mode."""
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.mark_process_dead(pid)
+
+
+def render():
+    """Returns (body, content type) of the metrics of all processes."""
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def init_app(app):
+    """Records latency and in-flight requests for every route of app."""
+    # Imported here, the agent workers use this module without Flask
+    from flask import g, request
+
+    def route():
+        return request.url_rule.rule if request.url_rule else 'unmatched'
+
+    @app.before_request
+    def start_timer():
+        g.metrics_started = time.perf_counter()
+        g.metrics_route = route()
+        HTTP_IN_PROGRESS.labels(request.method, g.metrics_route).inc()
+
+    @app.after_request
+    def observe(response):
+        started = g.pop('metrics_started', None)
+        if started is not None:
+            # Streamed responses are observed when their headers are sent
+            HTTP_REQUEST_SECONDS.labels(request.method, g.metrics_route, str(response.status_code)).observe(
+                time.perf_counter() - started
+            )
+        return response
+
+    @app.teardown_request
+    def finish(error):
+        route_rule = g.pop('metrics_route', None)
+        if route_rule is None:
+            return
+        started = g.pop('metrics_started', None)
+        if started is not None:
+            # An unhandled exception skipped after_request
+            HTTP_REQUEST_SECONDS.labels(request.method, route_rule, '500').observe(time.perf_counter() - started)
+        HTTP_IN_PROGRESS.labels(request.method, route_rule).dec()
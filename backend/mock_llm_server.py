@@ -0,0 +1,204 @@
+"""
+Local OpenAI-compatible stub of the chat completions API, for load testing.
+
+Serves POST /v1/chat/completions (plain and streamed) and GET /v1/models with
+generated answers after a simulated delay. When the request offers tools, a
+configurable share of first responses calls search_web instead of answering,
+so the tool path of the agent is exercised too.
+
+Run with:
+    python -m backend.mock_llm_server --port 8085
+and start the app with LLM_PROVIDER=mock (see backend/providers.py).
+
+Configuration (environment variables, or the matching command line options):
+    MOCK_LLM_LATENCY         time to first token, as a latency distribution (default lognormal:0.8,0.4)
+    MOCK_LLM_ERROR_RATE      fraction of requests answered with HTTP 500 (default 0)
+    MOCK_LLM_TOOL_RATE       fraction of first turns that call search_web (default 0.2)
+    MOCK_LLM_CHUNK_INTERVAL  seconds between streamed chunks (default 0.03)
+    MOCK_LLM_ANSWER_WORDS    length of generated answers in words (default 60)
+"""
+import argparse
+import json
+import os
+import random
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from backend.providers import sample_latency
+
+SETTINGS = {
+    'latency': os.getenv('MOCK_LLM_LATENCY', 'lognormal:0.8,0.4'),
+    'error_rate': float(os.getenv('MOCK_LLM_ERROR_RATE', '0')),
+    'tool_rate': float(os.getenv('MOCK_LLM_TOOL_RATE', '0.2')),
+    'chunk_interval': float(os.getenv('MOCK_LLM_CHUNK_INTERVAL', '0.03')),
+    'answer_words': int(os.getenv('MOCK_LLM_ANSWER_WORDS', '60'))
+}
+
+WORDS = (
+    "the assistant can help with questions about software models search data "
+    "and current events using a concise clear and friendly answer"
+).split()
+
+
+def last_user_text(messages):
+    for message in reversed(messages):
+        if message.get('role') == 'user':
+            content = message.get('content')
+            if isinstance(content, list):
+                return ' '.join(part.get('text', '') for part in content if isinstance(part, dict))
+            return content or ''
+    return ''
+
+
+def generate_answer(prompt):
+    words = [random.choice(WORDS) for _ in range(SETTINGS['answer_words'])]
+    return f"Mock answer to: {prompt[:80]}. " + ' '.join(words) + '.'
+
+
+def plan_response(body):
+    """Decides whether to call search_web or answer, returns (text, tool_call)."""
+    messages = body.get('messages', [])
+    prompt = last_user_text(messages)
+    offers_search = any(
+        tool.get('function', {}).get('name') == 'search_web'
+        for tool in body.get('tools') or []
+    )
+    # Only call the tool on the first turn, answer once its output came back
+    if offers_search and messages and messages[-1].get('role') == 'user' \
+            and random.random() < SETTINGS['tool_rate']:
+        return None, {
+            'id': f"call_{uuid.uuid4().hex[:12]}",
+            'type': 'function',
+            'function': {'name': 'search_web', 'arguments': json.dumps({'query': prompt[:100]})}
+        }
+    return generate_answer(prompt), None
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip('/').endswith('/models'):
+            self._send_json(200, {'object': 'list', 'data': [{'id': 'mock-model', 'object': 'model'}]})
+        else:
+            self._send_json(404, {'error': {'message': 'Not found'}})
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length) or b'{}')
+
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send_json(404, {'error': {'message': 'Not found'}})
+            return
+
+        time.sleep(sample_latency(SETTINGS['latency']))
+        if random.random() < SETTINGS['error_rate']:
+            self._send_json(500, {'error': {'message': 'Simulated model failure', 'type': 'server_error'}})
+            return
+
+        text, tool_call = plan_response(body)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        model = body.get('model', 'mock-model')
+        usage = {'prompt_tokens': 50, 'completion_tokens': len((text or '').split()), 'total_tokens': 50}
+
+        if body.get('stream'):
+            self._stream(completion_id, model, text, tool_call, usage)
+            return
+
+        message = {'role': 'assistant', 'content': text}
+        if tool_call:
+            message['tool_calls'] = [tool_call]
+        self._send_json(200, {
+            'id': completion_id,
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': model,
+            'choices': [{
+                'index': 0,
+                'message': message,
+                'finish_reason': 'tool_calls' if tool_call else 'stop'
+            }],
+            'usage': usage
+        })
+
+    def _stream(self, completion_id, model, text, tool_call, usage):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        def chunk(delta, finish_reason=None, include_usage=False):
+            payload = {
+                'id': completion_id,
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}]
+            }
+            if include_usage:
+                payload['usage'] = usage
+            self.wfile.write(f"data: {json.dumps(payload)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+
+        if tool_call:
+            chunk({'role': 'assistant', 'tool_calls': [dict(tool_call, index=0)]})
+            chunk({}, 'tool_calls', include_usage=True)
+        else:
+            chunk({'role': 'assistant', 'content': ''})
+            for word in text.split(' '):
+                time.sleep(SETTINGS['chunk_interval'])
+                chunk({'content': word + ' '})
+            chunk({}, 'stop', include_usage=True)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+def create_server(host='127.0.0.1', port=8085):
+    return ThreadingHTTPServer((host, port), MockLLMHandler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='OpenAI-compatible mock LLM server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8085)
+    parser.add_argument('--latency', help='time to first token distribution, e.g. lognormal:0.8,0.4')
+    parser.add_argument('--error-rate', type=float)
+    parser.add_argument('--tool-rate', type=float)
+    parser.add_argument('--chunk-interval', type=float)
+    parser.add_argument('--answer-words', type=int)
+    args = parser.parse_args()
+
+    for key in SETTINGS:
+        value = getattr(args, key)
+        if value is not None:
+            SETTINGS[key] = value
+
+    server = create_server(args.host, args.port)
+    print(f"Mock LLM server listening on http://{args.host}:{args.port}/v1/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
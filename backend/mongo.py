@@ -0,0 +1,263 @@
+"""
+MongoDB connection management.
+
+The MongoClient is created lazily, on first use, in the process that uses it.
+A client must not be carried across fork(): its pool sockets and monitor
+threads belong to the parent, so a gunicorn worker (even with preload_app)
+gets a client of its own the first time it touches the database. Importing
+the app therefore opens no connection and never blocks on an unreachable
+cluster.
+
+Collections are module-level proxies (users, chats, chat_messages,
+email_outbox) that resolve against the current process's client on every
+call, so they can be imported anywhere at import time.
+
+Command durations go to the chatup_mongo_operation_duration_seconds
+histogram (backend/metrics.py). Connection pool events are logged, and
+counted for pool_stats(), to size MONGO_MAX_POOL_SIZE against the number of
+workers and threads: each worker process has its own pool per server, so a
+deployment opens up to workers x MONGO_MAX_POOL_SIZE connections per server.
+
+Configuration (environment variables):
+    MONGODB_URI                        connection string (default mongodb://localhost:27017/)
+    DB_NAME                            database (default Credentials)
+    COLLECTION_NAME                    users collection (default User_info)
+    MONGO_MAX_POOL_SIZE                connections per server per process (default 20)
+    MONGO_MIN_POOL_SIZE                connections kept open when idle (default 0)
+    MONGO_MAX_IDLE_TIME_MS             idle time before a connection is closed (default 300000)
+    MONGO_WAIT_QUEUE_TIMEOUT_MS        wait for a free pooled connection (default 10000)
+    MONGO_SERVER_SELECTION_TIMEOUT_MS  wait for a usable server (default 10000)
+    MONGO_CONNECT_TIMEOUT_MS           TCP/TLS connect timeout (default 10000)
+
+Every checkout and checkin is logged at DEBUG, LOG_LEVELS=backend.mongo=DEBUG
+turns them on (see backend/log.py).
+"""
+import logging
+import os
+import threading
+from urllib.parse import quote_plus, urlparse
+
+import pymongo
+from pymongo import monitoring
+
+from backend import metrics
+
+DB_NAME = os.getenv("DB_NAME", "Credentials")
+COLLECTION_NAME = os.getenv("COLLECTION_NAME", "User_info")
+
+MAX_POOL_SIZE = int(os.getenv('MONGO_MAX_POOL_SIZE', '20'))
+MIN_POOL_SIZE = int(os.getenv('MONGO_MIN_POOL_SIZE', '0'))
+MAX_IDLE_TIME_MS = int(os.getenv('MONGO_MAX_IDLE_TIME_MS', '300000'))
+WAIT_QUEUE_TIMEOUT_MS = int(os.getenv('MONGO_WAIT_QUEUE_TIMEOUT_MS', '10000'))
+SERVER_SELECTION_TIMEOUT_MS = int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', '10000'))
+CONNECT_TIMEOUT_MS = int(os.getenv('MONGO_CONNECT_TIMEOUT_MS', '10000'))
+
+logger = logging.getLogger(__name__)
+
+
+def mongo_uri():
+    """MONGODB_URI, with the credentials of an Atlas connection string properly encoded."""
+    uri = os.getenv("MONGODB_URI", "mongodb://localhost:27017/")
+    if "mongodb+srv://" not in uri:
+        return uri
+    parsed = urlparse(uri)
+    if not (parsed.username and parsed.password):
+        return uri
+    netloc = f"{quote_plus(parsed.username)}:{quote_plus(parsed.password)}@{parsed.hostname}"
+    if parsed.port:
+        netloc += f":{parsed.port}"
+    return parsed._replace(netloc=netloc).geturl()
+
+
+class PoolEventLogger(monitoring.ConnectionPoolListener):
+    """Logs connection pool events and keeps the counts reported by pool_stats()."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.open = 0
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.created = 0
+        self.checkout_failures = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'open': self.open,
+                'in_use': self.in_use,
+                'peak_in_use': self.peak_in_use,
+                'created': self.created,
+                'checkout_failures': self.checkout_failures
+            }
+
+    def pool_created(self, event):
+        logger.info("MongoDB pool created for %s (maxPoolSize %d, minPoolSize %d)",
+                    event.address, MAX_POOL_SIZE, MIN_POOL_SIZE)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        logger.warning("MongoDB pool cleared for %s, its connections will be replaced", event.address)
+
+    def pool_closed(self, event):
+        logger.info("MongoDB pool closed for %s", event.address)
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open += 1
+            self.created += 1
+            open_connections = self.open
+        logger.info("MongoDB connection %s opened to %s (%d open)",
+                    event.connection_id, event.address, open_connections)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open = max(0, self.open - 1)
+        logger.info("MongoDB connection %s to %s closed: %s", event.connection_id, event.address, event.reason)
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.checkout_failures += 1
+        # reason 'timeout' means every pooled connection stayed busy for MONGO_WAIT_QUEUE_TIMEOUT_MS
+        logger.warning("MongoDB connection checkout from %s failed: %s", event.address, event.reason)
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.in_use += 1
+            if self.in_use > self.peak_in_use:
+                self.peak_in_use = self.in_use
+                if self.in_use == MAX_POOL_SIZE:
+                    logger.warning("MongoDB pool is fully checked out (%d connections)", MAX_POOL_SIZE)
+        logger.debug("MongoDB connection %s checked out", event.connection_id)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.in_use = max(0, self.in_use - 1)
+        logger.debug("MongoDB connection %s checked in", event.connection_id)
+
+
+class CommandTimer(monitoring.CommandListener):
+    """Records the driver-measured duration of each command per collection and operation."""
+
+    def __init__(self):
+        self._collections = {}
+
+    def started(self, event):
+        # The collection is only named in the command document of the started event
+        collection = event.command.get(event.command_name)
+        self._collections[(event.request_id, event.connection_id)] = (
+            collection if isinstance(collection, str) else '-'
+        )
+
+    def _observe(self, event):
+        collection = self._collections.pop((event.request_id, event.connection_id), '-')
+        metrics.MONGO_OPERATION_SECONDS.labels(collection, event.command_name).observe(
+            event.duration_micros / 1e6
+        )
+
+    def succeeded(self, event):
+        self._observe(event)
+
+    def failed(self, event):
+        self._observe(event)
+
+
+_client = None
+_client_pid = None
+_pool_events = None
+_client_lock = threading.Lock()
+_on_connect = []
+
+
+def on_connect(callback):
+    """
+    Registers callback() to run once in every process that creates a client,
+    in a background thread so a slow cluster does not hold up the caller.
+    """
+    _on_connect.append(callback)
+    return callback
+
+
+def get_client():
+    """Returns this process's MongoClient, creating it on first use."""
+    global _client, _client_pid, _pool_events
+    created = False
+    with _client_lock:
+        if _client is None or _client_pid != os.getpid():
+            # A client inherited over fork() is left alone, closing it would
+            # touch sockets and threads that belong to the parent
+            _pool_events = PoolEventLogger()
+            _client = pymongo.MongoClient(
+                mongo_uri(),
+                tls=True,
+                tlsAllowInvalidCertificates=True,
+                maxPoolSize=MAX_POOL_SIZE,
+                minPoolSize=MIN_POOL_SIZE,
+                maxIdleTimeMS=MAX_IDLE_TIME_MS,
+                waitQueueTimeoutMS=WAIT_QUEUE_TIMEOUT_MS,
+                serverSelectionTimeoutMS=SERVER_SELECTION_TIMEOUT_MS,
+                connectTimeoutMS=CONNECT_TIMEOUT_MS,
+                event_listeners=[_pool_events, CommandTimer()]
+            )
+            _client_pid = os.getpid()
+            created = True
+            logger.info("MongoDB client created for database %s", DB_NAME)
+        client = _client
+
+    if created:
+        for callback in _on_connect:
+            threading.Thread(target=callback, name='mongo-on-connect', daemon=True).start()
+    return client
+
+
+def get_database():
+    return get_client()[DB_NAME]
+
+
+def pool_stats():
+    """Connection counts of this process's pool, None before the client exists."""
+    if _pool_events is None or _client_pid != os.getpid():
+        return None
+    return dict(_pool_events.stats(), pid=_client_pid, max_pool_size=MAX_POOL_SIZE)
+
+
+class LazyCollection:
+    """
+    Stands in for a pymongo Collection, resolving it against the current
+    process's client on each attribute access.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def collection(self):
+        return get_database()[self.name]
+
+    def __getattr__(self, attr):
+        return getattr(self.collection(), attr)
+
+    def __repr__(self):
+        return f"LazyCollection({self.name!r})"
+
+
+users = LazyCollection(COLLECTION_NAME)
+chats = LazyCollection('Chat_History')
+# One document per chat message, see backend/chat_store.py
+chat_messages = LazyCollection('Chat_Messages')
+# Queued outgoing email, see backend/email_outbox.py
+email_outbox = LazyCollection('Email_Outbox')
+
+# By role, as used by backend/indexes.py
+COLLECTIONS = {
+    'users': users,
+    'chats': chats,
+    'chat_messages': chat_messages,
+    'email_outbox': email_outbox
+}
@@ -0,0 +1,96 @@
+"""
+Model and web search providers, selected by configuration.
+
+LLM_PROVIDER=gemini (default) talks to Gemini's OpenAI-compatible API,
+LLM_PROVIDER=mock talks to the local stub in backend/mock_llm_server.py.
+SEARCH_PROVIDER=tavily (default) uses Tavily, SEARCH_PROVIDER=mock uses
+FakeTavilyClient below. With both set to mock, /chat can be load tested fully
+offline.
+
+Mock configuration (environment variables):
+    MOCK_LLM_URL            base URL of the stub server (default http://127.0.0.1:8085/v1/)
+    MOCK_LLM_MODEL          model name sent to the stub (default mock-model)
+    MOCK_SEARCH_LATENCY     latency distribution of a fake search (default lognormal:0.5,0.5)
+    MOCK_SEARCH_ERROR_RATE  fraction of fake searches that fail (default 0)
+
+Latency distributions are written as "fixed:SECONDS", "uniform:LOW,HIGH" or
+"lognormal:MEDIAN,SIGMA".
+"""
+import math
+import os
+import random
+import time
+
+from backend.agent_config import MODEL_NAME, GEMINI_BASE_URL
+
+
+def llm_provider():
+    return os.getenv('LLM_PROVIDER', 'gemini').lower()
+
+
+def search_provider():
+    return os.getenv('SEARCH_PROVIDER', 'tavily').lower()
+
+
+def model_settings():
+    """Returns (base_url, api_key, model_name) for the configured model provider."""
+    if llm_provider() == 'mock':
+        return (
+            os.getenv('MOCK_LLM_URL', 'http://127.0.0.1:8085/v1/'),
+            'mock-key',
+            os.getenv('MOCK_LLM_MODEL', 'mock-model')
+        )
+    return GEMINI_BASE_URL, os.getenv('GEMINI_API_KEY'), MODEL_NAME
+
+
+def model_name():
+    return model_settings()[2]
+
+
+def sample_latency(spec):
+    """Draws one latency in seconds from a distribution spec (see module docstring)."""
+    kind, _, params = (spec or 'fixed:0').partition(':')
+    values = [float(value) for value in params.split(',') if value.strip()]
+    if kind == 'uniform':
+        return random.uniform(values[0], values[1])
+    if kind == 'lognormal':
+        median, sigma = values
+        return random.lognormvariate(math.log(median), sigma) if median > 0 else 0.0
+    return values[0] if values else 0.0
+
+
+class FakeTavilyClient:
+    """Stand-in for TavilyClient that returns generated results after a simulated delay."""
+
+    def __init__(self, latency=None, error_rate=None):
+        self.latency = latency or os.getenv('MOCK_SEARCH_LATENCY', 'lognormal:0.5,0.5')
+        self.error_rate = float(error_rate if error_rate is not None else os.getenv('MOCK_SEARCH_ERROR_RATE', '0'))
+
+    def search(self, query, max_results=5, **kwargs):
+        time.sleep(sample_latency(self.latency))
+        if random.random() < self.error_rate:
+            raise RuntimeError("Simulated search failure")
+        return {
+            'query': query,
+            'results': [
+                {
+                    'title': f"Result {i + 1} for {query}",
+                    'url': f"https://example.com/search/{i + 1}",
+                    'content': f"Generated content about {query}. " * 10
+                }
+                for i in range(max_results)
+            ]
+        }
+
+
+def create_search_client(session=None):
+    """Returns the configured search client, or None if it is not configured."""
+    if search_provider() == 'mock':
+        return FakeTavilyClient()
+
+    tavily_api_key = os.getenv('TAVILY_API_KEY')
+    if not tavily_api_key:
+        return None
+
+    from tavily import TavilyClient
+    return TavilyClient(api_key=tavily_api_key, session=session)
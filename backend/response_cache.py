@@ -0,0 +1,195 @@
+"""
+Exact-match cache for agent responses.
+
+Responses are keyed on the normalized prompt plus the model name and the agent
+instructions, so changing either invalidates old entries. Entries live in an
+in-process LRU with a TTL and a total size cap in bytes. When RESPONSE_CACHE_PATH
+is set, entries are also written to a local SQLite file so hits survive restarts
+and are shared by every process on the machine.
+
+Configuration (environment variables):
+    RESPONSE_CACHE_ENABLED     set to "false" to disable the cache (default true)
+    RESPONSE_CACHE_TTL         seconds an entry stays valid (default 3600)
+    RESPONSE_CACHE_MAX_BYTES   size cap of the cached responses (default 16 MB)
+    RESPONSE_CACHE_PATH        SQLite file for the on-disk backend (default: memory only)
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from backend import metrics
+
+
+def normalize_prompt(prompt):
+    """Lowercases the prompt, collapses whitespace and drops trailing punctuation."""
+    prompt = re.sub(r'\s+', ' ', prompt or '').strip().casefold()
+    return prompt.rstrip(' ?!.')
+
+
+def make_cache_key(prompt, model, instructions):
+    raw = '\x1f'.join([normalize_prompt(prompt), model, instructions])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class DiskResponseStore:
+    """SQLite-backed store used behind the in-memory LRU."""
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                'key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, '
+                'expires_at REAL NOT NULL, last_access REAL NOT NULL)'
+            )
+
+    def _connect(self):
+        # sqlite3 connections cannot be shared between threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key, now):
+        conn = self._connect()
+        row = conn.execute(
+            'SELECT value, expires_at FROM responses WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None, None
+        value, expires_at = row
+        if expires_at <= now:
+            with conn:
+                conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+            return None, None
+        with conn:
+            conn.execute('UPDATE responses SET last_access = ? WHERE key = ?', (now, key))
+        return value, expires_at
+
+    def set(self, key, value, size, expires_at, now):
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO responses (key, value, size, expires_at, last_access) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (key, value, size, expires_at, now)
+            )
+            conn.execute('DELETE FROM responses WHERE expires_at <= ?', (now,))
+            total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+            # Evict the least recently used entries until we are under the cap
+            while total > self.max_bytes:
+                row = conn.execute(
+                    'SELECT key, size FROM responses ORDER BY last_access LIMIT 1'
+                ).fetchone()
+                if row is None:
+                    break
+                conn.execute('DELETE FROM responses WHERE key = ?', (row[0],))
+                total -= row[1]
+
+
+class ResponseCache:
+    """LRU + TTL cache of agent responses with hit/miss counters."""
+
+    def __init__(self, ttl, max_bytes, path=None, enabled=True):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self._entries = OrderedDict()  # key -> (value, size, expires_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._disk = DiskResponseStore(path, max_bytes) if enabled and path else None
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+    def get(self, key):
+        """Returns the cached response for key, or None."""
+        if not self.enabled:
+            return None
+
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[2] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    metrics.CACHE_REQUESTS.labels('response', 'hit').inc()
+                    return entry[0]
+                self._remove(key)
+
+        if self._disk is not None:
+            value, expires_at = self._disk.get(key, now)
+            if value is not None:
+                with self._lock:
+                    self._store(key, value, expires_at)
+                    self.hits += 1
+                metrics.CACHE_REQUESTS.labels('response', 'hit').inc()
+                return value
+
+        with self._lock:
+            self.misses += 1
+        metrics.CACHE_REQUESTS.labels('response', 'miss').inc()
+        return None
+
+    def set(self, key, value):
+        if not self.enabled:
+            return
+
+        now = time.time()
+        expires_at = now + self.ttl
+        with self._lock:
+            self._store(key, value, expires_at)
+        if self._disk is not None:
+            self._disk.set(key, value, len(value.encode('utf-8')), expires_at, now)
+
+    def record_bypass(self):
+        """Counts a response that was deliberately not cached (e.g. it used web search)."""
+        with self._lock:
+            self.bypassed += 1
+        metrics.CACHE_REQUESTS.labels('response', 'bypass').inc()
+
+    def _store(self, key, value, expires_at):
+        size = len(value.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (value, size, expires_at)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+
+    def _remove(self, key):
+        value, size, expires_at = self._entries.pop(key)
+        self._bytes -= size
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'bypassed': self.bypassed,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+response_cache = ResponseCache(
+    ttl=float(os.getenv('RESPONSE_CACHE_TTL', '3600')),
+    max_bytes=int(os.getenv('RESPONSE_CACHE_MAX_BYTES', str(16 * 1024 * 1024))),
+    path=os.getenv('RESPONSE_CACHE_PATH') or None,
+    enabled=os.getenv('RESPONSE_CACHE_ENABLED', 'true').lower() != 'false'
+)
@@ -0,0 +1,136 @@
+"""
+Shared TTL cache for web search results.
+
+Results are stored in a SQLite file so every gunicorn worker and every agent
+worker process on the machine shares the same cache. Entries are keyed on the
+normalized query and max_results. Once an entry is older than the TTL it is
+still served for a grace period while a background thread refreshes it
+(stale-while-revalidate), so popular queries never wait on the search API.
+
+Configuration (environment variables):
+    SEARCH_CACHE_ENABLED     set to "false" to disable the cache (default true)
+    SEARCH_CACHE_PATH        SQLite file (default: chatup_search_cache.sqlite3 in the temp dir)
+    SEARCH_CACHE_TTL         seconds a result is fresh (default 900)
+    SEARCH_CACHE_STALE_TTL   extra seconds a stale result may be served while refreshing (default 3600)
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+
+from backend import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(query):
+    return re.sub(r'\s+', ' ', query or '').strip().casefold()
+
+
+class SearchCache:
+    """SQLite-backed search result cache with stale-while-revalidate."""
+
+    def __init__(self, path, ttl, stale_ttl, enabled=True):
+        self.path = path
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.enabled = enabled
+        self._local = threading.local()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        if enabled:
+            with self._connect() as conn:
+                conn.execute(
+                    'CREATE TABLE IF NOT EXISTS search_results ('
+                    'key TEXT PRIMARY KEY, response TEXT NOT NULL, fetched_at REAL NOT NULL)'
+                )
+
+    def _connect(self):
+        # sqlite3 connections cannot be shared between threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def make_key(query, max_results):
+        raw = f"{normalize_query(query)}\x1f{max_results}"
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _load(self, key):
+        row = self._connect().execute(
+            'SELECT response, fetched_at FROM search_results WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None, None
+        return json.loads(row[0]), row[1]
+
+    def _save(self, key, response):
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO search_results (key, response, fetched_at) VALUES (?, ?, ?)',
+                (key, json.dumps(response), now)
+            )
+            # Drop entries that can no longer be served, even as stale
+            conn.execute(
+                'DELETE FROM search_results WHERE fetched_at < ?',
+                (now - self.ttl - self.stale_ttl,)
+            )
+
+    def _refresh_in_background(self, key, fetch):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self._save(key, fetch())
+            except Exception as e:
+                logger.warning("Search cache refresh failed: %s", e)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def get_or_fetch(self, query, max_results, fetch):
+        """
+        Returns the cached search response for the query, calling fetch() on a miss.
+        Errors from fetch() are raised and never cached.
+        """
+        if not self.enabled:
+            return fetch()
+
+        key = self.make_key(query, max_results)
+        response, fetched_at = self._load(key)
+        if response is not None:
+            age = time.time() - fetched_at
+            if age < self.ttl:
+                metrics.CACHE_REQUESTS.labels('search', 'hit').inc()
+                return response
+            if age < self.ttl + self.stale_ttl:
+                metrics.CACHE_REQUESTS.labels('search', 'stale').inc()
+                self._refresh_in_background(key, fetch)
+                return response
+
+        metrics.CACHE_REQUESTS.labels('search', 'miss').inc()
+        response = fetch()
+        self._save(key, response)
+        return response
+
+search_cache = SearchCache(
+    path=os.getenv('SEARCH_CACHE_PATH') or os.path.join(tempfile.gettempdir(), 'chatup_search_cache.sqlite3'),
+    ttl=float(os.getenv('SEARCH_CACHE_TTL', '900')),
+    stale_ttl=float(os.getenv('SEARCH_CACHE_STALE_TTL', '3600')),
+    enabled=os.getenv('SEARCH_CACHE_ENABLED', 'true').lower() != 'false'
+)
@@ -0,0 +1,85 @@
+"""
+Single-flight coalescing of identical concurrent calls.
+
+While a call for a key is in flight, other callers with the same key wait for
+it and receive its result (or its exception) instead of starting their own.
+A waiting caller gives up after the flight's timeout with SingleFlightTimeout.
+
+Calls are counted in chatup_singleflight_calls_total{flight, result} and
+chatup_singleflight_in_flight{flight} (backend/metrics.py).
+"""
+import threading
+
+from backend import metrics
+
+
+class SingleFlightTimeout(Exception):
+    """Raised to a waiting caller when the shared call did not finish in time."""
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time and shares its outcome. name
+    labels the metrics, timeout (seconds, None to wait forever) bounds how
+    long a caller waits for another caller's call.
+    """
+
+    def __init__(self, name, timeout=None):
+        self.name = name
+        self.timeout = timeout
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.executions = 0
+        self.coalesced = 0
+        self.timeouts = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.executions += 1
+            else:
+                self.coalesced += 1
+        metrics.SINGLEFLIGHT_CALLS.labels(self.name, 'execution' if leader else 'coalesced').inc()
+
+        if not leader:
+            if not call.done.wait(self.timeout):
+                with self._lock:
+                    self.timeouts += 1
+                metrics.SINGLEFLIGHT_CALLS.labels(self.name, 'timeout').inc()
+                raise SingleFlightTimeout(f"shared call did not finish within {self.timeout}s")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        metrics.SINGLEFLIGHT_IN_FLIGHT.labels(self.name).inc()
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+            metrics.SINGLEFLIGHT_IN_FLIGHT.labels(self.name).dec()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'executions': self.executions,
+                'coalesced': self.coalesced,
+                'timeouts': self.timeouts,
+                'in_flight': len(self._calls)
+            }
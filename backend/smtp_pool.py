@@ -0,0 +1,226 @@
+"""
+Pool of persistent, authenticated SMTP sessions.
+
+Sending an email used to open a new connection, run STARTTLS and log in for
+every single message. The pool keeps logged-in sessions open and hands them
+out to senders, so the TLS and auth handshakes are paid once per session
+instead of once per message. Sessions that sat idle too long or sent their
+share of messages are closed and replaced, a session the server dropped is
+reconnected transparently, and the number of open sessions is capped so the
+provider does not throttle us.
+
+Configuration (environment variables):
+    SMTP_SERVER / SMTP_PORT         SMTP host (default smtp.gmail.com:587)
+    EMAIL_ADDRESS / EMAIL_PASSWORD  login credentials
+    SMTP_MAX_SESSIONS               open sessions per process (default 2)
+    SMTP_IDLE_TIMEOUT               seconds an idle session is kept (default 60)
+    SMTP_MAX_MESSAGES               messages sent over one session before it is renewed (default 100)
+    SMTP_TIMEOUT                    socket timeout, also the wait for a free session (default 30)
+"""
+import logging
+import os
+import smtplib
+import threading
+import time
+from contextlib import contextmanager
+
+from backend import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class SMTPPoolError(Exception):
+    """Raised when no SMTP session became available in time."""
+
+
+def _needs_reconnect(error):
+    """Whether an error means the session is unusable, rather than the message being rejected."""
+    if isinstance(error, smtplib.SMTPServerDisconnected):
+        return True
+    if isinstance(error, smtplib.SMTPResponseException):
+        # 421: service not available, the server is closing the connection
+        return error.smtp_code == 421
+    # smtplib errors are OSErrors too, anything else here is a socket error
+    return isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)
+
+
+class SMTPPool:
+    """Thread-safe pool of logged-in smtplib.SMTP sessions."""
+
+    def __init__(self, host, port, username, password, max_sessions=2,
+                 idle_timeout=60.0, max_messages=100, timeout=30.0):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.max_messages = max_messages
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_sessions)
+        self._idle = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._connects = 0
+        self._messages = 0
+
+    def _connect(self):
+        session = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            session.starttls()
+            session.login(self.username, self.password)
+        except Exception:
+            self._close(session)
+            raise
+        session.messages_sent = 0
+        with self._lock:
+            self._connects += 1
+        return session
+
+    @staticmethod
+    def _close(session):
+        try:
+            session.quit()
+        except Exception:
+            try:
+                session.close()
+            except Exception:
+                pass
+
+    def _checkout(self):
+        """Takes a free session slot and returns an idle session, or a new one."""
+        if not self._slots.acquire(timeout=self.timeout):
+            raise SMTPPoolError("Timed out waiting for a free SMTP session")
+        try:
+            while True:
+                with self._lock:
+                    if not self._idle:
+                        break
+                    session, last_used = self._idle.pop()
+                if time.monotonic() - last_used < self.idle_timeout:
+                    return session
+                # The server has probably dropped it already
+                self._close(session)
+            return self._connect()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _checkin(self, session, broken=False):
+        if broken or session.messages_sent >= self.max_messages:
+            self._close(session)
+        else:
+            with self._lock:
+                self._idle.append((session, time.monotonic()))
+        self._slots.release()
+
+    @contextmanager
+    def batch(self):
+        """
+        Keeps one session for the calling thread while the block runs, so that
+        consecutive send() calls go out over the same connection. The session
+        is taken when the block is entered, so a server that cannot be reached
+        or rejects the login fails the batch before anything is sent.
+        """
+        if getattr(self._local, 'pinned', False):
+            yield
+            return
+        self._local.pinned = True
+        self._local.session = None
+        try:
+            self._local.session = self._checkout()
+            yield
+        finally:
+            session = self._local.session
+            self._local.pinned = False
+            self._local.session = None
+            if session is not None:
+                self._checkin(session)
+
+    def send(self, msg, from_addr, to_addrs):
+        """
+        Sends an email.message.Message. If the session turns out to be dead it
+        is replaced and the message is sent once more over a new connection.
+        """
+        with metrics.timed(metrics.SMTP_SEND_SECONDS):
+            self._send(msg, from_addr, to_addrs)
+
+    def _send(self, msg, from_addr, to_addrs):
+        pinned = getattr(self._local, 'pinned', False)
+        text = msg.as_string()
+        for attempt in (1, 2):
+            session = self._local.session if pinned and self._local.session else self._checkout()
+            if pinned:
+                self._local.session = session
+            try:
+                session.sendmail(from_addr, to_addrs, text)
+            except Exception as e:
+                reconnect = _needs_reconnect(e)
+                if reconnect or not pinned:
+                    if pinned:
+                        self._local.session = None
+                    self._checkin(session, broken=reconnect)
+                if reconnect and attempt == 1:
+                    logger.warning("SMTP session lost (%s), reconnecting", e)
+                    continue
+                raise
+
+            session.messages_sent += 1
+            with self._lock:
+                self._messages += 1
+            if not pinned:
+                self._checkin(session)
+            elif session.messages_sent >= self.max_messages:
+                self._local.session = None
+                self._checkin(session)
+            return
+
+    def stats(self):
+        """Session reuse of this pool: connects per message sent shows how well it works."""
+        with self._lock:
+            return {
+                'max_sessions': self.max_sessions,
+                'idle': len(self._idle),
+                'connects': self._connects,
+                'messages': self._messages
+            }
+
+    def close(self):
+        """Closes all idle sessions."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for session, _ in idle:
+            self._close(session)
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_smtp_pool():
+    """
+    Returns this process's SMTP pool, creating it on first use. Sessions are
+    not shared across a fork, each gunicorn worker opens its own.
+    """
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = SMTPPool(
+                host=os.getenv('SMTP_SERVER', 'smtp.gmail.com'),
+                port=int(os.getenv('SMTP_PORT', '587')),
+                username=os.getenv('EMAIL_ADDRESS'),
+                password=os.getenv('EMAIL_PASSWORD'),
+                max_sessions=int(os.getenv('SMTP_MAX_SESSIONS', '2')),
+                idle_timeout=float(os.getenv('SMTP_IDLE_TIMEOUT', '60')),
+                max_messages=int(os.getenv('SMTP_MAX_MESSAGES', '100')),
+                timeout=float(os.getenv('SMTP_TIMEOUT', '30'))
+            )
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def current_smtp_pool():
+    """Returns this process's SMTP pool if it has been created, without creating it."""
+    with _pool_lock:
+        return _pool if _pool_pid == os.getpid() else None
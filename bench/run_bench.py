@@ -0,0 +1,280 @@
+"""
+HTTP load test and latency benchmark for ChatUp.
+
+Starts the mock LLM server (backend/mock_llm_server.py) and the app
+(bench/serve_app.py, backed by mongomock) as subprocesses, then drives
+/register, /login, /chat, /chat-history and the static assets at the given
+concurrency. For every endpoint it reports p50/p95/p99 latency, throughput and
+errors, and saves the results as JSON so runs can be compared across commits.
+
+    pip install -r bench/requirements.txt
+    python bench/run_bench.py --concurrency 20 --requests 200
+    python bench/run_bench.py --compare bench/results/<earlier run>.json
+"""
+import argparse
+import json
+import math
+import os
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(PROJECT_ROOT, 'bench', 'results')
+SEARCH_CACHE_PATH = os.path.join(RESULTS_DIR, 'bench-search-cache.sqlite3')
+
+STATIC_ASSETS = ['/', '/css/style.css', '/js/auth.js', '/js/chat.js', '/images/Logo.png']
+
+ENDPOINTS = ['register', 'login', 'chat', 'chat-history', 'static']
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    # Smallest value with at least fraction of the samples at or below it. The
+    # rounding keeps float error (0.07 * 100 = 7.000000000000001) off the rank.
+    rank = math.ceil(round(fraction * len(sorted_values), 9))
+    index = max(0, min(len(sorted_values) - 1, rank - 1))
+    return sorted_values[index]
+
+
+def summarize(name, latencies, errors, wall_time):
+    latencies = sorted(latencies)
+    total = len(latencies) + errors
+
+    def ms(value):
+        return round(value * 1000, 2) if value is not None else None
+
+    return {
+        'endpoint': name,
+        'requests': total,
+        'errors': errors,
+        'error_rate': round(errors / total, 4) if total else 0.0,
+        'throughput_rps': round(total / wall_time, 2) if wall_time else 0.0,
+        'mean_ms': ms(sum(latencies) / len(latencies)) if latencies else None,
+        'p50_ms': ms(percentile(latencies, 0.50)),
+        'p95_ms': ms(percentile(latencies, 0.95)),
+        'p99_ms': ms(percentile(latencies, 0.99)),
+        'max_ms': ms(latencies[-1]) if latencies else None
+    }
+
+
+def run_phase(name, request_fn, total, concurrency):
+    """Calls request_fn(i, session) total times from concurrency threads."""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    local = threading.local()
+
+    def one(i):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        start = time.perf_counter()
+        try:
+            response = request_fn(i, session)
+            ok = response.status_code < 400
+        except requests.RequestException:
+            ok = False
+        elapsed = time.perf_counter() - start
+        with lock:
+            if ok:
+                latencies.append(elapsed)
+            else:
+                errors[0] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, range(total)))
+    return summarize(name, latencies, errors[0], time.perf_counter() - started)
+
+
+def wait_until_up(url, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(url, timeout=1).status_code < 500:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(0.25)
+    return False
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_ROOT, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def start_processes(args):
+    env = dict(os.environ)
+    env.update({
+        'LLM_PROVIDER': 'mock',
+        'SEARCH_PROVIDER': 'mock',
+        'MOCK_LLM_URL': f"http://127.0.0.1:{args.llm_port}/v1/",
+        'MOCK_SEARCH_LATENCY': args.search_latency,
+        'SEARCH_CACHE_PATH': SEARCH_CACHE_PATH,
+        'RESPONSE_CACHE_ENABLED': 'true' if args.response_cache else 'false',
+        'PYTHONUNBUFFERED': '1'
+    })
+    # The mock LLM has no key check, make sure we never hit the real APIs
+    env.pop('GEMINI_API_KEY', None)
+    env.pop('TAVILY_API_KEY', None)
+
+    log = open(os.path.join(RESULTS_DIR, 'bench-server.log'), 'w')
+    llm = subprocess.Popen(
+        [sys.executable, '-m', 'backend.mock_llm_server', '--port', str(args.llm_port),
+         '--latency', args.llm_latency, '--tool-rate', str(args.tool_rate)],
+        cwd=PROJECT_ROOT, env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+    if args.server == 'gunicorn':
+        # mongomock lives inside one process, so a single worker keeps the data consistent
+        command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--workers', '1',
+                   '--bind', f"127.0.0.1:{args.port}", 'bench.serve_app:app']
+    else:
+        command = [sys.executable, os.path.join('bench', 'serve_app.py'), '--port', str(args.port)]
+    app = subprocess.Popen(command, cwd=PROJECT_ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    return [llm, app], log
+
+
+def run_benchmark(args):
+    base = f"http://127.0.0.1:{args.port}"
+    run_id = uuid.uuid4().hex[:8]
+    results = []
+
+    # Users that the login, chat and chat history scenarios share
+    users = []
+    for i in range(max(1, args.concurrency)):
+        email = f"bench-{run_id}-{i}@example.com"
+        requests.post(f"{base}/register", json={'name': f"Bench {i}", 'email': email, 'password': 'benchpass'})
+        requests.post(f"{base}/__bench__/verify", json={'email': email})
+        users.append(email)
+
+    def user(i):
+        return users[i % len(users)]
+
+    auth = {'Authorization': 'Bearer bench-token'}
+
+    scenarios = {
+        'register': lambda i, s: s.post(f"{base}/register", json={
+            'name': 'Bench', 'email': f"bench-{run_id}-new-{i}@example.com", 'password': 'benchpass'
+        }),
+        'login': lambda i, s: s.post(f"{base}/login", json={'email': user(i), 'password': 'benchpass'}),
+        'chat': lambda i, s: s.post(f"{base}/chat", json={
+            'message': f"Benchmark question {i % args.distinct_prompts}", 'userId': user(i)
+        }),
+        'chat-history': lambda i, s: s.get(f"{base}/chat-history", params={'user_email': user(i)}, headers=auth),
+    }
+
+    for name in args.endpoints:
+        if name == 'static':
+            for asset in STATIC_ASSETS:
+                result = run_phase(
+                    f"GET {asset}",
+                    lambda i, s, asset=asset: s.get(f"{base}{asset}"),
+                    args.requests, args.concurrency
+                )
+                results.append(result)
+                print_result(result)
+            continue
+        result = run_phase(name, scenarios[name], args.requests, args.concurrency)
+        results.append(result)
+        print_result(result)
+    return results
+
+
+def print_result(result):
+    print(f"{result['endpoint']:<22} n={result['requests']:<6} err={result['errors']:<5} "
+          f"rps={result['throughput_rps']:<9} p50={result['p50_ms']}ms p95={result['p95_ms']}ms "
+          f"p99={result['p99_ms']}ms")
+
+
+def compare(current, previous_path):
+    with open(previous_path) as f:
+        previous = {r['endpoint']: r for r in json.load(f)['results']}
+    print(f"\nCompared with {previous_path}:")
+    for result in current:
+        before = previous.get(result['endpoint'])
+        if not before:
+            continue
+        deltas = []
+        for key in ('p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps'):
+            if result[key] is not None and before.get(key):
+                change = 100.0 * (result[key] - before[key]) / before[key]
+                deltas.append(f"{key}={change:+.1f}%")
+        print(f"{result['endpoint']:<22} " + ' '.join(deltas))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ChatUp HTTP load test and latency benchmark')
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--requests', type=int, default=100, help='requests per endpoint')
+    parser.add_argument('--endpoints', default=','.join(ENDPOINTS),
+                        help=f"comma separated subset of {','.join(ENDPOINTS)}")
+    parser.add_argument('--server', choices=['werkzeug', 'gunicorn'], default='werkzeug')
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--llm-port', type=int, default=8095)
+    parser.add_argument('--llm-latency', default='lognormal:0.8,0.4',
+                        help='mock time to first token distribution')
+    parser.add_argument('--search-latency', default='lognormal:0.5,0.5')
+    parser.add_argument('--tool-rate', type=float, default=0.2, help='share of chats that call search_web')
+    parser.add_argument('--distinct-prompts', type=int, default=1000000,
+                        help='number of distinct chat prompts, lower it to exercise the response cache')
+    parser.add_argument('--response-cache', action='store_true', help='keep the response cache enabled')
+    parser.add_argument('--output', help='JSON results file (default bench/results/<time>-<commit>.json)')
+    parser.add_argument('--compare', help='earlier JSON results to compare with')
+    args = parser.parse_args()
+    args.endpoints = [name.strip() for name in args.endpoints.split(',') if name.strip()]
+    unknown = set(args.endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(sorted(unknown))}")
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    # Start from a cold search cache on every run
+    if os.path.exists(SEARCH_CACHE_PATH):
+        os.remove(SEARCH_CACHE_PATH)
+    processes, log = start_processes(args)
+    try:
+        if not wait_until_up(f"http://127.0.0.1:{args.port}/health", timeout=60):
+            print("Server did not start, see bench/results/bench-server.log")
+            sys.exit(1)
+        results = run_benchmark(args)
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        log.close()
+
+    commit = git_commit()
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{commit}.json"
+    )
+    with open(output, 'w') as f:
+        json.dump({
+            'commit': commit,
+            'timestamp': datetime.now().isoformat(),
+            'config': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+            'results': results
+        }, f, indent=2)
+    print(f"\nResults saved to {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""
+Runs server.py's app against an in-memory MongoDB stand-in, for benchmarks.
+
+pymongo.MongoClient is replaced by mongomock before the app is imported, so no
+database is needed. A bench-only route marks registered users as verified so
+the login and chat scenarios can use them. Started by bench/run_bench.py.
+
+    python bench/serve_app.py --port 5055
+    gunicorn -c gunicorn.conf.py --workers 1 bench.serve_app:app
+"""
+import argparse
+import os
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+# Static files are served relative to the working directory
+os.chdir(PROJECT_ROOT)
+
+import mongomock
+import pymongo
+
+pymongo.MongoClient = mongomock.MongoClient
+
+import server
+from flask import request, jsonify
+
+app = server.app
+
+
+@app.route('/__bench__/verify', methods=['POST'])
+def bench_verify_user():
+    email = request.get_json().get('email')
+    result = server.user_collection.update_one({'email': email}, {'$set': {'email_verified': True}})
+    return jsonify({'success': result.matched_count == 1}), 200
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve ChatUp against mongomock for benchmarks')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5055)
+    args = parser.parse_args()
+    app.run(host=args.host, port=args.port, threaded=True, debug=False, use_reloader=False)
+
+
+if __name__ == "__main__":
+    main()
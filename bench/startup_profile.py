@@ -0,0 +1,124 @@
+"""
+Cold start profile of the app.
+
+Imports server.py in a fresh interpreter under `python -X importtime` and
+reports the total import time, the slowest modules, and any module that is
+meant to load on first use only (DEFERRED_MODULES) but was imported anyway.
+Then times the steps a gunicorn worker runs before it takes traffic:
+creating the MongoDB client, the first round trip (server selection, TCP,
+TLS and auth), index creation and, with --agents, the agent warm-up.
+
+    python bench/startup_profile.py
+    python bench/startup_profile.py --top 30 --agents --json bench/results/startup.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Loaded with the first email, agent run or web search, never by importing the app
+DEFERRED_MODULES = ['smtplib', 'email.mime.text', 'email.mime.multipart', 'agents', 'openai', 'tavily']
+
+
+def import_profile(module='server'):
+    """
+    Imports module in a new interpreter with -X importtime. Returns a list of
+    (name, self_us, cumulative_us, depth) in import order.
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=PROJECT_ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        universal_newlines=True, check=False
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip(' '))) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    if result.returncode != 0 and not rows:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+    return rows
+
+
+def timed(label, function, phases):
+    started = time.perf_counter()
+    try:
+        result = function()
+        error = None
+    except Exception as e:
+        result, error = None, str(e)
+    phases.append({'phase': label, 'ms': round((time.perf_counter() - started) * 1000, 1), 'error': error})
+    return result
+
+
+def startup_phases(agents=False):
+    """Times the app import and the per-worker startup steps in this process."""
+    sys.path.insert(0, PROJECT_ROOT)
+    os.chdir(PROJECT_ROOT)
+    phases = []
+    server = timed('import server', lambda: __import__('server'), phases)
+    if server is None:
+        return phases
+
+    from backend import mongo
+    from backend.indexes import ensure_indexes
+    client = timed('create MongoDB client', mongo.get_client, phases)
+    if client is not None:
+        timed('first MongoDB round trip (ping)', lambda: client.admin.command('ping'), phases)
+        timed('ensure indexes', lambda: ensure_indexes(mongo.COLLECTIONS), phases)
+    if agents:
+        timed('agent warm-up', server.warm_up_agents, phases)
+    return phases
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Profile the cold start of the app')
+    parser.add_argument('--top', type=int, default=15, help='slowest modules to list')
+    parser.add_argument('--agents', action='store_true', help='also time the agent warm-up')
+    parser.add_argument('--json', help='also write the profile to this file')
+    args = parser.parse_args()
+
+    rows = import_profile()
+    total_us = next((cumulative for name, _, cumulative, depth in rows if name == 'server' and depth == 0), 0)
+    print(f"Import of server.py: {total_us / 1000:.1f} ms (cumulative, -X importtime)")
+
+    print("\nSlowest top-level imports (cumulative ms):")
+    top_level = sorted((row for row in rows if row[3] <= 1 and row[0] != 'server'), key=lambda row: -row[2])
+    for name, _, cumulative_us, depth in top_level[:args.top]:
+        print(f"  {cumulative_us / 1000:8.1f}  {'  ' * depth}{name}")
+
+    imported = {name for name, _, _, _ in rows}
+    eager = [name for name in DEFERRED_MODULES if name in imported]
+    if eager:
+        print(f"\nLoaded at import but meant to load on first use: {', '.join(eager)}")
+    else:
+        print(f"\nNone of {', '.join(DEFERRED_MODULES)} is loaded at import")
+
+    print("\nWorker startup:")
+    phases = startup_phases(agents=args.agents)
+    for phase in phases:
+        suffix = f"  (failed: {phase['error'][:120]})" if phase['error'] else ''
+        print(f"  {phase['ms']:8.1f} ms  {phase['phase']}{suffix}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                'import_ms': round(total_us / 1000, 1),
+                'modules': [
+                    {'module': name, 'self_ms': self_us / 1000, 'cumulative_ms': cumulative_us / 1000}
+                    for name, self_us, cumulative_us, _ in sorted(rows, key=lambda row: -row[2])[:args.top]
+                ],
+                'eagerly_loaded': eager,
+                'phases': phases
+            }, f, indent=2)
+        print(f"\nProfile saved to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,8 +5,9 @@
 if [ -z "$PORT" ]; then
     PORT=8000
 fi
+export PORT
 
 echo "Starting server on port $PORT"
 
 # Start the application
-exec python start_server.py
\ No newline at end of file
+exec gunicorn -c gunicorn.conf.py server:app
\ No newline at end of file
@@ -0,0 +1,43 @@
+# Gunicorn configuration for ChatUp
+# Run with: gunicorn server:app
+import os
+import shutil
+import tempfile
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', '2'))
+
+# Threaded workers: requests mostly wait on the agent, so threads are cheap here
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', '16'))
+timeout = 120
+
+# Workers, and the agent processes they start, write their Prometheus samples
+# to this directory and /metrics aggregates them (see backend/metrics.py).
+# Must be set before prometheus_client is imported.
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'chatup-metrics'))
+
+
+def on_starting(server):
+    # Samples of a previous run would be added to this one's
+    metrics_dir = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    # Drop the in-flight gauges of a dead worker
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def post_worker_init(worker):
+    # Start the agent workers and open the model/search API connections
+    # in each worker before it takes traffic
+    from server import warm_up_agents, email_outbox
+    from backend import mongo
+    warm_up_agents()
+    # This worker's own MongoDB client, never one inherited over fork()
+    mongo.get_client()
+    # Drain email queued before this worker started
+    email_outbox.start()
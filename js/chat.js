@@ -16,6 +16,9 @@ document.addEventListener('DOMContentLoaded', function() {
     // Current chat ID
     let currentChatId = null;
     
+    // Until when the server asked us (Retry-After) not to send another message
+    let busyUntil = 0;
+    
     // Load user's chat history from database
     loadUserChatHistory();
     
@@ -275,16 +278,33 @@ document.addEventListener('DOMContentLoaded', function() {
         // so this function is kept for compatibility but doesn't save to localStorage
     }
     
-    // Function to load chat history for current user from database
-    async function loadUserChatHistory() {
+    // Cursor of the next page of the chat list, null when everything is loaded
+    let chatListCursor = null;
+    let loadingChatList = false;
+    
+    // Cursor of the next (older) page of messages of the open chat
+    let messagesCursor = null;
+    let loadingMessages = false;
+    
+    // Function to load chat history for current user from database.
+    // Only chat summaries are fetched, one page at a time; pass loadMore to append the next page.
+    async function loadUserChatHistory(loadMore = false) {
         const userEmail = localStorage.getItem('userEmail');
         if (!userEmail) {
             console.error('No user email available to load chat history');
             return;
         }
+        if (loadingChatList || (loadMore && !chatListCursor)) {
+            return;
+        }
         
+        loadingChatList = true;
         try {
-            const response = await fetch(`/chat-history?user_email=${encodeURIComponent(userEmail)}`, {
+            let url = `/chats?user_email=${encodeURIComponent(userEmail)}`;
+            if (loadMore) {
+                url += `&cursor=${encodeURIComponent(chatListCursor)}`;
+            }
+            const response = await fetch(url, {
                 method: 'GET',
                 headers: {
                     'Content-Type': 'application/json',
@@ -299,22 +319,66 @@ document.addEventListener('DOMContentLoaded', function() {
             const data = await response.json();
             
             if (data.success) {
-                // Store the chat history in localStorage under the user's key
+                // Store the chat summaries in localStorage under the user's key
                 const userChatHistoryKey = `chat_history_${userEmail}`;
-                localStorage.setItem(userChatHistoryKey, JSON.stringify(data.chats));
+                const chats = loadMore
+                    ? JSON.parse(localStorage.getItem(userChatHistoryKey) || '[]').concat(data.chats)
+                    : data.chats;
+                localStorage.setItem(userChatHistoryKey, JSON.stringify(chats));
+                chatListCursor = data.next_cursor;
                 
                 // Update the UI with chat history
                 updateChatHistoryList();
             }
         } catch (error) {
             console.error('Error loading chat history:', error);
+        } finally {
+            loadingChatList = false;
         }
     }
     
+    // Load the next page of chats when the sidebar list is scrolled to the bottom
+    if (chatHistoryList) {
+        chatHistoryList.addEventListener('scroll', function() {
+            if (chatHistoryList.scrollTop + chatHistoryList.clientHeight >= chatHistoryList.scrollHeight - 50) {
+                loadUserChatHistory(true);
+            }
+        });
+    }
+    
+    // Fetches one page of a chat's messages, older than the cursor if one is given
+    async function fetchChatMessages(chatId, cursor) {
+        const userEmail = localStorage.getItem('userEmail');
+        let url = `/chats/${encodeURIComponent(chatId)}/messages?user_email=${encodeURIComponent(userEmail)}`;
+        if (cursor) {
+            url += `&cursor=${encodeURIComponent(cursor)}`;
+        }
+        const response = await fetch(url, {
+            method: 'GET',
+            headers: {
+                'Content-Type': 'application/json',
+                'Authorization': `Bearer ${localStorage.getItem('authToken')}`
+            }
+        });
+        if (!response.ok) {
+            throw new Error(`Server error: ${response.status}`);
+        }
+        return response.json();
+    }
+    
+    function createMessageElement(msg) {
+        // Use the original addMessage logic to avoid saving to history again
+        const messageDiv = document.createElement('div');
+        messageDiv.classList.add('message', msg.sender);
+        messageDiv.textContent = msg.text;
+        return messageDiv;
+    }
+    
     // Function to load a specific chat for the user
     async function loadChat(chatId) {
         currentChatId = chatId;
         localStorage.setItem('currentChatId', chatId);
+        messagesCursor = null;
         
         // Clear current chat display
         clearChat();
@@ -326,23 +390,33 @@ document.addEventListener('DOMContentLoaded', function() {
             return;
         }
         
-        // Load chat messages from stored history
-        const userChatHistoryKey = `chat_history_${userEmail}`;
-        const userChats = JSON.parse(localStorage.getItem(userChatHistoryKey) || '[]');
-        const chat = userChats.find(c => c.id === chatId);
+        // Update active chat in the history list
+        updateChatHistoryList();
         
-        if (chat && chat.messages && chat.messages.length > 0) {
+        // Load the most recent page of messages from the server
+        let data;
+        try {
+            data = await fetchChatMessages(chatId);
+        } catch (error) {
+            console.error('Error loading chat messages:', error);
+            return;
+        }
+        // Another chat was opened while this one was loading
+        if (currentChatId !== chatId) {
+            return;
+        }
+        
+        if (data.success && data.messages.length > 0) {
+            messagesCursor = data.next_cursor;
+            
             // Hide welcome message
             if (welcomeMessage) {
                 welcomeMessage.style.display = 'none';
             }
             
             // Add messages to the chat container
-            chat.messages.forEach(msg => {
-                // Use the original addMessage logic to avoid saving to history again
-                const messageDiv = document.createElement('div');
-                messageDiv.classList.add('message', msg.sender);
-                messageDiv.textContent = msg.text;
+            data.messages.forEach(msg => {
+                const messageDiv = createMessageElement(msg);
                 messagesContainer.appendChild(messageDiv);
                 
                 // Add visual effect for new messages
@@ -360,9 +434,42 @@ document.addEventListener('DOMContentLoaded', function() {
                 welcomeMessage.style.display = 'flex';
             }
         }
-        
-        // Update active chat in the history list
-        updateChatHistoryList();
+    }
+    
+    // Load older messages of the open chat when scrolled to the top
+    async function loadOlderMessages() {
+        if (!currentChatId || !messagesCursor || loadingMessages) {
+            return;
+        }
+        const chatId = currentChatId;
+        loadingMessages = true;
+        try {
+            const data = await fetchChatMessages(chatId, messagesCursor);
+            if (currentChatId !== chatId || !data.success) {
+                return;
+            }
+            messagesCursor = data.next_cursor;
+            
+            // Prepend while keeping the visible messages in place
+            const previousHeight = messagesContainer.scrollHeight;
+            const firstMessage = messagesContainer.querySelector('.message');
+            data.messages.forEach(msg => {
+                messagesContainer.insertBefore(createMessageElement(msg), firstMessage);
+            });
+            messagesContainer.scrollTop += messagesContainer.scrollHeight - previousHeight;
+        } catch (error) {
+            console.error('Error loading older messages:', error);
+        } finally {
+            loadingMessages = false;
+        }
+    }
+    
+    if (messagesContainer) {
+        messagesContainer.addEventListener('scroll', function() {
+            if (messagesContainer.scrollTop < 50) {
+                loadOlderMessages();
+            }
+        });
     }
     
     // Function to create a new chat for the user
@@ -592,6 +699,8 @@ document.addEventListener('DOMContentLoaded', function() {
         
         // Save the message to chat history if we have a current chat
         saveMessageToChatHistory(text, sender);
+        
+        return messageDiv;
     }
     
     // Make functions available globally so they can be used by other scripts
@@ -640,6 +749,13 @@ document.addEventListener('DOMContentLoaded', function() {
     async function sendMessage() {
         const message = messageInput.value.trim();
         
+        // The server said it is saturated, keep the message in the input until it can take it
+        const waitSeconds = Math.ceil((busyUntil - Date.now()) / 1000);
+        if (message && waitSeconds > 0) {
+            showNotification(`The assistant is busy. Please try again in ${waitSeconds} seconds.`, 'info');
+            return;
+        }
+        
         if (message) {
             // Add user message to chat
             addMessage(message, 'user');
@@ -652,12 +768,53 @@ document.addEventListener('DOMContentLoaded', function() {
             showTypingIndicator();
             
             try {
-                // Get bot response from backend agent
-                const botResponse = await sendToBackend(message);
+                // Stream the bot response from the backend agent, rendering text as it arrives
+                let botMessageDiv = null;
+                let streamed = false;
                 
-                // Hide typing indicator and add bot response
-                hideTypingIndicator();
-                addMessage(botResponse, 'bot');
+                try {
+                    streamed = await streamFromBackend(message, {
+                        onDelta: function(text) {
+                            if (!botMessageDiv) {
+                                // First chunk of the answer replaces the typing indicator
+                                hideTypingIndicator();
+                                botMessageDiv = addMessage('', 'bot');
+                            }
+                            botMessageDiv.textContent += text;
+                            messagesContainer.scrollTop = messagesContainer.scrollHeight;
+                        },
+                        onBusy: function(text) {
+                            hideTypingIndicator();
+                            botMessageDiv = addMessage(text, 'bot');
+                        },
+                        onToolStart: function(tool) {
+                            if (tool === 'search_web') {
+                                showNotification('Searching the web...', 'info');
+                            }
+                        },
+                        onDone: function(data) {
+                            hideTypingIndicator();
+                            if (!botMessageDiv) {
+                                botMessageDiv = addMessage('', 'bot');
+                            }
+                            // The final response is authoritative (e.g. error messages are never streamed)
+                            botMessageDiv.textContent = data.response;
+                        }
+                    });
+                } catch (streamError) {
+                    console.error('Streaming failed, falling back to /chat:', streamError);
+                }
+                
+                if (!streamed && !botMessageDiv) {
+                    // Get bot response from backend agent
+                    const botResponse = await sendToBackend(message);
+                    
+                    // Hide typing indicator and add bot response
+                    hideTypingIndicator();
+                    addMessage(botResponse, 'bot');
+                } else if (!streamed) {
+                    hideTypingIndicator();
+                }
                 
                 // After getting response, reload the chat history to update it with the new conversation
                 setTimeout(() => {
@@ -818,6 +975,11 @@ document.addEventListener('DOMContentLoaded', function() {
                 })
             });
             
+            // The server is saturated and asks us to retry later
+            if (response.status === 429 || response.status === 503) {
+                return await readBusyResponse(response);
+            }
+            
             if (!response.ok) {
                 throw new Error(`Server error: ${response.status}`);
             }
@@ -837,6 +999,97 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
     
+    // Reads a 429/503 busy answer: remembers its Retry-After and returns the message to show
+    async function readBusyResponse(response) {
+        const retryAfter = parseInt(response.headers.get('Retry-After'), 10);
+        busyUntil = Date.now() + (isNaN(retryAfter) ? 5 : retryAfter) * 1000;
+        try {
+            const busyData = await response.json();
+            if (busyData.response) {
+                return busyData.response;
+            }
+        } catch (error) {
+            // Not JSON, e.g. from a proxy in front of the app
+        }
+        return "The assistant is busy right now. Please try again in a few seconds.";
+    }
+    
+    // Function to send message to the streaming endpoint and handle Server-Sent Events
+    // Returns true once the final "done" event has been received, or the server answered
+    // that it is busy; in both cases there is nothing left to fall back to /chat for
+    async function streamFromBackend(message, handlers) {
+        const response = await fetch('/chat/stream', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'Accept': 'text/event-stream',
+                'Authorization': `Bearer ${localStorage.getItem('authToken')}` // Include auth token
+            },
+            body: JSON.stringify({
+                message: message,
+                userId: localStorage.getItem('userEmail'),  // Use email to identify user
+                chatId: currentChatId  // Include current chat ID to add to existing chat
+            })
+        });
+        
+        // Retrying on /chat would only add to the load that got us rejected
+        if (response.status === 429 || response.status === 503) {
+            handlers.onBusy(await readBusyResponse(response));
+            return true;
+        }
+        
+        if (!response.ok || !response.body) {
+            throw new Error(`Server error: ${response.status}`);
+        }
+        
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let finished = false;
+        
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            
+            buffer += decoder.decode(value, { stream: true });
+            
+            // Events are separated by a blank line
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const rawEvent = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                
+                let eventName = 'message';
+                let eventData = '';
+                rawEvent.split('\n').forEach(line => {
+                    if (line.startsWith('event: ')) {
+                        eventName = line.slice(7);
+                    } else if (line.startsWith('data: ')) {
+                        eventData += line.slice(6);
+                    }
+                });
+                
+                const data = eventData ? JSON.parse(eventData) : {};
+                
+                if (eventName === 'delta') {
+                    handlers.onDelta(data.text);
+                } else if (eventName === 'tool_start') {
+                    handlers.onToolStart(data.tool);
+                } else if (eventName === 'done') {
+                    // Update current chat ID with the one returned from the server
+                    if (data.chatId && !currentChatId) {
+                        currentChatId = data.chatId;
+                        localStorage.setItem('currentChatId', currentChatId);
+                    }
+                    handlers.onDone(data);
+                    finished = true;
+                }
+            }
+        }
+        
+        return finished;
+    }
+    
     // Copy protection functionality - replaces copied text with restriction message
     document.addEventListener('copy', function(e) {
         // Prevent the default copy behavior
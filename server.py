@@ -1,71 +1,81 @@
-from flask import Flask, request, jsonify, send_from_directory, send_file
-from pymongo import MongoClient
+from flask import Flask, request, jsonify, send_from_directory, send_file, Response, stream_with_context, render_template
 from bson import ObjectId
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
 import os
-from flask_cors import CORS
-import subprocess
 import sys
+from flask_cors import CORS
 import secrets
+import json
+import base64
 
 # Load environment variables from .env file
 from dotenv import load_dotenv
 load_dotenv()
 
+# JSON logs written by a background thread, see backend/log.py
+import logging
+from backend import log
+log.setup_logging()
+logger = logging.getLogger(__name__)
+
 app = Flask(__name__)
 CORS(app)  # Enable CORS for frontend communication
 
-# MongoDB Configuration
-import os
-from urllib.parse import quote_plus
-MONGO_URI = os.getenv("MONGODB_URI", "mongodb://localhost:27017/")
-DB_NAME = os.getenv("DB_NAME", "Credentials")
-COLLECTION_NAME = os.getenv("COLLECTION_NAME", "User_info")
-
-# If using MongoDB Atlas and credentials are in the connection string, ensure they are properly encoded
-if "mongodb+srv://" in MONGO_URI:
-    # Parse the MongoDB Atlas connection string to properly encode credentials
-    from urllib.parse import urlparse, urlunparse
-    parsed = urlparse(MONGO_URI)
-    
-    # Extract username and password
-    username = parsed.username
-    password = parsed.password
-    
-    # If credentials exist, re-encode them properly
-    if username and password:
-        # Create new netloc with properly encoded credentials
-        encoded_username = quote_plus(username)
-        encoded_password = quote_plus(password)
-        encoded_netloc = f"{encoded_username}:{encoded_password}@{parsed.hostname}"
-        
-        # If there are additional hosts in the netloc (for clusters), preserve them
-        if parsed.port:
-            encoded_netloc += f":{parsed.port}"
-        
-        # Reconstruct the URL with encoded credentials
-        MONGO_URI = parsed._replace(netloc=encoded_netloc).geturl()
-
-# Connect to MongoDB with SSL settings for Atlas
-try:
-    client = MongoClient(MONGO_URI, 
-                         tls=True, 
-                         tlsAllowInvalidCertificates=True,
-                         serverSelectionTimeoutMS=30000)
-    db = client[DB_NAME]
-    user_collection = db[COLLECTION_NAME]
-    # Create a separate collection for chat history
-    chat_history_collection = db['Chat_History']
-    print("Connected to MongoDB successfully")
-    print(f"Database: {DB_NAME}")
-    print(f"Collection: {COLLECTION_NAME}")
-    print(f"Available collections: {db.list_collection_names()}")
-except Exception as e:
-    print(f"Error connecting to MongoDB: {e}")
-    # Exit the application if database connection fails
-    import sys
-    sys.exit(1)
+# Behind TRUSTED_PROXY_COUNT reverse proxies (1 on Railway) request.remote_addr
+# is the client address those proxies appended to X-Forwarded-For. Without
+# proxies the header is ignored, clients could put anything in it.
+from werkzeug.middleware.proxy_fix import ProxyFix
+TRUSTED_PROXY_COUNT = int(os.getenv('TRUSTED_PROXY_COUNT', '0'))
+if TRUSTED_PROXY_COUNT:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_COUNT)
+
+# Request ids for log correlation, and one access log line per request
+log.init_app(app)
+
+# Compresses large JSON and HTML responses (gzip, or brotli when installed)
+from backend.compression import create_compressor
+compressor = create_compressor(app)
+
+# Prometheus latency histograms and in-flight gauges, served at /metrics
+from backend import metrics
+metrics.init_app(app)
+
+# Page and email templates live in templates/. They are compiled once here and
+# then served from Jinja's cache, only the variables are rendered per request.
+import mimetypes
+from backend import assets
+
+TEMPLATES = [
+    'verify_email.html',
+    'email/verification.txt',
+    'email/password_reset.txt',
+    'email/support.txt'
+]
+for template_name in TEMPLATES:
+    app.jinja_env.get_template(template_name)
+
+
+@app.template_global()
+def asset_url(path):
+    """URL of a static file: its content-hashed name after an asset build, else the file itself."""
+    hashed = assets.hashed_path(path)
+    if hashed:
+        return f"/{hashed}"
+    return f"/{path}"
+
+
+def render_email(template_name, **context):
+    """Renders an email body. Works outside a request, e.g. in the email outbox workers."""
+    return app.jinja_env.get_template(template_name).render(**context)
+
+# MongoDB collections. The client is created lazily in each worker process on
+# first use, see backend/mongo.py, so importing the app opens no connection.
+from backend import mongo
+user_collection = mongo.users
+chat_history_collection = mongo.chats
+chat_messages_collection = mongo.chat_messages
+email_outbox_collection = mongo.email_outbox
 
 
 # Registration endpoint
@@ -86,12 +96,12 @@ def register():
                 'message': 'All fields (name, email, password) are required'
             }), 400
         
-        print(f"Attempting to register user: {email}")
+        logger.info("Registration attempt", extra={'email': email})
         
         # Check if user already exists
         existing_user = user_collection.find_one({'email': email})
         if existing_user:
-            print(f"User already exists: {email}")
+            logger.info("Registration for an existing user", extra={'email': email})
             return jsonify({
                 'success': False, 
                 'message': 'User with this email already exists'
@@ -115,12 +125,12 @@ def register():
         
         # Insert user into database
         result = user_collection.insert_one(user_document)
-        print(f"User registered successfully: {email}, ID: {result.inserted_id}")
+        logger.info("User registered", extra={'email': email, 'user_id': str(result.inserted_id)})
         
-        # Send verification email
-        verification_sent = send_verification_email(email, name, user_document['verification_token'])
-        if not verification_sent:
-            print(f"Failed to send verification email to {email}")
+        # Queue the verification email, it is sent in the background
+        email_job_id = queue_email('verification', email=email, name=name, token=user_document['verification_token'])
+        if not email_job_id:
+            logger.warning("Could not queue the verification email", extra={'email': email})
             # We'll still return success but log the failure
             return jsonify({
                 'success': True,
@@ -139,6 +149,7 @@ def register():
                 'message': 'User registered successfully! Please check your email to verify your account.',
                 'name': name,
                 'email': email,
+                'emailJobId': email_job_id,
                 'data': {
                     'id': str(result.inserted_id),
                     'name': name,
@@ -147,7 +158,7 @@ def register():
             }), 201
         
     except Exception as e:
-        print(f"Registration error: {e}")
+        logger.exception("Registration error")
         return jsonify({
             'success': False,
             'message': 'Registration failed due to server error'
@@ -170,12 +181,12 @@ def login():
                 'message': 'Email and password are required'
             }), 400
         
-        print(f"Login attempt for: {email}")
+        logger.info("Login attempt", extra={'email': email})
         
         # Find user in database
         user = user_collection.find_one({'email': email})
         if not user:
-            print(f"User not found in database: {email}")
+            logger.info("Login for an unknown user", extra={'email': email})
             return jsonify({
                 'success': False,
                 'message': 'Invalid credentials'
@@ -183,7 +194,7 @@ def login():
         
         # Check if email is verified
         if not user.get('email_verified', False):
-            print(f"User {email} attempted login but email is not verified")
+            logger.info("Login with an unverified email", extra={'email': email})
             return jsonify({
                 'success': False,
                 'message': 'Please verify your email address before logging in. Check your email for a verification link.'
@@ -191,7 +202,7 @@ def login():
         
         # Check password
         if check_password_hash(user['password'], password):
-            print(f"Login successful for: {email}")
+            logger.info("Login successful", extra={'email': email})
             return jsonify({
                 'success': True,
                 'message': 'Login successful',
@@ -203,14 +214,14 @@ def login():
                 }
             }), 200
         else:
-            print(f"Password incorrect for: {email}")
+            logger.info("Login with a wrong password", extra={'email': email})
             return jsonify({
                 'success': False,
                 'message': 'Invalid credentials'
             }), 401
             
     except Exception as e:
-        print(f"Login error: {e}")
+        logger.exception("Login error")
         return jsonify({
             'success': False,
             'message': 'Login failed due to server error'
@@ -218,183 +229,257 @@ def login():
 
 
 
+# Prometheus scrape endpoint, aggregated over all worker processes
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    body, content_type = metrics.render()
+    return Response(body, mimetype=content_type.split(';')[0], content_type=content_type)
+
+# Liveness: the process is up and serving requests. No dependencies are
+# checked, a failing database must not get healthy replicas restarted.
+@app.route('/livez', methods=['GET'])
+def livez():
+    response = jsonify({'status': 'ok'})
+    response.headers['Cache-Control'] = 'no-store'
+    return response, 200
+
+# Readiness: whether this replica should get traffic, see backend/health.py.
+# 503 while MongoDB is unreachable, the agent workers are down or the agent
+# queue is close to full, so the load balancer routes around the replica.
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    result = readiness.result()
+    response = jsonify(dict(result, status='ready' if result['ready'] else 'not ready'))
+    response.headers['Cache-Control'] = 'no-store'
+    return response, 200 if result['ready'] else 503
+
 # Health check endpoint
 @app.route('/health', methods=['GET'])
 def health():
-    return jsonify({'status': 'Server is running', 'database': 'Connected'}), 200
-
-# Test database connection endpoint
+    database = readiness.result()['checks']['mongodb']
+    return jsonify({
+        'status': 'Server is running',
+        'database': 'Connected' if database['ok'] else 'Unavailable',
+        'mongo_pool': mongo.pool_stats(),
+        'agent_queue': agent_gate.stats(),
+        'agent_flights': agent_flights.stats(),
+        'response_cache': response_cache.stats(),
+        'smtp_pool': smtp_pool_stats(),
+        'log_records_dropped': log.dropped_records()
+    }), 200
+
+# Test database connection endpoint. Read-only: pings the server instead of
+# writing to the users collection.
 @app.route('/test-db', methods=['GET'])
 def test_db():
-    try:
-        # Insert a test document
-        test_doc = {
-            'test': 'connection',
-            'timestamp': datetime.now()
-        }
-        result = user_collection.insert_one(test_doc)
-        # Remove it immediately
-        user_collection.delete_one({'_id': result.inserted_id})
-        
-        return jsonify({
-            'success': True,
-            'message': 'Database connection working'
-        }), 200
-    except Exception as e:
-        print(f"DB test error: {e}")
+    ok, detail = mongo_ping(mongo.get_database())
+    if not ok:
+        logger.error("DB test failed: %s", detail)
         return jsonify({
             'success': False,
             'message': 'Database connection failed'
         }), 500
+    return jsonify({
+        'success': True,
+        'message': 'Database connection working',
+        'detail': detail
+    }), 200
+
+
+from backend.agent_pool import get_agent_pool, current_agent_pool, AgentPoolError, AgentPoolTimeout
+from backend.async_runner import run_agent as run_agent_in_loop, stream_agent as stream_agent_in_loop, warm_up as warm_up_event_loop, AgentRunError, AgentRunTimeout
+from backend.agent_config import AGENT_INSTRUCTIONS
+from backend.providers import model_name
+from backend.response_cache import response_cache, make_cache_key
+from backend.chat_context import build_chat_context
+from backend.chat_store import ChatStore
+from backend.indexes import ensure_indexes
+from backend.singleflight import SingleFlight, SingleFlightTimeout
+from backend.admission import AdmissionGate, AdmissionRejected, parse_tier_weights
+from backend.health import ReadinessChecks, mongo_ping, agent_pool_check, queue_check
+
+# Chat metadata in Chat_History, messages in Chat_Messages keyed by (chat_id, seq)
+chat_store = ChatStore(chat_history_collection, chat_messages_collection)
+
+# Indexes for the hot queries, declared in backend/indexes.py. Created in the
+# background once per process when its client connects, a no-op when they exist.
+mongo.on_connect(lambda: ensure_indexes(mongo.COLLECTIONS))
+
+# "pool" runs the agent in warm worker processes (WSGI default),
+# "async" runs it on a shared in-process event loop
+CHAT_EXECUTION_MODE = os.getenv('CHAT_EXECUTION_MODE', 'pool').lower()
+
+# Bounds how many agent runs execute at once and how many may wait for a slot,
+# and shares the slots fairly between users. In pool mode only AGENT_POOL_SIZE
+# runs can make progress anyway.
+agent_gate = AdmissionGate(
+    max_concurrency=int(os.getenv(
+        'AGENT_MAX_CONCURRENCY',
+        '32' if CHAT_EXECUTION_MODE == 'async' else os.getenv('AGENT_POOL_SIZE', '2')
+    )),
+    max_queue=int(os.getenv('AGENT_MAX_QUEUE', '16')),
+    queue_timeout=float(os.getenv('AGENT_QUEUE_TIMEOUT', '10')),
+    retry_after=int(os.getenv('AGENT_RETRY_AFTER', '5')),
+    max_per_user=int(os.getenv('AGENT_MAX_PER_USER', '2')),
+    max_queue_per_user=int(os.getenv('AGENT_MAX_QUEUE_PER_USER', '4')),
+    tier_weights=parse_tier_weights(os.getenv('AGENT_TIER_WEIGHTS', ''))
+)
+
+# Coalesces concurrent agent runs for the same cacheable prompt. A caller
+# waiting on another's run gives up when that run should have finished: a
+# queue wait plus the job timeout.
+agent_flights = SingleFlight(
+    'agent',
+    timeout=agent_gate.queue_timeout + float(os.getenv('AGENT_JOB_TIMEOUT', '60'))
+)
+
+# Checks behind /readyz, each run at most once per READY_CACHE_TTL
+readiness = ReadinessChecks()
+readiness.add('mongodb', lambda: mongo_ping(mongo.get_database()))
+if CHAT_EXECUTION_MODE != 'async':
+    readiness.add('agent_pool', lambda: agent_pool_check(current_agent_pool()))
+readiness.add('agent_queue', lambda: queue_check(agent_gate))
+
+
+def scheduling_identity(user_email):
+    """
+    Returns the (user, tier) pair the agent scheduler uses for a chat request.
+    Anonymous requests are scheduled per client address (see
+    TRUSTED_PROXY_COUNT). The tier comes from the
+    user's 'tier' field and is only looked up when AGENT_TIER_WEIGHTS is set.
+    """
+    user = user_email or request.remote_addr
+    tier = None
+    if user_email and agent_gate.tier_weights:
+        user_doc = user_collection.find_one({'email': user_email}, {'tier': 1})
+        tier = user_doc.get('tier') if user_doc else None
+    return user, tier
 
 
-import subprocess
-import sys
-import os
-import tempfile
+def agent_busy_response(error):
+    return jsonify({
+        'response': "The assistant is busy right now. Please try again in a few seconds."
+    }), error.status, {'Retry-After': str(error.retry_after)}
+
+
+def warm_up_agents():
+    """
+    Starts this process's agent workers and opens their API connections ahead
+    of the first chat. Called from gunicorn's post_worker_init hook.
+    """
+    if CHAT_EXECUTION_MODE != 'async':
+        get_agent_pool()
+    # /chat/stream always runs on the shared event loop
+    warm_up_event_loop()
+
 
 # Function to run the agent with a given input
-def run_chat_agent(user_input):
+def execute_agent(user_input):
     """
-    Runs the chat agent with the provided input and returns the response.
-    This function executes the agent in a separate Python process to avoid asyncio issues.
+    Runs the agent once and returns a dict with its 'output' and the 'tools' it used.
+    Depending on CHAT_EXECUTION_MODE the agent runs either in a pool of long-lived
+    worker processes (see backend/agent_pool.py) or as a coroutine on a shared
+    event loop (see backend/async_runner.py).
     """
-    try:
-        # Path to the backend directory
-        backend_path = os.path.join(os.path.dirname(__file__), 'backend')
-        
-        # Create a temporary script to run the agent
-        temp_script_content = f'''import sys
-import os
-sys.path.insert(0, r'{backend_path}')
+    with metrics.timed(metrics.AGENT_RUN_SECONDS, metrics.AGENT_IN_PROGRESS.labels(CHAT_EXECUTION_MODE),
+                       mode=CHAT_EXECUTION_MODE):
+        if CHAT_EXECUTION_MODE == 'async':
+            return run_agent_in_loop(user_input)
+        return get_agent_pool().run(user_input)
 
-# Change to the backend directory to load .env properly
-original_cwd = os.getcwd()
-os.chdir(r'{backend_path}')
 
-try:
-    from dotenv import load_dotenv
-    load_dotenv()  # Load environment variables
-    
-    # Import the required modules with fallbacks
-    try:
-        from agents import Agent, Runner, AsyncOpenAI, set_default_openai_client, set_tracing_disabled, OpenAIChatCompletionsModel, set_default_openai_api
-    except ImportError:
-        try:
-            from openai_agents import Agent, Runner, AsyncOpenAI, set_default_openai_client, set_tracing_disabled, OpenAIChatCompletionsModel, set_default_openai_api
-        except ImportError:
-            from agently import Agent, Runner, AsyncOpenAI, set_default_openai_client, set_tracing_disabled, OpenAIChatCompletionsModel, set_default_openai_api
+def agent_input(user_input, context):
+    """Combines the chat context and the new message into the agent's input."""
+    if not context:
+        return user_input
+    return context + [{'role': 'user', 'content': user_input}]
 
-    # Import Tavily for web search
-    try:
-        from tavily import TavilyClient
-    except ImportError:
-        print("AGENT_ERROR: tavily-python library not installed")
-        sys.exit(1)
-    
-    # Initialize the API client
-    import os
-    gemini_api_key = os.getenv("GEMINI_API_KEY")
-    tavily_api_key = os.getenv("TAVILY_API_KEY")
-    if not gemini_api_key:
-        print("AGENT_ERROR: GEMINI_API_KEY not found")
-        sys.exit(1)
-    
-    external_client = AsyncOpenAI(
-        api_key=gemini_api_key,
-        base_url="https://generativelanguage.googleapis.com/v1beta/openai/"
-    )
-    set_default_openai_client(external_client)
-    set_default_openai_api("chat_completions")
-    set_tracing_disabled(True)
-    model = OpenAIChatCompletionsModel(
-        model="gemini-2.0-flash",
-        openai_client=external_client
-    )
 
-    # Import the function_tool decorator
-    try:
-        from agents import function_tool
-    except ImportError:
-        print("AGENT_ERROR: function_tool not available in agents library")
-        sys.exit(1)
-
-    # Initialize Tavily client for web search
-    tavily_client = TavilyClient(api_key=tavily_api_key) if tavily_api_key else None
-
-    @function_tool()
-    def search_web(query: str) -> str:
-        """
-        Function to search the web using Tavily API
-        """
-        if not tavily_client:
-            return "Web search is not available. Tavily API key is not configured."
-        
-        try:
-            response = tavily_client.search(query, max_results=5)
-            results = []
-            for result in response['results']:
-                results.append(f"Title: {{result['title']}}\\nURL: {{result['url']}}\\nContent: {{result['content'][:500]}}...\\n")
-            
-            return "\\n".join(results)
-        except Exception as e:
-            return f"Web search failed: {{str(e)}}"
-
-    # Create and run the agent with the user input
-    agent = Agent(
-        name="Assistant",
-        instructions="A helpful assistant. You can use the search_web tool to search the web for current information when needed.",
-        model=model,
-        tools=[search_web]  # Add the web search tool
-    )
-    result = Runner.run_sync(
-        starting_agent=agent,
-        input="{user_input}"
-    )
+def response_cache_key(user_input):
+    return make_cache_key(user_input, model_name(), AGENT_INSTRUCTIONS)
+
+
+def remember_response(cache_key, result):
+    """
+    Caches a successful agent result, unless it used web search: those answers
+    are about current events and would go stale.
+    """
+    if 'search_web' in result['tools']:
+        response_cache.record_bypass()
+    else:
+        response_cache.set(cache_key, result['output'])
+
+
+def run_chat_agent(user_input, context=None, user=None, tier=None):
+    """
+    Runs the chat agent with the provided input and returns the response.
+    Raises AdmissionRejected when the agent queue is saturated.
+    context holds the earlier turns of the chat (see backend/chat_context.py),
+    user and tier identify the caller to the fair scheduler.
+    Repeated first-turn prompts are answered from the response cache, and
+    identical ones that arrive at the same time wait on a single agent run.
+    Answers that depend on earlier turns are never cached or shared.
+    """
+    cache_key = None
+    if not context:
+        cache_key = response_cache_key(user_input)
+        cached_response = response_cache.get(cache_key)
+        if cached_response is not None:
+            return cached_response
     
-    print(result.final_output, end='')  # Print result without extra newline
+    def run_and_remember():
+        with agent_gate.slot(user, tier):
+            result = execute_agent(user_input)
+        remember_response(cache_key, result)
+        return result
     
-except Exception as e:
-    print(f"AGENT_ERROR: {{str(e)}}")
-finally:
-    os.chdir(original_cwd)  # Restore original working directory
-'''
-        
-        # Create and execute the temporary script
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False) as temp_file:
-            temp_file.write(temp_script_content)
-            temp_script_path = temp_file.name
-
-        # Execute the temporary script
-        result = subprocess.run(
-            [sys.executable, temp_script_path], 
-            capture_output=True, 
-            text=True, 
-            timeout=60  # Increased timeout to 60 seconds for web search
-        )
-        
-        # Clean up the temporary script
-        os.unlink(temp_script_path)
-        
-        if result.returncode == 0:
-            # Return the response, checking specifically for our AGENT_ERROR marker
-            output = result.stdout.strip()
-            if output.startswith("AGENT_ERROR:"):
-                print(f"Agent execution error: {output}")
-                return "I'm having trouble processing your request. Please try again later."
-            return output
+    try:
+        if cache_key:
+            # Identical first-turn prompts arriving together share one agent run
+            result = agent_flights.do(cache_key, run_and_remember)
         else:
-            print(f"Agent execution error: {result.stderr}")
-            return "I'm having trouble processing your request. Please try again later."
-            
-    except subprocess.TimeoutExpired:
-        print("Agent execution timed out")
+            with agent_gate.slot(user, tier):
+                result = execute_agent(agent_input(user_input, context))
+    except AdmissionRejected:
+        # Let the endpoint answer with 503 and Retry-After
+        raise
+    except (AgentPoolTimeout, AgentRunTimeout, SingleFlightTimeout):
+        logger.warning("Agent execution timed out")
         return "The request is taking too long to process. Please try again."
+    except (AgentPoolError, AgentRunError) as e:
+        logger.exception("Agent execution error")
+        return "I'm having trouble processing your request. Please try again later."
     except Exception as e:
-        print(f"Chat agent error: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Chat agent error")
         return "I'm having trouble connecting to the chat agent. Please try again later."
+    
+    return result['output']
+
+
+# Content of the verification result pages rendered from templates/verify_email.html
+VERIFY_PAGES = {
+    'invalid': {
+        'status': 'error',
+        'title': 'Email Verification Failed',
+        'heading': 'Verification Failed',
+        'message': 'Invalid or expired verification token.',
+        'description': 'The verification link you clicked is invalid or has expired. Please try registering again or contact support if you continue to have issues.'
+    },
+    'success': {
+        'status': 'success',
+        'title': 'Email Verified',
+        'heading': 'Email Verified!',
+        'message': 'Success! Your email has been verified.',
+        'description': 'You can now log in to your account and start using all the features of ChatUp.'
+    },
+    'error': {
+        'status': 'error',
+        'title': 'Verification Error',
+        'heading': 'Verification Error',
+        'message': 'An error occurred during email verification.',
+        'description': 'Something went wrong while verifying your email. Please try again or contact support if the issue persists.'
+    }
+}
 
 
 # Email verification endpoint - serves the HTML page
@@ -406,149 +491,7 @@ def verify_email_page(token):
         
         if not user:
             # Return the verification page with an error message
-            return '''
-            <!DOCTYPE html>
-            <html lang="en">
-            <head>
-                <meta charset="UTF-8">
-                <meta name="viewport" content="width=device-width, initial-scale=1.0">
-                <title>Email Verification Failed - ChatUp</title>
-                <style>
-                    * {
-                        margin: 0;
-                        padding: 0;
-                        box-sizing: border-box;
-                        font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-                    }
-
-                    body {
-                        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                        min-height: 100vh;
-                        display: flex;
-                        align-items: center;
-                        justify-content: center;
-                        padding: 20px;
-                    }
-
-                    .container {
-                        background: white;
-                        border-radius: 16px;
-                        box-shadow: 0 20px 40px rgba(0, 0, 0, 0.1);
-                        padding: 60px 40px;
-                        text-align: center;
-                        max-width: 500px;
-                        width: 100%;
-                        position: relative;
-                        overflow: hidden;
-                    }
-
-                    .container::before {
-                        content: '';
-                        position: absolute;
-                        top: 0;
-                        left: 0;
-                        right: 0;
-                        height: 8px;
-                        background: linear-gradient(90deg, #f44336, #d32f2f);
-                    }
-
-                    .icon {
-                        width: 80px;
-                        height: 80px;
-                        background: linear-gradient(135deg, #f44336, #d32f2f);
-                        border-radius: 50%;
-                        display: flex;
-                        align-items: center;
-                        justify-content: center;
-                        margin: 0 auto 20px;
-                    }
-
-                    .icon svg {
-                        width: 50px;
-                        height: 50px;
-                        fill: white;
-                    }
-
-                    h1 {
-                        color: #333;
-                        font-size: 2.5rem;
-                        margin-bottom: 15px;
-                        font-weight: 600;
-                    }
-
-                    .error-message {
-                        color: #f44336;
-                        font-size: 1.2rem;
-                        margin-bottom: 30px;
-                        font-weight: 500;
-                    }
-
-                    .description {
-                        color: #666;
-                        font-size: 1rem;
-                        margin-bottom: 30px;
-                        line-height: 1.6;
-                    }
-
-                    .btn {
-                        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                        color: white;
-                        border: none;
-                        padding: 15px 30px;
-                        font-size: 1rem;
-                        border-radius: 50px;
-                        cursor: pointer;
-                        transition: all 0.3s ease;
-                        text-decoration: none;
-                        display: inline-block;
-                        font-weight: 500;
-                        box-shadow: 0 4px 15px rgba(102, 126, 234, 0.4);
-                    }
-
-                    .btn:hover {
-                        transform: translateY(-2px);
-                        box-shadow: 0 6px 20px rgba(102, 126, 234, 0.6);
-                    }
-
-                    .btn:active {
-                        transform: translateY(0);
-                    }
-
-                    @media (max-width: 600px) {
-                        .container {
-                            padding: 40px 20px;
-                        }
-                        
-                        h1 {
-                            font-size: 2rem;
-                        }
-                        
-                        .error-message {
-                            font-size: 1.1rem;
-                        }
-                        
-                        .btn {
-                            padding: 12px 25px;
-                            font-size: 0.9rem;
-                        }
-                    }
-                </style>
-            </head>
-            <body>
-                <div class="container">
-                    <div class="icon">
-                        <svg viewBox="0 0 24 24">
-                            <path d="M12 2C6.48 2 2 6.48 2 12s4.48 10 10 10 10-4.48 10-10S17.52 2 12 2zm-2 15l-5-5 1.41-1.41L10 14.17l7.59-7.59L19 8l-9 9z"/>
-                        </svg>
-                    </div>
-                    <h1>Verification Failed</h1>
-                    <p class="error-message">Invalid or expired verification token.</p>
-                    <p class="description">The verification link you clicked is invalid or has expired. Please try registering again or contact support if you continue to have issues.</p>
-                    <a href="/" class="btn">Back to Login</a>
-                </div>
-            </body>
-            </html>
-            '''
+            return render_template('verify_email.html', **VERIFY_PAGES['invalid'])
         
         # Update user to mark email as verified
         # Keep the verification token for reference
@@ -563,302 +506,11 @@ def verify_email_page(token):
         )
         
         # Return the verification success page
-        return '''
-        <!DOCTYPE html>
-        <html lang="en">
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <title>Email Verified - ChatUp</title>
-            <style>
-                * {
-                    margin: 0;
-                    padding: 0;
-                    box-sizing: border-box;
-                    font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-                }
-
-                body {
-                    background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                    min-height: 100vh;
-                    display: flex;
-                    align-items: center;
-                    justify-content: center;
-                    padding: 20px;
-                }
-
-                .container {
-                    background: white;
-                    border-radius: 16px;
-                    box-shadow: 0 20px 40px rgba(0, 0, 0, 0.1);
-                    padding: 60px 40px;
-                    text-align: center;
-                    max-width: 500px;
-                    width: 100%;
-                    position: relative;
-                    overflow: hidden;
-                }
-
-                .container::before {
-                    content: '';
-                    position: absolute;
-                    top: 0;
-                    left: 0;
-                    right: 0;
-                    height: 8px;
-                    background: linear-gradient(90deg, #4CAF50, #45a049);
-                }
-
-                .icon {
-                    width: 80px;
-                    height: 80px;
-                    background: linear-gradient(135deg, #4CAF50, #45a049);
-                    border-radius: 50%;
-                    display: flex;
-                    align-items: center;
-                    justify-content: center;
-                    margin: 0 auto 20px;
-                    animation: pulse 2s infinite;
-                }
-
-                .icon svg {
-                    width: 50px;
-                    height: 50px;
-                    fill: white;
-                }
-
-                h1 {
-                    color: #333;
-                    font-size: 2.5rem;
-                    margin-bottom: 15px;
-                    font-weight: 600;
-                }
-
-                .success-message {
-                    color: #4CAF50;
-                    font-size: 1.2rem;
-                    margin-bottom: 15px;
-                    font-weight: 500;
-                }
-
-                .description {
-                    color: #666;
-                    font-size: 1rem;
-                    margin-bottom: 30px;
-                    line-height: 1.6;
-                }
-
-                .btn {
-                    background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                    color: white;
-                    border: none;
-                    padding: 15px 30px;
-                    font-size: 1rem;
-                    border-radius: 50px;
-                    cursor: pointer;
-                    transition: all 0.3s ease;
-                    text-decoration: none;
-                    display: inline-block;
-                    font-weight: 500;
-                    box-shadow: 0 4px 15px rgba(102, 126, 234, 0.4);
-                }
-
-                .btn:hover {
-                    transform: translateY(-2px);
-                    box-shadow: 0 6px 20px rgba(102, 126, 234, 0.6);
-                }
-
-                .btn:active {
-                    transform: translateY(0);
-                }
-
-                @keyframes pulse {
-                    0% { transform: scale(1); }
-                    50% { transform: scale(1.05); }
-                    100% { transform: scale(1); }
-                }
-
-                @media (max-width: 600px) {
-                    .container {
-                        padding: 40px 20px;
-                    }
-                    
-                    h1 {
-                        font-size: 2rem;
-                    }
-                    
-                    .success-message, .description {
-                        font-size: 1rem;
-                    }
-                    
-                    .btn {
-                        padding: 12px 25px;
-                        font-size: 0.9rem;
-                    }
-                }
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="icon">
-                    <svg viewBox="0 0 24 24">
-                        <path d="M9 16.17L4.83 12l-1.42 1.41L9 19 21 7l-1.41-1.41z"/>
-                    </svg>
-                </div>
-                <h1>Email Verified!</h1>
-                <p class="success-message">Success! Your email has been verified.</p>
-                <p class="description">You can now log in to your account and start using all the features of ChatUp.</p>
-                <a href="/" class="btn">Back to Login</a>
-            </div>
-        </body>
-        </html>
-        '''
+        return render_template('verify_email.html', **VERIFY_PAGES['success'])
         
     except Exception as e:
-        print(f"Email verification error: {e}")
-        return '''
-        <!DOCTYPE html>
-        <html lang="en">
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <title>Verification Error - ChatUp</title>
-            <style>
-                * {
-                    margin: 0;
-                    padding: 0;
-                    box-sizing: border-box;
-                    font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-                }
-
-                body {
-                    background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                    min-height: 100vh;
-                    display: flex;
-                    align-items: center;
-                    justify-content: center;
-                    padding: 20px;
-                }
-
-                .container {
-                    background: white;
-                    border-radius: 16px;
-                    box-shadow: 0 20px 40px rgba(0, 0, 0, 0.1);
-                    padding: 60px 40px;
-                    text-align: center;
-                    max-width: 500px;
-                    width: 100%;
-                    position: relative;
-                    overflow: hidden;
-                }
-
-                .container::before {
-                    content: '';
-                    position: absolute;
-                    top: 0;
-                    left: 0;
-                    right: 0;
-                    height: 8px;
-                    background: linear-gradient(90deg, #f44336, #d32f2f);
-                }
-
-                .icon {
-                    width: 80px;
-                    height: 80px;
-                    background: linear-gradient(135deg, #f44336, #d32f2f);
-                    border-radius: 50%;
-                    display: flex;
-                    align-items: center;
-                    justify-content: center;
-                    margin: 0 auto 20px;
-                }
-
-                .icon svg {
-                    width: 50px;
-                    height: 50px;
-                    fill: white;
-                }
-
-                h1 {
-                    color: #333;
-                    font-size: 2.5rem;
-                    margin-bottom: 15px;
-                    font-weight: 600;
-                }
-
-                .error-message {
-                    color: #f44336;
-                    font-size: 1.2rem;
-                    margin-bottom: 30px;
-                    font-weight: 500;
-                }
-
-                .description {
-                    color: #666;
-                    font-size: 1rem;
-                    margin-bottom: 30px;
-                    line-height: 1.6;
-                }
-
-                .btn {
-                    background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                    color: white;
-                    border: none;
-                    padding: 15px 30px;
-                    font-size: 1rem;
-                    border-radius: 50px;
-                    cursor: pointer;
-                    transition: all 0.3s ease;
-                    text-decoration: none;
-                    display: inline-block;
-                    font-weight: 500;
-                    box-shadow: 0 4px 15px rgba(102, 126, 234, 0.4);
-                }
-
-                .btn:hover {
-                    transform: translateY(-2px);
-                    box-shadow: 0 6px 20px rgba(102, 126, 234, 0.6);
-                }
-
-                .btn:active {
-                    transform: translateY(0);
-                }
-
-                @media (max-width: 600px) {
-                    .container {
-                        padding: 40px 20px;
-                    }
-                    
-                    h1 {
-                        font-size: 2rem;
-                    }
-                    
-                    .error-message {
-                        font-size: 1.1rem;
-                    }
-                    
-                    .btn {
-                        padding: 12px 25px;
-                        font-size: 0.9rem;
-                    }
-                }
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="icon">
-                    <svg viewBox="0 0 24 24">
-                        <path d="M12 2C6.48 2 2 6.48 2 12s4.48 10 10 10 10-4.48 10-10S17.52 2 12 2zm-2 15l-5-5 1.41-1.41L10 14.17l7.59-7.59L19 8l-9 9z"/>
-                    </svg>
-                </div>
-                <h1>Verification Error</h1>
-                <p class="error-message">An error occurred during email verification.</p>
-                <p class="description">Something went wrong while verifying your email. Please try again or contact support if the issue persists.</p>
-                <a href="/" class="btn">Back to Login</a>
-            </div>
-        </body>
-        </html>
-        '''
+        logger.exception("Email verification error")
+        return render_template('verify_email.html', **VERIFY_PAGES['error'])
 
 
 # API endpoint for verifying email (for JavaScript requests)
@@ -892,7 +544,7 @@ def verify_email(token):
         }), 200
         
     except Exception as e:
-        print(f"Email verification error: {e}")
+        logger.exception("Email verification error")
         return jsonify({
             'success': False,
             'message': 'An error occurred during email verification.'
@@ -941,9 +593,9 @@ def resend_verification():
             }
         )
         
-        # Send verification email with new token
-        verification_sent = send_verification_email(email, user['name'], new_token)
-        if not verification_sent:
+        # Queue the verification email with the new token
+        email_job_id = queue_email('verification', email=email, name=user['name'], token=new_token)
+        if not email_job_id:
             return jsonify({
                 'success': False,
                 'message': 'Failed to send verification email. Please try again later.'
@@ -951,11 +603,12 @@ def resend_verification():
         else:
             return jsonify({
                 'success': True,
-                'message': 'Verification email has been sent successfully!'
+                'message': 'Verification email has been sent successfully!',
+                'emailJobId': email_job_id
             }), 200
             
     except Exception as e:
-        print(f"Resend verification error: {e}")
+        logger.exception("Resend verification error")
         return jsonify({
             'success': False,
             'message': 'An error occurred while resending verification email.'
@@ -1025,7 +678,7 @@ def change_password():
         }), 200
         
     except Exception as e:
-        print(f"Change password error: {e}")
+        logger.exception("Change password error")
         return jsonify({
             'success': False,
             'message': 'An error occurred while changing your password.'
@@ -1082,129 +735,78 @@ def update_profile():
         }), 200
         
     except Exception as e:
-        print(f"Update profile error: {e}")
+        logger.exception("Update profile error")
         return jsonify({
             'success': False,
             'message': 'An error occurred while updating your profile.'
         }), 500
 
 
-# Function to send verification email
+# Function to send verification email. Raises on failure, the email outbox
+# stores the error on the job and retries it.
 def send_verification_email(email, name, token):
-    import smtplib
     from email.mime.text import MIMEText
     from email.mime.multipart import MIMEMultipart
     
-    # Email configuration - you can use environment variables for these
-    smtp_server = os.getenv('SMTP_SERVER', 'smtp.gmail.com')
-    smtp_port = int(os.getenv('SMTP_PORT', '587'))
+    # Email configuration - SMTP_SERVER and SMTP_PORT are read by the SMTP pool
     sender_email = os.getenv('EMAIL_ADDRESS')
     sender_password = os.getenv('EMAIL_PASSWORD')
     
     if not sender_email or not sender_password:
-        print("Email configuration missing. Please set EMAIL_ADDRESS and EMAIL_PASSWORD environment variables.")
-        return False
+        raise RuntimeError("Email configuration missing. Please set EMAIL_ADDRESS and EMAIL_PASSWORD environment variables.")
     
-    try:
-        # Create the verification link - using configurable base URL for production
-        base_url = os.getenv('BASE_URL', 'http://localhost:5000')  # Set this to your production URL
-        verification_link = f"{base_url}/verify-email/{token}"
-        
-        # Create the email
-        msg = MIMEMultipart()
-        msg['From'] = sender_email
-        msg['To'] = email
-        msg['Subject'] = "Verify Your Email Address - ChatUp"
-        
-        body = f"""
-        Hello {name},
-        
-        Thank you for registering with ChatUp! Please click the link below to verify your email address:
-        
-        {verification_link}
-        
-        If you did not register for ChatUp, please ignore this email.
-        
-        Best regards,
-        The ChatUp Team
-        """
-        
-        msg.attach(MIMEText(body, 'plain'))
-        
-        # Connect to server and send email
-        server = smtplib.SMTP(smtp_server, smtp_port)
-        server.starttls()
-        server.login(sender_email, sender_password)
-        text = msg.as_string()
-        server.sendmail(sender_email, email, text)
-        server.quit()
-        
-        print(f"Verification email sent to {email}")
-        return True
-        
-    except Exception as e:
-        print(f"Failed to send verification email: {e}")
-        return False
+    # Create the verification link - using configurable base URL for production
+    base_url = os.getenv('BASE_URL', 'http://localhost:5000')  # Set this to your production URL
+    verification_link = f"{base_url}/verify-email/{token}"
+    
+    # Create the email
+    msg = MIMEMultipart()
+    msg['From'] = sender_email
+    msg['To'] = email
+    msg['Subject'] = "Verify Your Email Address - ChatUp"
+    
+    body = render_email('email/verification.txt', name=name, verification_link=verification_link)
+    
+    msg.attach(MIMEText(body, 'plain'))
+    
+    # Send over a pooled, already authenticated SMTP session
+    smtp_pool().send(msg, sender_email, email)
+    
+    logger.info("Verification email sent", extra={'email': email})
+    return True
 
 
-# Function to send password reset email
+# Function to send password reset email, raises on failure like send_verification_email
 def send_password_reset_email(email, name, token):
-    import smtplib
     from email.mime.text import MIMEText
     from email.mime.multipart import MIMEMultipart
     
-    # Email configuration - you can use environment variables for these
-    smtp_server = os.getenv('SMTP_SERVER', 'smtp.gmail.com')
-    smtp_port = int(os.getenv('SMTP_PORT', '587'))
+    # Email configuration - SMTP_SERVER and SMTP_PORT are read by the SMTP pool
     sender_email = os.getenv('EMAIL_ADDRESS')
     sender_password = os.getenv('EMAIL_PASSWORD')
     
     if not sender_email or not sender_password:
-        print("Email configuration missing. Please set EMAIL_ADDRESS and EMAIL_PASSWORD environment variables.")
-        return False
+        raise RuntimeError("Email configuration missing. Please set EMAIL_ADDRESS and EMAIL_PASSWORD environment variables.")
     
-    try:
-        # Create the reset link - using configurable base URL for production
-        base_url = os.getenv('BASE_URL', 'http://localhost:5000')  # Set this to your production URL
-        reset_link = f"{base_url}/reset-password?token={token}"
-        
-        # Create the email
-        msg = MIMEMultipart()
-        msg['From'] = sender_email
-        msg['To'] = email
-        msg['Subject'] = "Password Reset Request - ChatUp"
-        
-        body = f"""
-        Hello {name},
-        
-        You have requested to reset your password for your ChatUp account. Please click the link below to reset your password:
-        
-        {reset_link}
-        
-        This link will expire in 2 hours for security reasons.
-        
-        If you did not request a password reset, please ignore this email or contact support if you believe this is unauthorized access.
-        
-        Best regards,
-        The ChatUp Team
-        """
-        
-        msg.attach(MIMEText(body, 'plain'))
-        
-        # Connect to server and send email
-        server = smtplib.SMTP(smtp_server, smtp_port)
-        server.starttls()
-        server.login(sender_email, sender_password)
-        text = msg.as_string()
-        server.sendmail(sender_email, email, text)
-        server.quit()
-        
-        print(f"Password reset email sent to {email}")
-        return True
-        
-    except Exception as e:
-        print(f"Failed to send password reset email: {e}")
-        return False
+    # Create the reset link - using configurable base URL for production
+    base_url = os.getenv('BASE_URL', 'http://localhost:5000')  # Set this to your production URL
+    reset_link = f"{base_url}/reset-password?token={token}"
+    
+    # Create the email
+    msg = MIMEMultipart()
+    msg['From'] = sender_email
+    msg['To'] = email
+    msg['Subject'] = "Password Reset Request - ChatUp"
+    
+    body = render_email('email/password_reset.txt', name=name, reset_link=reset_link)
+    
+    msg.attach(MIMEText(body, 'plain'))
+    
+    # Send over a pooled, already authenticated SMTP session
+    smtp_pool().send(msg, sender_email, email)
+    
+    logger.info("Password reset email sent", extra={'email': email})
+    return True
 
 
 # Delete account endpoint
@@ -1259,7 +861,7 @@ def delete_account():
             }), 500
         
     except Exception as e:
-        print(f"Delete account error: {e}")
+        logger.exception("Delete account error")
         return jsonify({
             'success': False,
             'message': 'An error occurred while deleting your account.'
@@ -1302,10 +904,10 @@ def request_password_reset():
             }
         )
         
-        # Send password reset email
-        reset_sent = send_password_reset_email(email, user['name'], reset_token)
-        if not reset_sent:
-            print(f"Failed to send password reset email to {email}")
+        # Queue the password reset email
+        email_job_id = queue_email('password_reset', email=email, name=user['name'], token=reset_token)
+        if not email_job_id:
+            logger.warning("Could not queue the password reset email", extra={'email': email})
             return jsonify({
                 'success': False,
                 'message': 'Failed to send password reset email. Please try again later.'
@@ -1313,13 +915,12 @@ def request_password_reset():
         else:
             return jsonify({
                 'success': True,
-                'message': 'Password reset link has been sent to your email.'
+                'message': 'Password reset link has been sent to your email.',
+                'emailJobId': email_job_id
             }), 200
         
     except Exception as e:
-        print(f"Request password reset error: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Request password reset error")
         return jsonify({
             'success': False,
             'message': 'An error occurred while requesting password reset.'
@@ -1396,7 +997,7 @@ def reset_password():
         }), 200
         
     except Exception as e:
-        print(f"Reset password error: {e}")
+        logger.exception("Reset password error")
         return jsonify({
             'success': False,
             'message': 'An error occurred while resetting your password.'
@@ -1408,7 +1009,7 @@ def reset_password():
 def reset_password_page():
     # This route serves the password reset page with the token in the URL
     # The frontend JavaScript will detect the token and show the reset UI
-    return send_from_directory('.', 'index.html')
+    return send_index()
 
 
 # Verify password for specific user
@@ -1454,13 +1055,34 @@ def verify_password():
             }), 401
             
     except Exception as e:
-        print(f"Verify password error: {e}")
+        logger.exception("Verify password error")
         return jsonify({
             'success': False,
             'message': 'An error occurred while verifying your password.'
         }), 500
 
 
+# Function to save one user/bot exchange to the user's chat history
+def save_chat_turn(user_email, chat_id, message, bot_response):
+    """
+    Appends the exchange to the chat identified by chat_id, or starts a new chat
+    if no chat_id is given or the chat does not belong to the user.
+    Returns the ID of the chat the exchange was saved to.
+    """
+    turn = [
+        {'sender': 'user', 'text': message, 'timestamp': datetime.now()},
+        {'sender': 'bot', 'text': bot_response, 'timestamp': datetime.now()}
+    ]
+
+    # If a chat_id is provided, add the messages to the existing chat
+    if chat_id and chat_store.append_messages(chat_id, user_email, turn):
+        return chat_id
+
+    # No chat_id, or chat not found for this user, create a new chat session
+    title = message[:50] + "..." if len(message) > 50 else message  # Use first part of message as title
+    return chat_store.create_chat(user_email, title, turn)
+
+
 # Chat endpoint that integrates with the backend agent
 @app.route('/chat', methods=['POST'])
 def chat():
@@ -1470,76 +1092,21 @@ def chat():
         user_email = data.get('userId')  # Get user email from frontend
         chat_id = data.get('chatId')  # Get chat ID from frontend (if exists)
         
-        # Log the incoming message for debugging
-        print(f"Received chat message from {user_email}: {message}")
+        # Only the size of the message is logged, never its text
+        logger.info("Chat message received", extra={'chat_id': chat_id, 'message_chars': len(message or '')})
         
-        # Get response from the backend agent
-        bot_response = run_chat_agent(message)
+        # Get response from the backend agent, with the earlier turns of this chat
+        context = build_chat_context(chat_store, chat_id, user_email)
+        user, tier = scheduling_identity(user_email)
+        try:
+            bot_response = run_chat_agent(message, context, user, tier)
+        except AdmissionRejected as e:
+            return agent_busy_response(e)
         
         # Save chat to database
+        returned_chat_id = None
         if user_email:  # Only save if we have user identification
-            if chat_id:
-                # If a chat_id is provided, add the messages to the existing chat
-                result = chat_history_collection.update_one(
-                    {'_id': ObjectId(chat_id), 'user_email': user_email},  # Ensure user owns this chat
-                    {
-                        '$push': {
-                            'messages': {
-                                '$each': [
-                                    {
-                                        'sender': 'user',
-                                        'text': message,
-                                        'timestamp': datetime.now()
-                                    },
-                                    {
-                                        'sender': 'bot',
-                                        'text': bot_response,
-                                        'timestamp': datetime.now()
-                                    }
-                                ]
-                            }
-                        },
-                        '$set': {
-                            'updated_at': datetime.now()
-                        }
-                    }
-                )
-                
-                if result.matched_count > 0:
-                    # Successfully updated existing chat
-                    returned_chat_id = chat_id
-                else:
-                    # Chat not found for this user, create a new one
-                    chat_entry = {
-                        'user_email': user_email,
-                        'title': message[:50] + "..." if len(message) > 50 else message,  # Use first part of message as title
-                        'created_at': datetime.now(),
-                        'updated_at': datetime.now(),
-                        'messages': [
-                            {'sender': 'user', 'text': message, 'timestamp': datetime.now()},
-                            {'sender': 'bot', 'text': bot_response, 'timestamp': datetime.now()}
-                        ]
-                    }
-                    
-                    # Create new chat document
-                    result = chat_history_collection.insert_one(chat_entry)
-                    returned_chat_id = str(result.inserted_id)  # Get the ID of the new chat
-            else:
-                # If no chat_id is provided, create a new chat session
-                chat_entry = {
-                    'user_email': user_email,
-                    'title': message[:50] + "..." if len(message) > 50 else message,  # Use first part of message as title
-                    'created_at': datetime.now(),
-                    'updated_at': datetime.now(),
-                    'messages': [
-                        {'sender': 'user', 'text': message, 'timestamp': datetime.now()},
-                        {'sender': 'bot', 'text': bot_response, 'timestamp': datetime.now()}
-                    ]
-                }
-                
-                # Create new chat document
-                result = chat_history_collection.insert_one(chat_entry)
-                returned_chat_id = str(result.inserted_id)  # Get the ID of the new chat
+            returned_chat_id = save_chat_turn(user_email, chat_id, message, bot_response)
         
         return jsonify({
             'response': bot_response,
@@ -1547,16 +1114,112 @@ def chat():
         }), 200
         
     except Exception as e:
-        print(f"Chat error: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Chat error")
         return jsonify({
             'response': "Sorry, I'm having trouble processing your message right now."
         }), 500
 
 
+# Helper to format one Server-Sent Event
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+# Streaming chat endpoint - sends the answer as Server-Sent Events while it is generated
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    data = request.get_json()
+    message = data.get('message')
+    user_email = data.get('userId')  # Get user email from frontend
+    chat_id = data.get('chatId')  # Get chat ID from frontend (if exists)
+    
+    if not message:
+        return jsonify({
+            'response': 'Message is required'
+        }), 400
+    
+    logger.info("Streaming chat message received", extra={'chat_id': chat_id, 'message_chars': len(message)})
+    
+    context = build_chat_context(chat_store, chat_id, user_email)
+    
+    # Repeated first-turn prompts are answered from the response cache in a single chunk
+    cache_key = None
+    cached_response = None
+    if not context:
+        cache_key = response_cache_key(message)
+        cached_response = response_cache.get(cache_key)
+    
+    if cached_response is None:
+        # Take the agent slot before the stream starts so a saturated
+        # server can still answer with a proper 503
+        user, tier = scheduling_identity(user_email)
+        try:
+            agent_gate.acquire(user, tier)
+        except AdmissionRejected as e:
+            return agent_busy_response(e)
+    
+    def stream_response():
+        if cached_response is not None:
+            yield {'type': 'delta', 'text': cached_response}
+            yield {'type': 'final', 'output': cached_response, 'tools': []}
+            return
+        
+        # Streaming always runs on the shared event loop, whatever CHAT_EXECUTION_MODE is
+        with metrics.timed(metrics.AGENT_RUN_SECONDS, metrics.AGENT_IN_PROGRESS.labels('stream'), mode='stream'):
+            for event in stream_agent_in_loop(agent_input(message, context)):
+                if event['type'] == 'final' and cache_key:
+                    remember_response(cache_key, event)
+                yield event
+    
+    def generate():
+        try:
+            bot_response = None
+            for event in stream_response():
+                if event['type'] == 'delta':
+                    yield sse_event('delta', {'text': event['text']})
+                elif event['type'] == 'tool_start':
+                    yield sse_event('tool_start', {'tool': event['tool']})
+                elif event['type'] == 'tool_end':
+                    yield sse_event('tool_end', {'tool': event['tool']})
+                elif event['type'] == 'final':
+                    bot_response = event['output']
+            if bot_response is None:
+                bot_response = "I'm having trouble processing your request. Please try again later."
+        except AgentRunTimeout:
+            logger.warning("Agent execution timed out")
+            bot_response = "The request is taking too long to process. Please try again."
+        except AgentRunError as e:
+            logger.exception("Agent execution error")
+            bot_response = "I'm having trouble processing your request. Please try again later."
+        except Exception as e:
+            logger.exception("Chat stream error")
+            bot_response = "Sorry, I'm having trouble processing your message right now."
+        
+        returned_chat_id = None
+        try:
+            if user_email:  # Only save if we have user identification
+                returned_chat_id = save_chat_turn(user_email, chat_id, message, bot_response)
+        except Exception as e:
+            logger.exception("Chat stream save error")
+        
+        yield sse_event('done', {
+            'response': bot_response,
+            'chatId': returned_chat_id
+        })
+    
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # Stop proxies from buffering the stream
+    })
+    if cached_response is None:
+        # Free the agent slot once the stream is finished or the client went away
+        response.call_on_close(lambda: agent_gate.release(user))
+    return response
+
+
 # Endpoint to get user's chat history
 @app.route('/chat-history', methods=['GET'])
+@compressor.level(gzip_level=6, brotli_quality=5)
 def get_chat_history():
     try:
         # Get user email from authorization header
@@ -1585,6 +1248,9 @@ def get_chat_history():
             'user_email': user_email
         }).sort('created_at', -1).limit(50))  # Get last 50 chats, most recent first
         
+        # Messages of all chats in one query; chats not migrated yet still embed them
+        stored_messages = chat_store.messages_of_chats([chat['_id'] for chat in chats if 'message_count' in chat])
+        
         # Format the results
         formatted_chats = []
         for chat in chats:
@@ -1593,7 +1259,10 @@ def get_chat_history():
                 'title': chat.get('title', 'New Chat'),
                 'created_at': chat.get('created_at', chat.get('timestamp', datetime.now())).isoformat(),
                 'updated_at': chat.get('updated_at', chat.get('created_at', datetime.now())).isoformat(),
-                'messages': chat['messages']
+                'messages': [
+                    {'sender': msg.get('sender'), 'text': msg.get('text'), 'timestamp': msg.get('timestamp')}
+                    for msg in stored_messages.get(chat['_id'], chat.get('messages', []))
+                ]
             })
         
         return jsonify({
@@ -1602,15 +1271,169 @@ def get_chat_history():
         }), 200
         
     except Exception as e:
-        print(f"Get chat history error: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Get chat history error")
         return jsonify({
             'success': False,
             'message': 'Failed to retrieve chat history'
         }), 500
 
 
+CHAT_PAGE_SIZE = int(os.getenv('CHAT_PAGE_SIZE', '30'))
+MESSAGE_PAGE_SIZE = int(os.getenv('MESSAGE_PAGE_SIZE', '50'))
+
+
+def encode_cursor(values):
+    """Opaque pagination cursor for the given keyset values."""
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Returns the keyset values of a cursor, or raises ValueError if it is malformed."""
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+def page_size(default):
+    """The 'limit' query parameter, clamped to 1..100."""
+    try:
+        return max(1, min(100, int(request.args.get('limit', default))))
+    except ValueError:
+        return default
+
+
+# Chat list for the sidebar: summaries only, newest first, keyset paginated
+@app.route('/chats', methods=['GET'])
+def list_chats():
+    try:
+        auth_header = request.headers.get('Authorization')
+        if not auth_header or not auth_header.startswith('Bearer '):
+            return jsonify({
+                'success': False,
+                'message': 'Authentication required'
+            }), 401
+
+        user_email = request.args.get('user_email')
+        if not user_email:
+            return jsonify({
+                'success': False,
+                'message': 'User email is required'
+            }), 400
+
+        limit = page_size(CHAT_PAGE_SIZE)
+        query = {'user_email': user_email}
+        cursor = request.args.get('cursor')
+        if cursor:
+            # Continue after the last chat of the previous page, ordered by (created_at, _id)
+            try:
+                created_at, last_id = decode_cursor(cursor)
+                created_at = datetime.fromisoformat(created_at)
+                last_id = ObjectId(last_id)
+            except Exception:
+                return jsonify({
+                    'success': False,
+                    'message': 'Invalid cursor'
+                }), 400
+            query['$or'] = [
+                {'created_at': {'$lt': created_at}},
+                {'created_at': created_at, '_id': {'$lt': last_id}}
+            ]
+
+        chats = list(chat_history_collection.find(
+            query,
+            {'title': 1, 'created_at': 1, 'updated_at': 1}
+        ).sort([('created_at', -1), ('_id', -1)]).limit(limit + 1))
+
+        next_cursor = None
+        if len(chats) > limit:
+            chats = chats[:limit]
+            last = chats[-1]
+            next_cursor = encode_cursor([last['created_at'].isoformat(), str(last['_id'])])
+
+        return jsonify({
+            'success': True,
+            'chats': [
+                {
+                    'id': str(chat['_id']),
+                    'title': chat.get('title', 'New Chat'),
+                    'created_at': chat['created_at'].isoformat(),
+                    'updated_at': chat.get('updated_at', chat['created_at']).isoformat()
+                }
+                for chat in chats
+            ],
+            'next_cursor': next_cursor
+        }), 200
+
+    except Exception as e:
+        logger.exception("List chats error")
+        return jsonify({
+            'success': False,
+            'message': 'Failed to retrieve chats'
+        }), 500
+
+
+# Messages of one chat, newest page first, each page in chronological order.
+# The cursor points before the oldest message already loaded.
+@app.route('/chats/<chat_id>/messages', methods=['GET'])
+@compressor.level(gzip_level=6, brotli_quality=5)
+def list_chat_messages(chat_id):
+    try:
+        auth_header = request.headers.get('Authorization')
+        if not auth_header or not auth_header.startswith('Bearer '):
+            return jsonify({
+                'success': False,
+                'message': 'Authentication required'
+            }), 401
+
+        user_email = request.args.get('user_email')
+        if not user_email:
+            return jsonify({
+                'success': False,
+                'message': 'User email is required'
+            }), 400
+
+        limit = page_size(MESSAGE_PAGE_SIZE)
+        try:
+            before = int(decode_cursor(request.args['cursor'])[0]) if request.args.get('cursor') else None
+        except Exception:
+            return jsonify({
+                'success': False,
+                'message': 'Invalid cursor'
+            }), 400
+
+        chat = chat_store.get_chat(chat_id, user_email, {'_id': 1})
+        if not chat:
+            return jsonify({
+                'success': False,
+                'message': 'Chat not found'
+            }), 404
+
+        messages = [
+            {
+                'seq': msg['seq'],
+                'sender': msg.get('sender'),
+                'text': msg.get('text'),
+                'timestamp': msg['timestamp'].isoformat() if msg.get('timestamp') else None
+            }
+            for msg in chat_store.message_page(chat['_id'], before, limit)
+        ]
+        start = messages[0]['seq'] if messages else 0
+
+        return jsonify({
+            'success': True,
+            'messages': messages,
+            'next_cursor': encode_cursor([start]) if start > 0 else None
+        }), 200
+
+    except Exception as e:
+        logger.exception("List chat messages error")
+        return jsonify({
+            'success': False,
+            'message': 'Failed to retrieve messages'
+        }), 500
+
+
 # Endpoint to delete user's chat history
 @app.route('/chat-history/<chat_id>', methods=['DELETE'])
 def delete_chat_history(chat_id):
@@ -1634,13 +1457,8 @@ def delete_chat_history(chat_id):
                 'message': 'User email is required'
             }), 400
 
-        # Delete specific chat for the user
-        result = chat_history_collection.delete_one({
-            '_id': ObjectId(chat_id),
-            'user_email': user_email
-        })
-        
-        if result.deleted_count > 0:
+        # Delete specific chat for the user, with its messages
+        if chat_store.delete_chat(chat_id, user_email):
             return jsonify({
                 'success': True,
                 'message': 'Chat deleted successfully'
@@ -1652,9 +1470,7 @@ def delete_chat_history(chat_id):
             }), 404
         
     except Exception as e:
-        print(f"Delete chat history error: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Delete chat history error")
         return jsonify({
             'success': False,
             'message': 'Failed to delete chat history'
@@ -1694,13 +1510,14 @@ def contact_support():
                 'message': 'Message must be at least 10 characters long'
             }), 400
         
-        # Send the support email
-        support_sent = send_support_email(email, name, message)
+        # Queue the support email
+        email_job_id = queue_email('support', user_email=email, user_name=name, user_message=message)
         
-        if support_sent:
+        if email_job_id:
             return jsonify({
                 'success': True,
-                'message': 'Your message has been sent successfully! Our support team will contact you soon.'
+                'message': 'Your message has been sent successfully! Our support team will contact you soon.',
+                'emailJobId': email_job_id
             }), 200
         else:
             return jsonify({
@@ -1709,92 +1526,166 @@ def contact_support():
             }), 500
             
     except Exception as e:
-        print(f"Contact support error: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Contact support error")
         return jsonify({
             'success': False,
             'message': 'An error occurred while processing your request'
         }), 500
 
 
-# Function to send support email
+# Function to send support email, raises on failure like send_verification_email
 def send_support_email(user_email, user_name, user_message):
-    import smtplib
     from email.mime.text import MIMEText
     from email.mime.multipart import MIMEMultipart
     
-    # Email configuration - you can use environment variables for these
-    smtp_server = os.getenv('SMTP_SERVER', 'smtp.gmail.com')
-    smtp_port = int(os.getenv('SMTP_PORT', '587'))
+    # Email configuration - SMTP_SERVER and SMTP_PORT are read by the SMTP pool
     sender_email = os.getenv('EMAIL_ADDRESS')
     sender_password = os.getenv('EMAIL_PASSWORD')
     
     if not sender_email or not sender_password:
-        print("Email configuration missing. Please set EMAIL_ADDRESS and EMAIL_PASSWORD environment variables.")
-        return False
+        raise RuntimeError("Email configuration missing. Please set EMAIL_ADDRESS and EMAIL_PASSWORD environment variables.")
+    
+    # Create the email
+    msg = MIMEMultipart()
+    msg['From'] = sender_email
+    msg['To'] = sender_email  # Send to the support team (same as sender in this case)
+    msg['Subject'] = f"Support Request from {user_name} <{user_email}>"
+    
+    body = render_email('email/support.txt', user_email=user_email, user_name=user_name, user_message=user_message)
+    
+    msg.attach(MIMEText(body, 'plain'))
+    
+    # Send over a pooled, already authenticated SMTP session
+    smtp_pool().send(msg, sender_email, sender_email)  # Send to the support email address
     
+    logger.info("Support email sent")
+    return True
+
+
+from backend.email_outbox import create_email_outbox
+
+
+def smtp_pool():
+    """This process's SMTP session pool. smtplib is only loaded once the first email goes out."""
+    from backend.smtp_pool import get_smtp_pool
+    return get_smtp_pool()
+
+
+def smtp_pool_stats():
+    """Stats of this process's SMTP pool, None before it sent its first email."""
+    # Until then the module, and smtplib with it, is not even imported
+    if 'backend.smtp_pool' not in sys.modules:
+        return None
+    from backend.smtp_pool import current_smtp_pool
+    pool = current_smtp_pool()
+    return pool.stats() if pool else None
+
+
+# Outgoing email is written to this collection by the endpoints and
+# delivered by background threads, with retries. Each worker sends a batch
+# of due emails over one SMTP session.
+email_outbox = create_email_outbox(email_outbox_collection, batch_context=lambda: smtp_pool().batch())
+email_outbox.register('verification', send_verification_email)
+email_outbox.register('password_reset', send_password_reset_email)
+email_outbox.register('support', send_support_email)
+
+
+def queue_email(kind, **payload):
+    """Adds an email to the outbox. Returns the job id, or None if it could not be stored."""
     try:
-        # Create the email
-        msg = MIMEMultipart()
-        msg['From'] = sender_email
-        msg['To'] = sender_email  # Send to the support team (same as sender in this case)
-        msg['Subject'] = f"Support Request from {user_name} <{user_email}>"
-        
-        body = f"""
-        New support request received:
-        
-        Name: {user_name}
-        Email: {user_email}
-        Message: {user_message}
-        
-        Please respond to the user's email address: {user_email}
-        """
-        
-        msg.attach(MIMEText(body, 'plain'))
-        
-        # Connect to server and send email
-        server = smtplib.SMTP(smtp_server, smtp_port)
-        server.starttls()
-        server.login(sender_email, sender_password)
-        text = msg.as_string()
-        server.sendmail(sender_email, sender_email, text)  # Send to the support email address
-        server.quit()
-        
-        print(f"Support email sent from {user_email}")
-        return True
-        
+        return email_outbox.enqueue(kind, payload)
+    except Exception as e:
+        logger.exception("Failed to queue %s email", kind)
+        return None
+
+
+# Delivery status of a queued email
+@app.route('/email-status/<job_id>', methods=['GET'])
+def email_status(job_id):
+    try:
+        status = email_outbox.status(job_id)
+        if not status:
+            return jsonify({
+                'success': False,
+                'message': 'Email job not found'
+            }), 404
+        return jsonify({
+            'success': True,
+            'data': status
+        }), 200
     except Exception as e:
-        print(f"Failed to send support email: {e}")
-        return False
+        logger.exception("Email status error")
+        return jsonify({
+            'success': False,
+            'message': 'An error occurred while checking the email status'
+        }), 500
 
 
 # Serve static files (HTML, CSS, JS)
+# After `python -m backend.assets build` the minified, content-hashed and
+# precompressed files in dist/ are served, otherwise the source files.
+def send_built(path):
+    """Sends a file from the asset build, precompressed when the client accepts it."""
+    file_path, encoding = assets.pick_encoding(path, request.accept_encodings)
+    response = send_file(
+        file_path,
+        mimetype=mimetypes.guess_type(path)[0] or 'application/octet-stream',
+        conditional=True
+    )
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+def cache_forever(response):
+    response.cache_control.no_cache = None
+    response.cache_control.public = True
+    response.cache_control.max_age = assets.IMMUTABLE_MAX_AGE
+    response.cache_control.immutable = True
+    return response
+
+def send_index():
+    """index.html from the asset build, which references the hashed files, or the source file."""
+    if assets.load_manifest():
+        # Always revalidated, it names the current hashed files
+        return send_built('index.html')
+    return send_from_directory('.', 'index.html')
+
 @app.route('/')
 def index():
-    return send_from_directory('.', 'index.html')
+    return send_index()
+
+def send_asset(directory, filename):
+    # Hashed files listed in the build manifest change their URL whenever
+    # they change, so browsers may keep them for a year. Everything else
+    # keeps the default conditional responses (ETag / Last-Modified).
+    path = f"{directory}/{filename}"
+    if assets.is_hashed(path):
+        return cache_forever(send_built(path))
+    return send_from_directory(directory, filename)
 
 @app.route('/css/<path:filename>')
 def css_files(filename):
-    return send_from_directory('css', filename)
+    return send_asset('css', filename)
 
 @app.route('/js/<path:filename>')
 def js_files(filename):
-    return send_from_directory('js', filename)
+    return send_asset('js', filename)
 
 @app.route('/assets/<path:filename>')
 def asset_files(filename):
-    return send_from_directory('assets', filename)
+    return send_asset('assets', filename)
 
 @app.route('/images/<path:filename>')
 def image_files(filename):
-    return send_from_directory('images', filename)
+    return send_asset('images', filename)
 
 # Favicon route
 @app.route('/favicon.ico')
 def favicon():
-    from flask import send_file
-    import os
+    hashed = assets.hashed_path('images/Logo.png')
+    if hashed:
+        return send_built(hashed)
     favicon_path = os.path.join('images', 'Logo.png')
     return send_file(favicon_path)
 
@@ -0,0 +1,95 @@
+import os
+import subprocess
+import sys
+
+# Checks that importing the app stays fast and touches no network:
+# it is imported in a fresh interpreter with MongoDB pointed at an address
+# that never answers, so any connection attempt at import would blow the budget.
+#
+#   python test_import_time.py
+#   IMPORT_TIME_BUDGET_MS=800 python test_import_time.py
+#   python -m pytest test_import_time.py
+
+BUDGET_MS = float(os.getenv("IMPORT_TIME_BUDGET_MS", "1500"))
+RUNS = int(os.getenv("IMPORT_TIME_RUNS", "3"))
+
+# Must load on first use, not with the app
+DEFERRED_MODULES = ["smtplib", "email.mime.text", "agents", "openai", "tavily"]
+
+PROBE = """
+import sys, time
+started = time.perf_counter()
+import server
+elapsed_ms = (time.perf_counter() - started) * 1000
+loaded = [name for name in sys.argv[1:] if name in sys.modules]
+print(f"{elapsed_ms:.1f} {','.join(loaded)}")
+"""
+
+project_root = os.path.dirname(os.path.abspath(__file__))
+
+
+def measure_import():
+    """
+    Imports server.py RUNS times in fresh interpreters. Returns the timings in
+    ms and the DEFERRED_MODULES that got loaded.
+    """
+    env = dict(
+        os.environ,
+        # Non-routable address: a connect would hang until a timeout
+        MONGODB_URI="mongodb://10.255.255.1:27017/",
+        MONGO_SERVER_SELECTION_TIMEOUT_MS="5000",
+    )
+    timings = []
+    loaded = []
+    for run in range(RUNS):
+        result = subprocess.run(
+            [sys.executable, "-c", PROBE] + DEFERRED_MODULES,
+            cwd=project_root, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            universal_newlines=True, timeout=60
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"Importing server.py failed:\n{result.stderr}")
+        elapsed, _, modules = result.stdout.strip().splitlines()[-1].partition(" ")
+        timings.append(float(elapsed))
+        loaded = [name for name in modules.split(",") if name]
+    return timings, loaded
+
+
+def test_import_time():
+    timings, loaded = measure_import()
+    # The first run also pays for writing .pyc files, the best run is the steady state
+    best = min(timings)
+    assert best <= BUDGET_MS, (
+        f"Importing server.py took {best:.1f} ms, over the budget of {BUDGET_MS:.0f} ms. "
+        "Profile it with: python bench/startup_profile.py"
+    )
+    assert not loaded, f"Imported at startup instead of on first use: {loaded}"
+
+
+def main():
+    try:
+        timings, loaded = measure_import()
+    except RuntimeError as e:
+        print(f"[ERROR] {e}")
+        exit(1)
+    for run, elapsed in enumerate(timings):
+        print(f"[INFO] Run {run + 1}: import took {elapsed:.1f} ms")
+
+    # The first run also pays for writing .pyc files, the best run is the steady state
+    best = min(timings)
+    failed = False
+    if best > BUDGET_MS:
+        print(f"[ERROR] Importing server.py took {best:.1f} ms, over the budget of {BUDGET_MS:.0f} ms")
+        print("Profile it with: python bench/startup_profile.py")
+        failed = True
+    if loaded:
+        print(f"[ERROR] Imported at startup instead of on first use: {loaded}")
+        failed = True
+
+    if failed:
+        exit(1)
+    print(f"[SUCCESS] Importing server.py took {best:.1f} ms (budget {BUDGET_MS:.0f} ms)")
+
+
+if __name__ == "__main__":
+    main()